@@ -1,105 +1,579 @@
-from flask import Flask, render_template, request, jsonify, send_file, after_this_request
+from flask import Flask, render_template, request, jsonify, after_this_request, Response
 import os
-import threading
-from terabox_downloader_advanced import TeraBoxDownloaderAdvanced
+from terabox_downloader_advanced import TeraBoxDownloaderAdvanced, extract_share_code, partial_path
+from download_scheduler import DownloadScheduler, AsyncDownloadScheduler, JobCancelled
+import connection_manager
+from resolution_cache import ResolutionCache, JSONFileBackend
+from transfer_registry import TransferRegistry
+from method_stats import MethodStats
+from file_server import FileServer, content_disposition
+from job_store import MemoryJobStore, SQLiteJobStore
+from download_cache import DownloadCache
+from content_store import ContentStore
+from batch_download import read_shares
+from metrics import Metrics, DISABLED
+from werkzeug.wsgi import ClosingIterator
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import uuid
 import time
+import json
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['DOWNLOAD_FOLDER'] = 'downloads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['DOWNLOAD_SEGMENTS'] = 4
+app.config['MIN_SEGMENT_SIZE'] = 8 * 1024 * 1024
+app.config['DOWNLOAD_RETRIES'] = 3
+app.config['MAX_LINK_REFRESHES'] = 3
+app.config['MAX_CONCURRENT_DOWNLOADS'] = 4
+app.config['PER_HOST_DOWNLOADS'] = 2
+# Download engine: 'threads' runs each job on a worker thread with requests,
+# 'asyncio' runs every job as a task on one event loop with aiohttp
+app.config['DOWNLOAD_ENGINE'] = 'threads'
+# asyncio engine: jobs, share resolutions and body transfers in flight at once,
+# and open connections across all hosts (raise PER_HOST_DOWNLOADS to match)
+app.config['ASYNC_MAX_CONCURRENT_DOWNLOADS'] = 1000
+app.config['ASYNC_MAX_RESOLUTIONS'] = 256
+app.config['ASYNC_MAX_TRANSFERS'] = 1024
+app.config['ASYNC_MAX_CONNECTIONS'] = 1000
+# Shared HTTP pools: hosts kept pooled, idle keep-alive connections per host,
+# per-host overrides ({'https://d.terabox.com': {'pool_maxsize': 16}}) and DNS cache TTL
+app.config['HTTP_POOL_CONNECTIONS'] = 10
+app.config['HTTP_POOL_MAXSIZE'] = app.config['MAX_CONCURRENT_DOWNLOADS'] * app.config['DOWNLOAD_SEGMENTS']
+app.config['HTTP_HOST_POOLS'] = {}
+app.config['DNS_CACHE_TTL'] = 300
+# Resolved shares: max entries, TTL cap for dlinks without an expiry, optional on-disk directory
+app.config['RESOLUTION_CACHE_SIZE'] = 256
+app.config['RESOLUTION_CACHE_TTL'] = 3600
+app.config['RESOLUTION_CACHE_DIR'] = None
+# Race extraction methods under one deadline; politeness spacing between TeraBox requests
+app.config['HEDGED_EXTRACTION'] = True
+app.config['EXTRACTION_DEADLINE'] = 30
+app.config['EXTRACTION_REQUEST_DELAY'] = 0.5
+# Per-domain extraction method statistics; share of attempts that explore a non-leading method
+app.config['METHOD_STATS_PATH'] = 'method_stats.json'
+app.config['METHOD_EXPLORATION'] = 0.1
+# Scan share pages while streaming them instead of reading them whole
+app.config['STREAM_PAGE_FETCH'] = True
+# /stream: how long to wait for a queued job's transfer to start, how often to
+# check the partial file for new bytes, and the read size per response chunk
+app.config['STREAM_START_TIMEOUT'] = 120
+app.config['STREAM_POLL_INTERVAL'] = 0.1
+app.config['STREAM_CHUNK_SIZE'] = 256 * 1024
+# /download-file: read size when Python sends the file, and optionally leave sending
+# to a front proxy: None, 'X-Sendfile' or 'X-Accel-Redirect' (with the nginx
+# internal location that maps onto DOWNLOAD_FOLDER)
+app.config['FILE_BLOCK_SIZE'] = 256 * 1024
+app.config['SENDFILE_HEADER'] = None
+app.config['X_ACCEL_PREFIX'] = '/protected/'
+# Job status store: SQLite database path (None keeps statuses in this process only),
+# seconds finished jobs stay queryable, and how often batched progress is written
+app.config['JOB_STORE_PATH'] = 'jobs.sqlite3'
+app.config['JOB_TTL'] = 24 * 3600
+app.config['JOB_PROGRESS_FLUSH_INTERVAL'] = 1.0
+# Progress: seconds between downloader reports; /events: how often a stream checks the
+# job for changes, and the keep-alive comment interval for idle proxies
+app.config['PROGRESS_INTERVAL'] = 0.5
+app.config['EVENTS_POLL_INTERVAL'] = 0.5
+app.config['EVENTS_KEEPALIVE'] = 15
+# /events streams end after this many seconds and EventSource reconnects after
+# EVENTS_RETRY milliseconds, so a tab watching a long download does not hold a
+# sync worker for all of it
+app.config['EVENTS_MAX_DURATION'] = 60
+app.config['EVENTS_RETRY'] = 1000
+# Download folder as an LRU cache: byte quota (None for none), and free disk space
+# below which idle files are evicted (low watermark) until the target is free again
+app.config['DOWNLOAD_CACHE_QUOTA'] = 20 * 1024 * 1024 * 1024
+app.config['DISK_MIN_FREE'] = 1024 * 1024 * 1024
+app.config['DISK_TARGET_FREE'] = 2 * 1024 * 1024 * 1024
+# Check finished files against the md5 in share metadata, when it has one
+app.config['VERIFY_MD5'] = True
+# Most share links accepted by one /batch request
+app.config['BATCH_MAX_SHARES'] = 1000
+# Prometheus metrics on /metrics; when off, the instrumentation hooks do nothing
+app.config['METRICS_ENABLED'] = True
 
 # Ensure download directory exists
 os.makedirs(app.config['DOWNLOAD_FOLDER'], exist_ok=True)
 
-# Store download status
-download_status = {}
+# Job status records, shared by every worker process when backed by SQLite
+if app.config['JOB_STORE_PATH']:
+    job_store = SQLiteJobStore(
+        app.config['JOB_STORE_PATH'],
+        ttl=app.config['JOB_TTL'],
+        flush_interval=app.config['JOB_PROGRESS_FLUSH_INTERVAL']
+    )
+else:
+    job_store = MemoryJobStore(ttl=app.config['JOB_TTL'])
+
+# Jobs an earlier run left queued or running have no worker behind them any more
+interrupted_jobs = job_store.recover()
+if interrupted_jobs:
+    print(f"⚠️ Marked {interrupted_jobs} jobs of stopped workers as interrupted")
+
+# Jobs currently on a worker, so /stream can follow their partial files
+running_jobs = {}
+
+# Keep-alive pools shared by every job's downloader
+connection_manager.configure(
+    pool_connections=app.config['HTTP_POOL_CONNECTIONS'],
+    pool_maxsize=app.config['HTTP_POOL_MAXSIZE'],
+    host_pools=app.config['HTTP_HOST_POOLS'],
+    dns_cache_ttl=app.config['DNS_CACHE_TTL']
+)
+
+# Share resolutions reused across jobs that submit the same link
+resolution_cache = ResolutionCache(
+    max_entries=app.config['RESOLUTION_CACHE_SIZE'],
+    default_ttl=app.config['RESOLUTION_CACHE_TTL'],
+    backend=JSONFileBackend(app.config['RESOLUTION_CACHE_DIR']) if app.config['RESOLUTION_CACHE_DIR'] else None
+)
+
+# Learned ordering of extraction methods, shared by all jobs
+method_stats = MethodStats(
+    path=app.config['METHOD_STATS_PATH'],
+    exploration=app.config['METHOD_EXPLORATION']
+)
+
+# Duplicate submissions attach to the transfer already running for the same file
+transfer_registry = TransferRegistry()
+
+# Finished files are stored once per content hash; job records map names onto them
+content_store = ContentStore(app.config['DOWNLOAD_FOLDER'])
+
+# Completed files are evicted least recently downloaded first; files being
+# written or streamed are pinned
+download_cache = DownloadCache(
+    app.config['DOWNLOAD_FOLDER'],
+    quota_bytes=app.config['DOWNLOAD_CACHE_QUOTA'],
+    min_free_bytes=app.config['DISK_MIN_FREE'],
+    target_free_bytes=app.config['DISK_TARGET_FREE'],
+    on_evict=transfer_registry.forget_file
+)
+
+# Range-aware responses for finished files
+file_server = FileServer(
+    block_size=app.config['FILE_BLOCK_SIZE'],
+    sendfile_header=app.config['SENDFILE_HEADER'],
+    accel_prefix=app.config['X_ACCEL_PREFIX'],
+    root=app.config['DOWNLOAD_FOLDER']
+)
 
-class DownloadThread(threading.Thread):
-    def __init__(self, download_id, terabox_url):
-        threading.Thread.__init__(self)
+if app.config['DOWNLOAD_ENGINE'] == 'asyncio':
+    from terabox_downloader_async import AsyncEngine
+    
+    # One event loop runs every job; its semaphores bound what is in flight
+    async_engine = AsyncEngine(
+        max_connections=app.config['ASYNC_MAX_CONNECTIONS'],
+        dns_cache_ttl=app.config['DNS_CACHE_TTL'],
+        max_resolutions=app.config['ASYNC_MAX_RESOLUTIONS'],
+        max_transfers=app.config['ASYNC_MAX_TRANSFERS']
+    )
+    scheduler = AsyncDownloadScheduler(
+        async_engine,
+        max_concurrent=app.config['ASYNC_MAX_CONCURRENT_DOWNLOADS'],
+        per_host_limit=app.config['PER_HOST_DOWNLOADS']
+    )
+    # Job store writes of async jobs: SQLite may wait on its lock, which must not
+    # stall the loop; one thread keeps each job's writes in order
+    job_store_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-store-writer')
+else:
+    async_engine = None
+    # Bounded worker pool shared by all submissions
+    scheduler = DownloadScheduler(
+        max_workers=app.config['MAX_CONCURRENT_DOWNLOADS'],
+        per_host_limit=app.config['PER_HOST_DOWNLOADS']
+    )
+
+# Stage timings, throughput and HTTP statuses of every job, plus gauges read at scrape time
+metrics = Metrics() if app.config['METRICS_ENABLED'] else DISABLED
+metrics.gauge('terabox_queue_depth', 'Jobs waiting for a worker', scheduler.queue_depth)
+metrics.gauge('terabox_active_jobs', 'Jobs running on a worker', scheduler.active_count)
+metrics.gauge(
+    'terabox_active_transfers',
+    'Jobs whose file transfer is running',
+    lambda: sum(1 for job in list(running_jobs.values()) if job.downloader and job.downloader.transfer_state == 'running')
+)
+metrics.gauge('terabox_download_folder_bytes', 'Bytes on disk in the download folder', download_cache.disk_usage)
+
+class DownloadJob:
+    def __init__(self, download_id, terabox_url, file_info=None, priority=0):
         self.download_id = download_id
         self.terabox_url = terabox_url
-        self.downloader = TeraBoxDownloaderAdvanced()
+        # Set for one file of a folder share, already listed by its parent job
+        self.file_info = file_info
+        self.priority = priority
+        self.downloader = None
+        # File record of the completed job, handed to the transfer registry
+        self.record = None
         
-    def run(self):
+    def __call__(self, cancel_event):
+        running_jobs[self.download_id] = self
         try:
-            download_status[self.download_id] = {
-                'status': 'processing',
-                'message': '🔍 Analyzing TeraBox link...',
-                'filename': None,
-                'filepath': None
-            }
+            if cancel_event.is_set():
+                return
+            
+            # Created on a worker so queued jobs hold no session
+            self.downloader = TeraBoxDownloaderAdvanced(**self.downloader_options())
+            
+            if not self.file_info:
+                self.report_analyzing()
+                
+                # Folder and multi-file shares fan out into one job per file
+                if self.expand(self.downloader.list_files(self.terabox_url)):
+                    return
             
             # Extract file information using advanced methods
-            file_info = self.downloader.extract_file_info(self.terabox_url)
-            if not file_info['success']:
-                download_status[self.download_id] = {
-                    'status': 'error',
-                    'message': file_info['error']
-                }
+            file_info = self.file_info or self.downloader.extract_file_info(self.terabox_url)
+            if not self.check_file_info(file_info):
                 return
             
-            download_status[self.download_id] = {
-                'status': 'processing',
-                'message': '🔄 Getting download URL...',
-                'filename': file_info['filename']
-            }
-            
-            # Get download URL
+            # Get download URL; a listed file has its own, and resolving the
+            # share again would find a different file of it
             download_url = file_info.get('download_url')
-            if not download_url:
-                download_url = self.downloader.get_download_url(
-                    file_info['final_url'], 
-                    file_info.get('content')
-                )
+            if not download_url and not self.file_info:
+                download_url = self.downloader.get_download_url(file_info['final_url'])
             
-            if not download_url:
-                download_status[self.download_id] = {
-                    'status': 'error',
-                    'message': '❌ Could not extract download URL. This usually means:\n• The link is password protected\n• The link has expired\n• It requires a premium account\n• TeraBox has updated their protection'
-                }
+            filepath = self.claim_transfer(download_url, file_info)
+            if not filepath:
                 return
             
-            download_status[self.download_id] = {
-                'status': 'downloading',
-                'message': '⬇️ Starting download...',
-                'filename': file_info['filename']
-            }
-            
-            # Download the file
-            result = self.downloader.download_file(
-                download_url, 
-                file_info['filename'], 
-                app.config['DOWNLOAD_FOLDER']
-            )
+            # Download the file, holding one of the download host's transfer slots;
+            # the downloader reserves disk space once it knows the size
+            try:
+                with scheduler.host_slot(download_url, cancel_event), download_cache.pinned(filepath):
+                    result = self.downloader.download_file(
+                        download_url, 
+                        file_info['filename'], 
+                        app.config['DOWNLOAD_FOLDER'],
+                        **self.download_options(file_info, cancel_event)
+                    )
+            finally:
+                download_cache.release(filepath)
             
-            if result['success']:
-                size_mb = result['file_size'] / (1024 * 1024)
-                download_status[self.download_id] = {
-                    'status': 'completed',
-                    'message': f'✅ Download completed! Size: {size_mb:.2f} MB',
-                    'filename': file_info['filename'],
-                    'filepath': result['filepath'],
-                    'file_size': result['file_size']
-                }
-            else:
-                download_status[self.download_id] = {
-                    'status': 'error',
-                    'message': f'❌ Download failed: {result["error"]}'
-                }
+            self.record = self.finish(result, file_info, cancel_event)
                 
         except Exception as e:
-            download_status[self.download_id] = {
+            self.fail(e)
+        finally:
+            running_jobs.pop(self.download_id, None)
+            transfer_registry.finish(self.download_id, self.record)
+    
+    def downloader_options(self):
+        """Constructor arguments shared by both download engines"""
+        return dict(
+            metrics=metrics,
+            segments=app.config['DOWNLOAD_SEGMENTS'],
+            min_segment_size=app.config['MIN_SEGMENT_SIZE'],
+            retries=app.config['DOWNLOAD_RETRIES'],
+            max_link_refreshes=app.config['MAX_LINK_REFRESHES'],
+            resolution_cache=resolution_cache,
+            hedged=app.config['HEDGED_EXTRACTION'],
+            extraction_deadline=app.config['EXTRACTION_DEADLINE'],
+            request_delay=app.config['EXTRACTION_REQUEST_DELAY'],
+            method_stats=method_stats,
+            stream_pages=app.config['STREAM_PAGE_FETCH'],
+            progress_callback=self.report_progress,
+            progress_interval=app.config['PROGRESS_INTERVAL'],
+            space_check=download_cache.reserve,
+            content_store=content_store
+        )
+    
+    def download_options(self, file_info, cancel_event):
+        """Keyword arguments for download_file"""
+        return dict(
+            share_url=self.terabox_url,
+            cancel_event=cancel_event,
+            expected_md5=file_info.get('md5') if app.config['VERIFY_MD5'] else None,
+            share_path=file_info.get('path')
+        )
+    
+    def report_analyzing(self):
+        self.set_status({
+            'status': 'processing',
+            'message': '🔍 Analyzing TeraBox link...',
+            'filename': None,
+            'filepath': None
+        })
+    
+    def expand(self, listing):
+        """Queue one child job per file of a multi-file listing; True if it did.
+        
+        A listing of a single file with a link is used as this job's file info.
+        """
+        if not listing['success']:
+            return False
+        files = listing['files']
+        if len(files) == 1:
+            if files[0]['download_url']:
+                self.file_info = files[0]
+            return False
+        
+        # The share's keys stay claimed until every child has finished
+        children = [str(uuid.uuid4()) for _ in files]
+        transfer_registry.expand(self.download_id, children)
+        for child_id, file_info in zip(children, files):
+            job_store.set(child_id, {
+                'status': 'queued',
+                'message': '⏳ Waiting in queue...',
+                'filename': file_info['filename']
+            })
+            scheduler.submit(
+                child_id,
+                self.__class__(child_id, self.terabox_url, file_info=file_info, priority=self.priority),
+                priority=self.priority
+            )
+        
+        self.set_status({
+            'status': 'processing',
+            'message': f'📂 {len(files)} files in this share',
+            'url': self.terabox_url,
+            'children': children
+        })
+        return True
+    
+    def check_file_info(self, file_info):
+        """Record the extraction outcome; False if the job cannot go on"""
+        if not file_info['success']:
+            self.set_status({
+                'status': 'error',
+                'message': file_info['error']
+            })
+            return False
+        
+        self.set_status({
+            'status': 'processing',
+            'message': '🔄 Getting download URL...',
+            'filename': file_info['filename']
+        })
+        return True
+    
+    def claim_transfer(self, download_url, file_info):
+        """Become the transfer for this file; returns its partial file's path, or None if there is nothing to download"""
+        if not download_url:
+            self.set_status({
                 'status': 'error',
-                'message': f'💥 Unexpected error: {str(e)}'
+                'message': '❌ Could not extract download URL. This usually means:\n• The link is password protected\n• The link has expired\n• It requires a premium account\n• TeraBox has updated their protection'
+            })
+            return None
+        
+        # Different share links can resolve to the same file on the download host
+        parsed = urlparse(download_url)
+        file_key = f"file:{parsed.netloc}{parsed.path}:{file_info.get('size', '')}"
+        outcome, detail = transfer_registry.merge(file_key, self.download_id)
+        if outcome == 'completed':
+            # Already on disk through another share link or an earlier job
+            self.record = detail
+            self.set_status(completed_status(detail))
+            return None
+        if outcome == 'attached':
+            self.set_status({'attached_to': detail})
+            return None
+        
+        self.set_status({
+            'status': 'downloading',
+            'message': '⬇️ Starting download...',
+            'filename': file_info['filename']
+        })
+        # The path download_file writes to, pinned against eviction while it runs
+        return partial_path(app.config['DOWNLOAD_FOLDER'], self.terabox_url, file_info.get('path'))
+    
+    def finish(self, result, file_info, cancel_event):
+        """Record the download's outcome; returns the file record of a completed job"""
+        if cancel_event.is_set():
+            self.set_status({
+                'status': 'cancelled',
+                'message': '🚫 Download cancelled'
+            })
+        elif result['success']:
+            record = {
+                'filename': file_info['filename'],
+                # Already moved into the content store by the downloader
+                'filepath': result['filepath'],
+                'file_size': result['file_size'],
+                'sha256': result['sha256']
             }
+            self.set_status(completed_status(record))
+            return record
+        else:
+            self.set_status({
+                'status': 'error',
+                'message': f'❌ Download failed: {result["error"]}'
+            })
+        return None
+    
+    def fail(self, error):
+        if isinstance(error, JobCancelled):
+            self.set_status({
+                'status': 'cancelled',
+                'message': '🚫 Download cancelled'
+            })
+        else:
+            self.set_status({
+                'status': 'error',
+                'message': f'💥 Unexpected error: {str(error)}'
+            })
+    
+    def set_status(self, record):
+        """Replace the job's status record, keeping the mark of a submitter who cancelled while others follow"""
+        if transfer_registry.is_abandoned(self.download_id):
+            record = dict(record, detached=True)
+        job_store.set(self.download_id, record)
+    
+    def report_progress(self, progress):
+        """Publish the downloader's progress on the job's status record"""
+        if progress['total_size']:
+            percent = progress['downloaded'] / progress['total_size'] * 100
+            message = f'⬇️ Downloading... {percent:.1f}%'
+        else:
+            message = f'⬇️ Downloading... {progress["downloaded"] / (1024 * 1024):.1f} MB'
+        job_store.update(self.download_id, message=message, **progress)
+
+class AsyncDownloadJob(DownloadJob):
+    """DownloadJob as a coroutine, for the asyncio engine"""
+    
+    async def __call__(self, cancel_event):
+        running_jobs[self.download_id] = self
+        try:
+            if cancel_event.is_set():
+                return
+            
+            self.downloader = async_engine.downloader(**self.downloader_options())
+            try:
+                if not self.file_info:
+                    await self.write(self.report_analyzing)
+                    
+                    if await self.write(self.expand, await self.downloader.list_files(self.terabox_url)):
+                        return
+                
+                file_info = self.file_info or await self.downloader.extract_file_info(self.terabox_url)
+                if not await self.write(self.check_file_info, file_info):
+                    return
+                
+                download_url = file_info.get('download_url')
+                if not download_url and not self.file_info:
+                    download_url = await self.downloader.get_download_url(file_info['final_url'])
+                
+                filepath = await self.write(self.claim_transfer, download_url, file_info)
+                if not filepath:
+                    return
+                
+                try:
+                    async with scheduler.host_slot(download_url, cancel_event):
+                        with download_cache.pinned(filepath):
+                            result = await self.downloader.download_file(
+                                download_url,
+                                file_info['filename'],
+                                app.config['DOWNLOAD_FOLDER'],
+                                **self.download_options(file_info, cancel_event)
+                            )
+                finally:
+                    download_cache.release(filepath)
+                
+                self.record = await self.write(self.finish, result, file_info, cancel_event)
+            finally:
+                await self.downloader.close()
+                
+        except Exception as e:
+            await self.write(self.fail, e)
+        finally:
+            running_jobs.pop(self.download_id, None)
+            transfer_registry.finish(self.download_id, self.record)
+    
+    async def write(self, method, *args):
+        """Run a method that writes to the job store on the writer thread"""
+        return await asyncio.wrap_future(job_store_writer.submit(method, *args))
+    
+    def report_progress(self, progress):
+        # Called on the loop; queued behind this job's earlier writes, not awaited
+        job_store_writer.submit(super().report_progress, progress)
+
+def completed_status(record):
+    """Status record of a job whose file is on disk"""
+    size_mb = record['file_size'] / (1024 * 1024)
+    return dict(record, status='completed', message=f'✅ Download completed! Size: {size_mb:.2f} MB')
+
+def job_status(download_id):
+    """Status of a job, following attached jobs to the transfer they share"""
+    return job_statuses([download_id])[download_id]
+
+def job_statuses(download_ids):
+    """job_status of many jobs, reading each level of attachments in one job store query"""
+    records = job_store.get_many(download_ids)
+    # Whose record is reported for each job: its own, or its leader's
+    targets = {download_id: download_id for download_id in download_ids}
+    for _ in range(8):
+        leaders = {
+            download_id: records[target]['attached_to']
+            for download_id, target in targets.items()
+            if records.get(target, {}).get('attached_to')
+        }
+        if not leaders:
+            break
+        records.update(job_store.get_many(set(leaders.values()) - records.keys()))
+        targets.update(leaders)
+    
+    statuses = {}
+    for download_id, target in targets.items():
+        if records.get(download_id, {}).get('detached'):
+            # Cancelled by its submitter; the transfer goes on for the jobs attached to it
+            statuses[download_id] = {'status': 'cancelled', 'message': '🚫 Download cancelled'}
+            continue
+        status = dict(records.get(target, {}))
+        status.pop('detached', None)
+        if target != download_id:
+            status['attached_to'] = target
+        statuses[download_id] = status
+    return statuses
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def submit_share(terabox_url, priority=0):
+    """Queue a share link (or join its transfer); returns its download id and a message"""
+    # Generate unique download ID
+    download_id = str(uuid.uuid4())
+    
+    share_code = extract_share_code(terabox_url)
+    outcome, detail = transfer_registry.claim(f'share:{share_code or terabox_url}', download_id)
+    
+    if outcome == 'completed' and 'files' in detail:
+        # Every file of a folder share is already on disk from an earlier job
+        children = []
+        for record in detail['files']:
+            child_id = str(uuid.uuid4())
+            job_store.set(child_id, completed_status(record))
+            children.append(child_id)
+        job_store.set(download_id, {
+            'status': 'processing',
+            'message': f'📂 {len(children)} files in this share',
+            'url': terabox_url,
+            'children': children
+        })
+        return download_id, 'Files already downloaded!'
+    
+    if outcome == 'completed':
+        # Already on disk from an earlier job
+        job_store.set(download_id, completed_status(detail))
+        return download_id, 'File already downloaded!'
+    
+    if outcome == 'attached':
+        job_store.set(download_id, {'attached_to': detail})
+        return download_id, 'Joined a download already in progress!'
+    
+    # Queue the download on the shared worker pool
+    job_store.set(download_id, {
+        'status': 'queued',
+        'message': '⏳ Waiting in queue...'
+    })
+    job_class = AsyncDownloadJob if async_engine else DownloadJob
+    scheduler.submit(download_id, job_class(download_id, terabox_url, priority=priority), priority=priority)
+    return download_id, 'Download queued successfully!'
+
 @app.route('/download', methods=['POST'])
 def download():
     try:
@@ -112,29 +586,299 @@ def download():
         if not terabox_url.startswith(('http://', 'https://')):
             return jsonify({'error': 'Please enter a valid HTTP/HTTPS URL'}), 400
         
-        # Generate unique download ID
-        download_id = str(uuid.uuid4())
+        try:
+            priority = int(data.get('priority', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Priority must be an integer'}), 400
         
-        # Start download in background thread
-        download_thread = DownloadThread(download_id, terabox_url)
-        download_thread.start()
+        download_id, message = submit_share(terabox_url, priority)
+        response = {
+            'download_id': download_id,
+            'message': message
+        }
+        position = scheduler.position(download_id)
+        if position:
+            response['queue_position'] = position
+        return jsonify(response)
         
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/batch', methods=['POST'])
+def batch_download():
+    """Queue many share links at once: JSON {"urls": [...]} or a JSONL body, one share per line.
+    
+    /status/<batch_id> and /events/<batch_id> then report every file of every share.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and isinstance(data.get('urls'), list):
+            lines = [json.dumps(url) for url in data['urls']]
+        else:
+            lines = request.get_data(as_text=True).splitlines()
+        
+        try:
+            shares = read_shares(lines)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if not shares:
+            return jsonify({'error': 'Please provide at least one TeraBox URL'}), 400
+        if len(shares) > app.config['BATCH_MAX_SHARES']:
+            return jsonify({'error': f'At most {app.config["BATCH_MAX_SHARES"]} links per batch'}), 400
+        
+        jobs = []
+        for share in shares:
+            download_id, message = submit_share(share['url'], share['priority'])
+            jobs.append({'id': share['id'], 'url': share['url'], 'download_id': download_id, 'message': message})
+        
+        batch_id = str(uuid.uuid4())
+        job_store.set(batch_id, {
+            'status': 'processing',
+            'message': f'📦 {len(jobs)} links queued',
+            'children': [job['download_id'] for job in jobs],
+            'urls': {job['download_id']: job['url'] for job in jobs}
+        })
         return jsonify({
-            'download_id': download_id,
-            'message': 'Download started successfully!'
+            'batch_id': batch_id,
+            'jobs': jobs,
+            'message': f'{len(jobs)} links queued successfully!'
         })
         
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+def group_payload(status, positions=None):
+    """Roll the files of a folder share or batch up into one status with per-file results"""
+    # One sort of the queue and one job store query cover all the children
+    if positions is None:
+        positions = scheduler.positions()
+    statuses = job_statuses(status['children'])
+    files = []
+    for child_id in status['children']:
+        child = status_payload(child_id, statuses[child_id], positions)
+        url = status.get('urls', {}).get(child_id, status.get('url'))
+        if child.get('files'):
+            # A folder share inside a batch
+            files.extend(dict(entry, url=entry.get('url') or url) for entry in child['files'])
+            continue
+        files.append({
+            'download_id': child_id,
+            'url': url,
+            'filename': child.get('filename'),
+            'status': child.get('status'),
+            'message': child.get('message'),
+            'file_size': child.get('file_size'),
+            'sha256': child.get('sha256')
+        })
+    
+    total = len(files)
+    completed = sum(1 for entry in files if entry['status'] == 'completed')
+    active = sum(1 for entry in files if entry['status'] in ('queued', 'processing', 'downloading'))
+    if active:
+        state, message = 'downloading', f'⬇️ {total - active} of {total} files finished'
+    elif completed == total:
+        state, message = 'completed', f'✅ All {total} files downloaded'
+    elif completed:
+        state, message = 'completed', f'⚠️ {completed} of {total} files downloaded, {total - completed} failed'
+    else:
+        state, message = 'error', f'❌ None of the {total} files could be downloaded'
+    
+    return {
+        'status': state,
+        'message': message,
+        'file_count': total,
+        'completed_count': completed,
+        'file_size': sum(entry['file_size'] or 0 for entry in files),
+        'files': files
+    }
+
+def status_payload(download_id, status=None, positions=None):
+    """Status as reported to clients, with the queue position of queued jobs.
+    
+    Groups pass in each child's status and their snapshot of queue positions.
+    """
+    status = dict(job_status(download_id) if status is None else status)
+    if status.get('children'):
+        return group_payload(status, positions)
+    if status.get('status') == 'queued':
+        job_id = status.get('attached_to', download_id)
+        position = scheduler.position(job_id) if positions is None else positions.get(job_id)
+        if position:
+            status['queue_position'] = position
+            status['message'] = f'⏳ Waiting in queue (position {position})...'
+    return status
+
 @app.route('/status/<download_id>')
 def get_status(download_id):
-    status = download_status.get(download_id, {})
-    return jsonify(status)
+    return jsonify(status_payload(download_id))
+
+@app.route('/events/<download_id>')
+def status_events(download_id):
+    """Server-Sent Events stream of a job's status, sent whenever it changes.
+    
+    Each stream lasts at most EVENTS_MAX_DURATION seconds; the browser then
+    reconnects and gets the current status first.
+    """
+    def generate():
+        last = None
+        started = last_sent = time.monotonic()
+        yield f'retry: {app.config["EVENTS_RETRY"]}\n\n'
+        while True:
+            status = status_payload(download_id)
+            if status != last:
+                last = status
+                last_sent = time.monotonic()
+                yield f'data: {json.dumps(status)}\n\n'
+                if not status or status.get('status') in ('completed', 'error', 'cancelled'):
+                    return
+            elif time.monotonic() - last_sent >= app.config['EVENTS_KEEPALIVE']:
+                last_sent = time.monotonic()
+                yield ': keep-alive\n\n'
+            if time.monotonic() - started >= app.config['EVENTS_MAX_DURATION']:
+                return
+            # The job store is shared between workers, so the stream checks it
+            # instead of waiting on an in-process signal from the job
+            time.sleep(app.config['EVENTS_POLL_INTERVAL'])
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/download/<download_id>', methods=['DELETE'])
+def cancel_download(download_id):
+    if not cancel_job(download_id):
+        return jsonify({'error': 'Download not found or already finished'}), 404
+    return jsonify({'message': 'Download cancelled'})
+
+def cancel_job(download_id):
+    """Cancel a job, or every file of a folder share or batch; False if nothing was left to cancel.
+    
+    A transfer shared by several submissions keeps running until all of them
+    are cancelled; until then only the cancelling id reports it as cancelled.
+    """
+    record = job_store.get(download_id)
+    if record.get('detached'):
+        return False
+    
+    if record.get('attached_to'):
+        # Detach this id only; the shared transfer keeps running for the others
+        job_store.set(download_id, {
+            'status': 'cancelled',
+            'message': '🚫 Download cancelled'
+        })
+        leader_id = transfer_registry.unsubscribe(download_id)
+        if leader_id:
+            # The last one still waiting on a transfer its leader abandoned
+            cancel_transfer(leader_id)
+        return True
+    
+    if record.get('status') in ('queued', 'processing', 'downloading') and not transfer_registry.unsubscribe(download_id):
+        # Followers still want the file: keep the transfer, mark only this id
+        job_store.update(download_id, detached=True)
+        return True
+    return cancel_transfer(download_id)
+
+def cancel_transfer(download_id):
+    """Stop a job (or every file of a group) for all its subscribers; False if nothing was left to cancel"""
+    record = job_store.get(download_id)
+    if record.get('children'):
+        return any([cancel_job(child_id) for child_id in record['children']])
+    
+    state = scheduler.cancel(download_id)
+    if not state:
+        return False
+    
+    # Running jobs record their own final state once the transfer stops;
+    # queued ones never run, so their claims are released here
+    if state == 'queued':
+        job_store.set(download_id, {
+            'status': 'cancelled',
+            'message': '🚫 Download cancelled'
+        })
+        transfer_registry.finish(download_id)
+    return True
+
+@app.route('/stats/extraction')
+def extraction_stats():
+    return jsonify(method_stats.snapshot())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def observe_serving(response, name, started):
+    """Record the time and bytes of sending response once the server is done with it.
+    
+    Bodies wrapped here count the bytes actually sent, so clients that leave
+    early are not counted in full; a wsgi.file_wrapper is left alone for
+    zero-copy sends and counts as its Content-Length.
+    """
+    if not metrics.enabled:
+        return response
+    
+    # HEAD and 304 responses are sent without a body
+    bodiless = request.method == 'HEAD' or response.status_code == 304
+    # Bytes yielded so far, once the body is wrapped to count them
+    sent = [None]
+    
+    def counted(body):
+        sent[0] = 0
+        
+        def generate():
+            try:
+                for chunk in body:
+                    sent[0] += len(chunk)
+                    yield chunk
+            finally:
+                close = getattr(body, 'close', None)
+                if close:
+                    close()
+        
+        return generate()
+    
+    def record():
+        elapsed = time.perf_counter() - started
+        metrics.observe('serve', name, elapsed, 'success' if response.status_code < 400 else 'failure')
+        if bodiless:
+            size = 0
+        elif sent[0] is not None:
+            size = sent[0]
+        else:
+            size = response.content_length or 0
+        metrics.transferred('serve', size, elapsed)
+    
+    if not response.direct_passthrough:
+        if not response.is_sequence:
+            response.response = counted(response.response)
+        response.call_on_close(record)
+        return response
+    
+    # Passed-through bodies go to the server as they are, so call_on_close never
+    # runs; a wsgi.file_wrapper must also stay unwrapped for zero-copy sends
+    body = response.response
+    close = body.close
+    
+    def close_and_record():
+        try:
+            close()
+        finally:
+            record()
+    
+    try:
+        body.close = close_and_record
+    except AttributeError:
+        # Generators take no attributes, and gain nothing from staying unwrapped
+        response.response = ClosingIterator(counted(body), record)
+    return response
 
 @app.route('/download-file/<download_id>')
 def download_file(download_id):
-    status = download_status.get(download_id, {})
+    status = job_status(download_id)
     
     if status.get('status') != 'completed':
         return jsonify({'error': 'File not ready for download'}), 400
@@ -145,24 +889,125 @@ def download_file(download_id):
     if not filepath or not os.path.exists(filepath):
         return jsonify({'error': 'File not found'}), 404
     
-    return send_file(
-        filepath,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/octet-stream'
+    download_cache.touch(filepath)
+    
+    # Range requests let clients resume and players seek without resending the file
+    started = time.perf_counter()
+    response = file_server.serve(request.environ, filepath, filename or os.path.basename(filepath))
+    return observe_serving(response, 'download-file', started)
+
+def wait_for_transfer(download_id):
+    """Downloader of download_id once its partial file exists, or None if the job ends first"""
+    deadline = time.monotonic() + app.config['STREAM_START_TIMEOUT']
+    while time.monotonic() < deadline:
+        status = job_status(download_id)
+        if status.get('children'):
+            # Folder shares and batches have no single file to follow
+            return None
+        leader_id = status.get('attached_to', download_id)
+        job = running_jobs.get(leader_id)
+        downloader = job.downloader if job else None
+        if downloader and downloader.transfer_filepath:
+            return downloader
+        if status.get('status') not in ('queued', 'processing', 'downloading'):
+            return None
+        time.sleep(app.config['STREAM_POLL_INTERVAL'])
+    return None
+
+def follow_transfer(downloader, file):
+    """Yield the partial file's bytes as they land, up to the contiguous prefix"""
+    chunk_size = app.config['STREAM_CHUNK_SIZE']
+    poll_interval = app.config['STREAM_POLL_INTERVAL']
+    position = 0
+    
+    with download_cache.pinned(downloader.transfer_filepath), file:
+        while True:
+            available = downloader.available_bytes()
+            if available > position:
+                chunk = file.read(min(available - position, chunk_size))
+                if not chunk:
+                    return
+                position += len(chunk)
+                yield chunk
+                continue
+            
+            # A failed transfer ends the response short of Content-Length,
+            # so the browser reports the download as interrupted
+            if downloader.transfer_state != 'running':
+                return
+            time.sleep(poll_interval)
+
+@app.route('/stream/<download_id>')
+def stream_file(download_id):
+    """Send the file while the server-side download is still running"""
+    if job_status(download_id).get('status') == 'completed':
+        return download_file(download_id)
+    
+    downloader = wait_for_transfer(download_id)
+    if downloader is None:
+        # Finished (or failed) while we were waiting for it to start
+        return download_file(download_id)
+    
+    # Each reader has its own handle, so any number can follow one transfer. The
+    # handle stays valid when the finished file moves into the content store.
+    try:
+        file = open(downloader.transfer_filepath, 'rb')
+    except OSError:
+        # Moved into the content store between the checks above
+        return download_file(download_id)
+    
+    filename = job_status(download_id).get('filename') or os.path.basename(downloader.transfer_filepath)
+    headers = {
+        'Content-Disposition': content_disposition(filename),
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'
+    }
+    if downloader.transfer_total:
+        headers['Content-Length'] = str(downloader.transfer_total)
+    
+    response = Response(
+        follow_transfer(downloader, file),
+        mimetype='application/octet-stream',
+        headers=headers,
+        direct_passthrough=True
     )
+    return observe_serving(response, 'stream', time.perf_counter())
 
 @app.route('/cleanup', methods=['POST'])
 def cleanup():
+    """Remove a finished download: its job record, and its file once no other job refers to it.
+    
+    Finished files are content-addressed objects shared by every job with the
+    same content, so the file itself only goes with its last reference.
+    """
     try:
-        data = request.get_json()
-        filepath = data.get('filepath')
+        data = request.get_json(silent=True) or {}
+        download_id = data.get('download_id')
+        if not download_id:
+            return jsonify({'error': 'Please provide a download_id'}), 400
         
-        if filepath and os.path.exists(filepath):
-            os.remove(filepath)
-            return jsonify({'message': 'File cleaned up successfully'})
+        status = job_status(download_id)
+        filepath = status.get('filepath')
+        if status.get('status') != 'completed' or not filepath:
+            return jsonify({'error': 'File not found'}), 404
         
-        return jsonify({'error': 'File not found'}), 404
+        download_folder = os.path.realpath(app.config['DOWNLOAD_FOLDER'])
+        if os.path.commonpath([download_folder, os.path.realpath(filepath)]) != download_folder:
+            return jsonify({'error': 'File is outside the download folder'}), 400
+        
+        # Jobs attached to this one read its record; give them their own copy first
+        for follower_id in job_store.find('attached_to', download_id):
+            job_store.set(follower_id, status)
+        job_store.delete(download_id)
+        
+        others = job_store.find('filepath', filepath)
+        if others:
+            return jsonify({'message': f'Download removed; the file is kept for {len(others)} other downloads'})
+        
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        transfer_registry.forget_file(filepath)
+        return jsonify({'message': 'File cleaned up successfully'})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
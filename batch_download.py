@@ -0,0 +1,194 @@
+"""Download every file of many TeraBox shares, headless.
+
+Reads share links as JSONL, one JSON object per line with the link in "url"
+(or anywhere in its string values, as in a requests.jsonl backlog) and an
+optional "id"; bare URLs and JSON strings work too. All shares are resolved
+concurrently on one event loop and their files downloaded through the shared
+job, per-host, resolution and transfer limits; one report of per-file results
+is printed at the end.
+
+    python batch_download.py shares.jsonl [-o downloads] [--jobs 64] [--per-host 4] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+
+URL_PATTERN = re.compile(r'https?://[^\s"\'<>]+')
+
+
+def read_shares(lines):
+    """[{'url', 'id', 'priority'}] for every line naming a share link; blank lines are skipped.
+
+    Raises ValueError naming the first line without a link.
+    """
+    shares = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = line
+
+        if isinstance(item, dict):
+            url = item.get('url')
+            if not isinstance(url, str):
+                # Backlog-style lines carry the link inside a free-text field
+                found = (URL_PATTERN.search(value) for value in item.values() if isinstance(value, str))
+                url = next((match.group(0) for match in found if match), None)
+            share_id = item.get('id', item.get('request_id'))
+            priority = item.get('priority', 0)
+        else:
+            url, share_id, priority = item, None, 0
+
+        if not isinstance(url, str) or not url.strip().startswith(('http://', 'https://')):
+            raise ValueError(f'Line {number}: no HTTP/HTTPS share link')
+        shares.append({'url': url.strip(), 'id': share_id, 'priority': int(priority or 0)})
+    return shares
+
+
+class BatchRun:
+    """Resolves a list of shares and downloads all their files on an AsyncEngine"""
+
+    def __init__(self, engine, scheduler, download_folder, downloader_options=None):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.download_folder = download_folder
+        self.downloader_options = downloader_options or {}
+        self.results = []
+
+    async def run(self, shares):
+        """Per-file result dicts, in share order"""
+        files = await asyncio.gather(*(self._resolve(share) for share in shares))
+        # Queued through the scheduler, so every transfer respects its limits
+        pending = []
+        for share, share_files in zip(shares, files):
+            for file_info in share_files:
+                index = len(self.results)
+                self.results.append(None)
+                if not file_info.get('download_url'):
+                    error = file_info.get('error', 'No download link for this file')
+                    self.results[index] = self._result(share, file_info, error=error)
+                    continue
+                done = asyncio.get_running_loop().create_future()
+                job_id = f'{share["id"] or share["url"]}#{index}'
+                job = self._download_job(share, file_info, index, done)
+                self.scheduler.submit(job_id, job, priority=share['priority'])
+                pending.append(done)
+        await asyncio.gather(*pending)
+        return self.results
+
+    async def _resolve(self, share):
+        """File infos of a share: its listing, or the single file extraction finds"""
+        async with self.engine.downloader(**self.downloader_options) as downloader:
+            listing = await downloader.list_files(share['url'])
+            if listing['success'] and (len(listing['files']) > 1 or listing['files'][0]['download_url']):
+                return listing['files']
+            file_info = await downloader.extract_file_info(share['url'])
+            if not file_info['success']:
+                file_info['filename'] = None
+            return [file_info]
+
+    def _download_job(self, share, file_info, index, done):
+        async def job(cancel_event):
+            try:
+                async with self.engine.downloader(**self.downloader_options) as downloader:
+                    async with self.scheduler.host_slot(file_info['download_url'], cancel_event):
+                        result = await downloader.download_file(
+                            file_info['download_url'],
+                            file_info['filename'],
+                            self.download_folder,
+                            share_url=share['url'],
+                            cancel_event=cancel_event,
+                            expected_md5=file_info.get('md5'),
+                            share_path=file_info.get('path')
+                        )
+                self.results[index] = self._result(share, file_info, result=result)
+            except Exception as e:
+                self.results[index] = self._result(share, file_info, error=str(e))
+            finally:
+                done.set_result(None)
+        return job
+
+    def _result(self, share, file_info, result=None, error=None):
+        result = result or {'success': False, 'error': error}
+        return {
+            'id': share['id'],
+            'url': share['url'],
+            'filename': file_info.get('filename'),
+            'path': file_info.get('path'),
+            'status': 'completed' if result['success'] else 'error',
+            'filepath': result.get('filepath'),
+            'file_size': result.get('file_size'),
+            'sha256': result.get('sha256'),
+            'error': result.get('error'),
+        }
+
+
+def print_report(results):
+    completed = [result for result in results if result['status'] == 'completed']
+    for result in results:
+        if result['status'] == 'completed':
+            size_mb = result['file_size'] / (1024 * 1024)
+            print(f"✅ {result['filename']}  {size_mb:.2f} MB  sha256 {result['sha256'][:12]}")
+        else:
+            print(f"❌ {result['filename'] or result['url']}: {result['error']}")
+    total_mb = sum(result['file_size'] for result in completed) / (1024 * 1024)
+    print(f"\n📊 {len(completed)} of {len(results)} files downloaded ({total_mb:.2f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help="JSONL file of share links, or '-' for stdin")
+    parser.add_argument('-o', '--output', default='downloads', help='download folder')
+    parser.add_argument('--jobs', type=int, default=64, help='files downloading at once')
+    parser.add_argument('--per-host', type=int, default=4, help='files downloading at once per host')
+    parser.add_argument('--resolutions', type=int, default=32, help='shares resolving at once')
+    parser.add_argument('--segments', type=int, default=4, help='connections per file')
+    parser.add_argument('--request-delay', type=float, default=0.5,
+                        help="seconds between one share's requests to TeraBox")
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    # Imported here so --help works without aiohttp installed
+    from terabox_downloader_async import AsyncEngine
+    from download_scheduler import AsyncDownloadScheduler
+
+    if args.input == '-':
+        shares = read_shares(sys.stdin)
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            shares = read_shares(f)
+    os.makedirs(args.output, exist_ok=True)
+
+    engine = AsyncEngine(max_resolutions=args.resolutions, max_transfers=args.jobs * args.segments)
+    scheduler = AsyncDownloadScheduler(engine, max_concurrent=args.jobs, per_host_limit=args.per_host)
+    batch = BatchRun(engine, scheduler, args.output, {
+        'segments': args.segments,
+        'hedged': True,
+        'request_delay': args.request_delay,
+    })
+
+    stdout = sys.stdout
+    if args.json:
+        # Progress output would corrupt the JSON report
+        sys.stdout = sys.stderr
+    try:
+        results = engine.run(batch.run(shares)).result()
+    finally:
+        sys.stdout = stdout
+        engine.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+    sys.exit(0 if all(result['status'] == 'completed' for result in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Measure CPU seconds spent per GB downloaded by TeraBoxDownloaderAdvanced.download_file.
+
+A range-capable server runs in a separate process, so only the client's CPU
+(every thread of this process) is counted. Progress output goes to /dev/null
+but is still formatted and written, as it would be in production.
+
+    python benchmarks/bench_chunk_io.py [--size-mb 512] [--segments 1 4] [--repeat 3]
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from terabox_downloader_advanced import TeraBoxDownloaderAdvanced
+
+
+BLOCK = os.urandom(1024 * 1024)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    size = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start, end = 0, self.size - 1
+        byte_range = self.headers.get('Range', '')
+        if byte_range.startswith('bytes='):
+            first, _, last = byte_range[6:].partition('-')
+            start, end = int(first), min(int(last), end) if last else end
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Range', f'bytes {start}-{end}/{self.size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        # Body generated from one repeated block so the server stays small
+        position = start
+        while position <= end:
+            offset = position % len(BLOCK)
+            piece = BLOCK[offset:offset + min(len(BLOCK) - offset, end - position + 1)]
+            self.wfile.write(piece)
+            position += len(piece)
+
+
+def serve(size, port_queue):
+    RangeHandler.size = size
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def measure(url, segments, folder):
+    downloader = TeraBoxDownloaderAdvanced(segments=segments, min_segment_size=1024 * 1024)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        result = downloader.download_file(url, 'bench.bin', folder)
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+    assert result['success'], result
+    os.remove(result['filepath'])
+    return cpu, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=512)
+    parser.add_argument('--segments', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(size, port_queue), daemon=True)
+    server.start()
+    url = f'http://127.0.0.1:{port_queue.get()}/file.bin'
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for segments in args.segments:
+            # Best of several runs: the least disturbed by other load on the machine
+            runs = [measure(url, segments, folder) for _ in range(args.repeat)]
+            cpu, wall = min(runs)
+            gigabytes = size / (1024 ** 3)
+            results.append({
+                'segments': segments,
+                'cpu_s_per_gb': round(cpu / gigabytes, 3),
+                'mb_per_s': round(args.size_mb / wall, 1),
+            })
+    server.terminate()
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{args.size_mb} MiB over loopback, best of {args.repeat}")
+    for result in results:
+        print(f"  {result['segments']} segment(s): {result['cpu_s_per_gb']:.3f} CPU s/GB, "
+              f"{result['mb_per_s']:.0f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
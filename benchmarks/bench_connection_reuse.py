@@ -0,0 +1,89 @@
+"""Count TCP connections (and therefore TLS handshakes on HTTPS) opened per download job.
+
+Compares the old behaviour, where every TeraBoxDownloaderAdvanced built its own
+HTTPAdapter, with downloaders borrowing the process-wide ConnectionManager.
+
+    python benchmarks/bench_connection_reuse.py [--jobs 20] [--size 65536]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection_manager import ConnectionManager
+from terabox_downloader_advanced import TeraBoxDownloaderAdvanced
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    payload = b''
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        with CountingHandler.lock:
+            CountingHandler.connections += 1
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start, end = 0, len(self.payload) - 1
+        byte_range = self.headers.get('Range', '')
+        if byte_range.startswith('bytes='):
+            first, _, last = byte_range[6:].partition('-')
+            start, end = int(first), int(last) if last else end
+        body = self.payload[start:end + 1]
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(self.payload)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run_jobs(url, jobs, folder, shared_manager):
+    before = CountingHandler.connections
+    for index in range(jobs):
+        # Per-job pools reproduce the old one-adapter-per-downloader setup
+        manager = shared_manager or ConnectionManager()
+        downloader = TeraBoxDownloaderAdvanced(connection_manager=manager)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = downloader.download_file(url, f'job_{index}.bin', folder)
+        assert result['success'], result
+        if not shared_manager:
+            manager.close()
+    return CountingHandler.connections - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--size', type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    CountingHandler.payload = os.urandom(args.size)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/file.bin'
+
+    with tempfile.TemporaryDirectory() as folder:
+        per_job = run_jobs(url, args.jobs, folder, None)
+        shared = run_jobs(url, args.jobs, folder, ConnectionManager())
+
+    server.shutdown()
+    print(f"jobs: {args.jobs}")
+    print(f"per-job pools : {per_job} connections ({per_job / args.jobs:.2f} per job)")
+    print(f"shared pools  : {shared} connections ({shared / args.jobs:.2f} per job)")
+    print(f"handshakes saved per job: {(per_job - shared) / args.jobs:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Peak RSS per resolution job, before and after streaming page fetches.
+
+Serves a page from debug_pages/ (with a dlink injected after the <head>) from a
+local server and resolves it from many concurrent jobs, keeping every job's
+file_info alive as the app does. "before" reproduces the old method: read the
+whole response.text and carry it in file_info['content']. "after" uses
+TeraBoxDownloaderAdvanced with streaming page fetches. Each mode runs in its
+own process so ru_maxrss is not shared.
+
+    python benchmarks/bench_page_memory.py [--jobs 50]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests
+
+from terabox_downloader_advanced import TeraBoxDownloaderAdvanced
+
+
+def load_page():
+    pages = sorted(glob.glob(os.path.join(ROOT, 'debug_pages', '*.html')))
+    if not pages:
+        sys.exit('No pages found in debug_pages/')
+    with open(pages[0], 'r', encoding='utf-8', errors='replace') as f:
+        page = f.read()
+    link = '<script>var info = {"dlink": "https://d.terabox.com/file/abc?fid=1&expires=8h"};</script>'
+    return page.replace('</head>', link + '</head>', 1).encode('utf-8')
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    page = b''
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(self.page)))
+        self.end_headers()
+        try:
+            self.wfile.write(self.page)
+        except (BrokenPipeError, ConnectionResetError):
+            # Streaming clients hang up once they have found the link
+            pass
+
+
+def resolve_before(url):
+    """The pre-streaming extraction: whole page in memory and kept in file_info"""
+    response = requests.get(url, timeout=30)
+    match = re.search(r'"dlink"\s*:\s*"([^"]+)"', response.text)
+    return {
+        'success': bool(match),
+        'filename': 'file.mp4',
+        'final_url': response.url,
+        'content': response.text,
+        'download_url': match.group(1) if match else None
+    }
+
+
+def resolve_after(url):
+    downloader = TeraBoxDownloaderAdvanced(request_delay=0)
+    return downloader._method_direct_analysis(url)
+
+
+def run_mode(mode, jobs):
+    PageHandler.page = load_page()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/s/1benchmark'
+
+    resolve = resolve_before if mode == 'before' else resolve_after
+    # Warm up imports and pools so the baseline excludes one-off allocations
+    with contextlib.redirect_stdout(io.StringIO()):
+        resolve(url)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(lambda _: resolve(url), range(jobs)))
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    server.shutdown()
+    assert all(result['success'] for result in results)
+    # ru_maxrss is in KiB on Linux
+    print(json.dumps({'mode': mode, 'jobs': jobs, 'peak_kib_per_job': (peak - baseline) / jobs,
+                      'page_kib': len(PageHandler.page) / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=50)
+    parser.add_argument('--mode', choices=('before', 'after'))
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.jobs)
+        return
+
+    for mode in ('before', 'after'):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--mode', mode, '--jobs', str(args.jobs)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<7} page {result['page_kib']:.0f} KiB, {result['jobs']} jobs: "
+              f"{result['peak_kib_per_job']:.0f} KiB peak RSS per job")
+
+
+if __name__ == '__main__':
+    main()
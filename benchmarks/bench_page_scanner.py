@@ -0,0 +1,101 @@
+"""Compare the old per-pattern regex scanning with the single-pass PageScanner.
+
+Runs both over every page in debug_pages/, plus copies of each page with a
+window.yunData blob injected at the end, so the JSON path is measured too. The
+second blob has a ';' inside a string, which the old {[^;]+}; pattern cannot
+match.
+
+    python benchmarks/bench_page_scanner.py [--repeat 20]
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from page_scanner import scanner, find_url_in_json
+
+
+def old_scan(text):
+    """The pre-scanner extraction: one findall per pattern plus the filename regexes"""
+    patterns = [
+        r'window\.yunData\s*=\s*({[^;]+});',
+        r'window\.data\s*=\s*({[^;]+});',
+        r'"dlink"\s*:\s*"([^"]+)"',
+        r'"downloadUrl"\s*:\s*"([^"]+)"',
+        r'<meta property="og:video" content="([^"]+)"',
+        r'<video[^>]+src="([^"]+)"',
+    ]
+    download_url = None
+    for pattern in patterns:
+        for match in re.findall(pattern, text, re.DOTALL):
+            if match.startswith('{'):
+                try:
+                    download_url = find_url_in_json(json.loads(match))
+                except ValueError:
+                    continue
+            elif match.startswith('http'):
+                download_url = match
+            if download_url:
+                break
+        if download_url:
+            break
+
+    filename = None
+    for pattern in [r'<title>([^<]+)</title>', r'"server_filename":"([^"]+)"', r'"filename":"([^"]+)"']:
+        match = re.search(pattern, text)
+        if match:
+            filename = match.group(1).strip()
+            break
+    return download_url, filename
+
+
+def new_scan(text):
+    _, download_url, _ = scanner.find_link(text, scanner.DIRECT_PATTERNS)
+    return download_url, scanner.find_filename(text)
+
+
+def measure(function, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(text)
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    blob = ('<script>window.yunData = {"shareid": 1, "file_list": [{"server_filename": "Day 1.mp4", '
+            '"dlink": "https://d.terabox.com/file/abc?fid=1&expires=8h"}]};</script>')
+
+    blob_with_semicolon = blob.replace('Day 1.mp4', 'Day 1; part 2.mp4')
+
+    pages = sorted(glob.glob(os.path.join(ROOT, 'debug_pages', '*.html')))
+    if not pages:
+        sys.exit('No pages found in debug_pages/')
+
+    print(f"{'page':<40} {'KiB':>7} {'old ms':>9} {'new ms':>9} {'speedup':>8}  same")
+    for path in pages:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        variants = (
+            (os.path.basename(path), text),
+            ('  + yunData blob', text + blob),
+            ("  + yunData blob with ';'", text + blob_with_semicolon),
+        )
+        for label, page in variants:
+            old_ms, old_result = measure(old_scan, page, args.repeat)
+            new_ms, new_result = measure(new_scan, page, args.repeat)
+            print(f"{label:<40} {len(page) / 1024:>7.0f} {old_ms:>9.2f} {new_ms:>9.2f} "
+                  f"{old_ms / new_ms:>7.1f}x  {old_result == new_result}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""Local stand-in for TeraBox: share pages, share APIs and a range-capable file host.
+
+Share pages are debug_pages/ captures with a window.yunData blob (links and
+file list) injected before </body>. /api/shorturlinfo and /share/list answer
+in TeraBox's JSON shapes, and dlinks point at /file/, which serves
+deterministic content with Range support. Network conditions are set per
+server (or at runtime with POST /_control):
+
+    latency, jitter   seconds added before every response
+    throttle          bytes per second per file connection (0 for unlimited)
+    link_ttl          seconds a minted dlink stays valid; later requests get 403
+    drop_rate         share of file responses cut off midway with the socket closed
+    seed              seed of the jitter and drop draws, so runs drop the same responses
+
+GET /_stats returns request, expiry and drop counters.
+
+    python benchmarks/fake_terabox.py [--port 8000] [--latency 0.05] [--throttle 0] ...
+"""
+import argparse
+import glob
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BLOCK_SIZE = 1024 * 1024
+SECRET = b'fake-terabox'
+
+DEFAULT_CONDITIONS = {
+    'latency': 0.0,
+    'jitter': 0.0,
+    'throttle': 0,
+    'link_ttl': 0,
+    'drop_rate': 0.0,
+    'seed': 0,
+}
+
+
+class FakeFile:
+    """A file of size bytes: one pseudo-random 1 MiB block (seeded by fs_id) repeated"""
+
+    def __init__(self, fs_id, path, size):
+        self.fs_id = fs_id
+        self.path = path
+        self.size = size
+        self.block = random.Random(fs_id).randbytes(min(size, BLOCK_SIZE)) or b'\0'
+        self._md5 = None
+
+    @property
+    def name(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    def read(self, start, length):
+        """Bytes [start, start + length), at most up to the end of the current block"""
+        offset = start % len(self.block)
+        return self.block[offset:offset + min(length, len(self.block) - offset)]
+
+    def md5(self):
+        """md5 of the whole file, as share metadata carries it; computed once"""
+        if self._md5 is None:
+            md5 = hashlib.md5()
+            position = 0
+            while position < self.size:
+                piece = self.read(position, self.size - position)
+                md5.update(piece)
+                position += len(piece)
+            self._md5 = md5.hexdigest()
+        return self._md5
+
+
+class FakeTeraBox:
+    """Shares by code, each a list of FakeFiles; folders are implied by the paths"""
+
+    def __init__(self, conditions=None):
+        self.conditions = dict(DEFAULT_CONDITIONS, **(conditions or {}))
+        self.shares = {}
+        self.stats = {'page': 0, 'api': 0, 'list': 0, 'file': 0, 'expired': 0, 'dropped': 0, 'bytes_sent': 0}
+        self.lock = threading.Lock()
+        self.reseed()
+        self.base_url = None
+        self._next_fs_id = 1
+        self.page = self._load_page()
+
+    def add_share(self, code, files):
+        """Register share code with files given as (path, size) pairs"""
+        share = []
+        for path, size in files:
+            share.append(FakeFile(self._next_fs_id, '/' + path.lstrip('/'), size))
+            self._next_fs_id += 1
+        self.shares[code] = share
+        return share
+
+    def share_url(self, code):
+        return f'{self.base_url}/s/{code}'
+
+    def reseed(self):
+        self.random = random.Random(self.conditions['seed'])
+
+    def draw(self):
+        """Next value in [0, 1) of the seeded generator shared by all request threads"""
+        with self.lock:
+            return self.random.random()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def _load_page(self):
+        pages = sorted(glob.glob(os.path.join(ROOT, 'debug_pages', '*.html')))
+        if not pages:
+            return '<html><head><title>Share - TeraBox</title></head><body></body></html>'
+        with open(pages[0], 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+
+    def dlink(self, code, file):
+        """Signed link to the file, valid for link_ttl seconds from now"""
+        ttl = self.conditions['link_ttl']
+        expires = int((time.time() + ttl) * 1000) if ttl else 0
+        return f'{self.base_url}/file/{code}/{file.fs_id}?expires={expires}&sign={self._sign(code, file.fs_id, expires)}'
+
+    def _sign(self, code, fs_id, expires):
+        return hmac.new(SECRET, f'{code}/{fs_id}/{expires}'.encode(), hashlib.sha256).hexdigest()[:16]
+
+    def link_valid(self, code, fs_id, query):
+        expires = query.get('expires', ['0'])[0]
+        sign = query.get('sign', [''])[0]
+        if not expires.isdigit() or not hmac.compare_digest(sign, self._sign(code, fs_id, int(expires))):
+            return False
+        return int(expires) == 0 or int(expires) / 1000 > time.time()
+
+    def entries(self, code, directory):
+        """share/list entries directly inside directory ('/' for the root)"""
+        prefix = directory.rstrip('/') + '/'
+        entries = {}
+        for file in self.shares.get(code, []):
+            if not file.path.startswith(prefix):
+                continue
+            name, _, rest = file.path[len(prefix):].partition('/')
+            if rest:
+                path = prefix + name
+                entries.setdefault(path, {'server_filename': name, 'isdir': 1, 'path': path, 'fs_id': zlib.crc32(path.encode())})
+            else:
+                entries[file.path] = {
+                    'server_filename': file.name,
+                    'isdir': 0,
+                    'path': file.path,
+                    'fs_id': file.fs_id,
+                    'size': file.size,
+                    'md5': file.md5(),
+                    'dlink': self.dlink(code, file),
+                }
+        return list(entries.values())
+
+    def share_page(self, code):
+        files = self.shares.get(code, [])
+        if not files:
+            return self.page.encode('utf-8')
+        data = {
+            'shareid': 1,
+            'file_list': [
+                {'server_filename': file.name, 'size': file.size, 'md5': file.md5(), 'dlink': self.dlink(code, file)}
+                for file in files
+            ],
+        }
+        page = re.sub(r'<title>[^<]*</title>', f'<title>{files[0].name} - Share Files Online &amp; Send Large Files with TeraBox</title>',
+                      self.page, count=1)
+        blob = f'<script>window.yunData = {json.dumps(data)};</script>'
+        if '</body>' in page:
+            page = page.replace('</body>', blob + '</body>', 1)
+        else:
+            page += blob
+        return page.encode('utf-8')
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        conditions = self.fake.conditions
+        if conditions['latency'] or conditions['jitter']:
+            time.sleep(conditions['latency'] + self.fake.draw() * conditions['jitter'])
+
+        try:
+            if url.path.startswith('/s/'):
+                self.fake.count('page')
+                self._send(200, self.fake.share_page(url.path[3:]), 'text/html; charset=utf-8')
+            elif url.path == '/api/shorturlinfo':
+                self.fake.count('api')
+                code = query.get('shorturl', [''])[0]
+                self._send_json({'errno': 0, 'shareid': 1, 'list': self.fake.entries(code, '/')}
+                                if code in self.fake.shares else {'errno': 2, 'list': []})
+            elif url.path == '/share/list':
+                self.fake.count('list')
+                self._share_list(query)
+            elif url.path.startswith('/file/'):
+                self.fake.count('file')
+                self._file(url.path, query)
+            elif url.path == '/_stats':
+                with self.fake.lock:
+                    self._send_json(dict(self.fake.stats))
+            else:
+                self._send(404, b'Not found', 'text/plain')
+        except (BrokenPipeError, ConnectionResetError):
+            # Streaming page scans hang up once they have what they need
+            self.close_connection = True
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/_control':
+            self._send(404, b'Not found', 'text/plain')
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        update = json.loads(self.rfile.read(length) or b'{}')
+        self.fake.conditions.update({key: value for key, value in update.items() if key in DEFAULT_CONDITIONS})
+        if 'seed' in update:
+            self.fake.reseed()
+        if update.get('reset_stats'):
+            with self.fake.lock:
+                self.fake.stats = dict.fromkeys(self.fake.stats, 0)
+        self._send_json(self.fake.conditions)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data):
+        self._send(200, json.dumps(data).encode(), 'application/json')
+
+    def _share_list(self, query):
+        code = query.get('shorturl', [''])[0]
+        if code not in self.fake.shares:
+            self._send_json({'errno': 2, 'list': []})
+            return
+        directory = '/' if query.get('root') else query.get('dir', ['/'])[0]
+        page = int(query.get('page', ['1'])[0])
+        num = int(query.get('num', ['100'])[0])
+        entries = self.fake.entries(code, directory)
+        self._send_json({'errno': 0, 'list': entries[(page - 1) * num:page * num]})
+
+    def _file(self, path, query):
+        _, _, code, fs_id = path.split('/', 3)
+        file = next((f for f in self.fake.shares.get(code, []) if str(f.fs_id) == fs_id), None)
+        if file is None:
+            self._send(404, b'Not found', 'text/plain')
+            return
+        if not self.fake.link_valid(code, file.fs_id, query):
+            self.fake.count('expired')
+            self._send(403, b'Link expired', 'text/plain')
+            return
+
+        start, end = 0, file.size - 1
+        byte_range = self.headers.get('Range', '')
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', byte_range.strip())
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            else:
+                start = max(file.size - int(match.group(2)), 0)
+            if start > end:
+                self._send(416, b'', 'text/plain', {'Content-Range': f'bytes */{file.size}'})
+                return
+        length = end - start + 1
+
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{file.fs_id}-{file.size}"')
+        if match:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{file.size}')
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+        # Probes (one byte) are never dropped, so every transfer gets started
+        conditions = self.fake.conditions
+        cut_at = length
+        if length > 1 and self.fake.draw() < conditions['drop_rate']:
+            cut_at = int(self.fake.draw() * length)
+        throttle = conditions['throttle']
+        started = time.monotonic()
+        sent = 0
+        while sent < cut_at:
+            piece = file.read(start + sent, min(cut_at - sent, 64 * 1024 if throttle else BLOCK_SIZE))
+            self.wfile.write(piece)
+            sent += len(piece)
+            if throttle:
+                ahead = sent / throttle - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        self.fake.count('bytes_sent', sent)
+
+        if cut_at < length:
+            self.fake.count('dropped')
+            self.close_connection = True
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+
+
+def default_shares(fake, file_size):
+    """The catalogue the benchmark suite uses"""
+    fake.add_share('1single', [('Day 1.mp4', file_size)])
+    fake.add_share('1folder', [
+        ('Intro.mp4', file_size),
+        ('Season 1/Episode 1.mp4', file_size),
+        ('Season 1/Episode 2.mp4', file_size),
+        ('Season 1/Extras/Trailer.mp4', file_size),
+    ])
+
+
+def serve(fake, host='127.0.0.1', port=0, ready=None):
+    """Run fake until the process ends; ready (a queue) receives its base URL"""
+    # Checksums up front, so the first listing is not slower than the rest
+    for share in fake.shares.values():
+        for file in share:
+            file.md5()
+    handler = type('Handler', (FakeHandler,), {'fake': fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    fake.base_url = f'http://{host}:{server.server_port}'
+    if ready is not None:
+        ready.put(fake.base_url)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--size-mb', type=int, default=64, help='size of every file in the catalogue')
+    for name, value in DEFAULT_CONDITIONS.items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=type(value), default=value)
+    args = parser.parse_args()
+
+    fake = FakeTeraBox({name: getattr(args, name) for name in DEFAULT_CONDITIONS})
+    default_shares(fake, args.size_mb * 1024 * 1024)
+    print(f"Serving on http://127.0.0.1:{args.port}: /s/1single and /s/1folder")
+    print(f"Point downloaders at it with TeraBoxDownloaderAdvanced.api_hosts = "
+          f"('http://127.0.0.1:{args.port}',) * 2")
+    serve(fake, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
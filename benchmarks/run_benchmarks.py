@@ -0,0 +1,350 @@
+"""Offline benchmark suite against a local TeraBox stand-in (benchmarks/fake_terabox.py).
+
+Every scenario gets a fresh FakeTeraBox process with its own network
+conditions, and runs in a fresh process of its own, so CPU time is the
+client's alone and peak RSS is the scenario's. Results are written as JSON for
+regression tracking; --baseline prints the change against an earlier run.
+
+    resolution            extract_file_info and list_files latency (p50/p95)
+    single_job            one segmented download: MB/s, CPU s/GB, peak RSS
+    many_jobs             concurrent resolve+download jobs: aggregate MB/s, CPU s/GB
+    throttled             per-connection throttling, 1 segment against 4
+    expiring_links        short-lived dlinks and drops: refreshes and retries
+    dropped_connections   a share of responses cut off midway
+    flask                 /download, /status and /download-file through the app
+
+    python benchmarks/run_benchmarks.py [--quick] [--output bench_results.json]
+                                        [--baseline old.json] [--scenario NAME ...]
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_terabox import FakeTeraBox, serve
+
+MIB = 1024 * 1024
+
+PARAMS = {
+    'full': {'file_mb': 256, 'job_mb': 64, 'jobs': 8, 'runs': 30},
+    'quick': {'file_mb': 32, 'job_mb': 8, 'jobs': 4, 'runs': 10},
+}
+
+SCENARIOS = {}
+
+
+def scenario(name, conditions=None, shares=None):
+    """Register a scenario run with the given server conditions and catalogue.
+
+    shares(params) returns {code: [(path, size)]}; the scenario function gets
+    the server's base URL and the params, and returns a dict of metrics.
+    """
+    def register(function):
+        SCENARIOS[name] = (function, conditions or {}, shares)
+        return function
+    return register
+
+
+def job_shares(params):
+    return {f'1job{index:03d}': [(f'job {index}.bin', params['job_mb'] * MIB)] for index in range(params['jobs'])}
+
+
+def single_share(params):
+    return {'1single': [('Day 1.mp4', params['file_mb'] * MIB)]}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def server_stats(base_url):
+    import requests
+    return requests.get(f'{base_url}/_stats', timeout=10).json()
+
+
+def downloader(base_url, **options):
+    from terabox_downloader_advanced import TeraBoxDownloaderAdvanced
+    TeraBoxDownloaderAdvanced.api_hosts = (base_url, base_url)
+    options.setdefault('hedged', True)
+    options.setdefault('request_delay', 0)
+    return TeraBoxDownloaderAdvanced(**options)
+
+
+def resolve_and_download(base_url, code, folder, **options):
+    """The job pipeline without the app: resolve a share and download its file"""
+    client = downloader(base_url, **options)
+    file_info = client.extract_file_info(f'{base_url}/s/{code}')
+    assert file_info['success'], file_info
+    result = client.download_file(
+        file_info['download_url'],
+        file_info['filename'],
+        folder,
+        share_url=f'{base_url}/s/{code}',
+        expected_md5=file_info.get('md5')
+    )
+    assert result['success'], result
+    os.remove(result['filepath'])
+    return result['file_size']
+
+
+def timed(function):
+    """(result, wall seconds, CPU seconds of the whole process)"""
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def throughput(size, wall, cpu):
+    return {
+        'mb_per_s': round(size / MIB / wall, 1),
+        'cpu_s_per_gb': round(cpu / (size / 1024 ** 3), 3),
+    }
+
+
+@scenario('resolution', {'latency': 0.02, 'jitter': 0.01}, lambda params: {
+    '1single': [('Day 1.mp4', MIB)],
+    '1folder': [('Intro.mp4', MIB), ('Season 1/Episode 1.mp4', MIB), ('Season 1/Extras/Trailer.mp4', MIB)],
+})
+def resolution(base_url, params):
+    extract, listing = [], []
+    for _ in range(params['runs']):
+        client = downloader(base_url)
+        _, wall, _ = timed(lambda: client.extract_file_info(f'{base_url}/s/1single'))
+        extract.append(wall * 1000)
+        _, wall, _ = timed(lambda: client.list_files(f'{base_url}/s/1folder'))
+        listing.append(wall * 1000)
+    return {
+        'extract_ms_p50': round(statistics.median(extract), 1),
+        'extract_ms_p95': round(percentile(extract, 0.95), 1),
+        'list_folder_ms_p50': round(statistics.median(listing), 1),
+        'list_folder_ms_p95': round(percentile(listing, 0.95), 1),
+    }
+
+
+@scenario('single_job', shares=single_share)
+def single_job(base_url, params):
+    with tempfile.TemporaryDirectory() as folder:
+        size, wall, cpu = timed(lambda: resolve_and_download(base_url, '1single', folder))
+    return throughput(size, wall, cpu)
+
+
+@scenario('many_jobs', shares=job_shares)
+def many_jobs(base_url, params):
+    with tempfile.TemporaryDirectory() as folder:
+        def job(index):
+            return resolve_and_download(base_url, f'1job{index:03d}', folder)
+
+        def run_all():
+            with ThreadPoolExecutor(max_workers=params['jobs']) as pool:
+                return sum(pool.map(job, range(params['jobs'])))
+        size, wall, cpu = timed(run_all)
+    return dict(throughput(size, wall, cpu), jobs=params['jobs'])
+
+
+@scenario('throttled', {'throttle': 8 * MIB}, shares=single_share)
+def throttled(base_url, params):
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for segments in (1, 4):
+            size, wall, cpu = timed(lambda: resolve_and_download(
+                base_url, '1single', folder, segments=segments, min_segment_size=MIB))
+            results[f'mb_per_s_{segments}_segments'] = round(size / MIB / wall, 1)
+    return results
+
+
+@scenario('expiring_links', {'link_ttl': 0.5, 'drop_rate': 0.3, 'throttle': 4 * MIB}, shares=single_share)
+def expiring_links(base_url, params):
+    with tempfile.TemporaryDirectory() as folder:
+        size, wall, cpu = timed(lambda: resolve_and_download(
+            base_url, '1single', folder, retries=50, max_link_refreshes=50))
+    stats = server_stats(base_url)
+    return dict(throughput(size, wall, cpu), expired_requests=stats['expired'],
+                dropped=stats['dropped'], resolutions=stats['page'] + stats['api'])
+
+
+@scenario('dropped_connections', {'drop_rate': 0.3}, shares=single_share)
+def dropped_connections(base_url, params):
+    with tempfile.TemporaryDirectory() as folder:
+        size, wall, cpu = timed(lambda: resolve_and_download(base_url, '1single', folder, retries=50))
+    stats = server_stats(base_url)
+    return dict(throughput(size, wall, cpu), dropped=stats['dropped'],
+                overhead_bytes=stats['bytes_sent'] - size)
+
+
+@scenario('flask', {'latency': 0.005}, shares=job_shares)
+def flask_endpoints(base_url, params):
+    # The app keeps its job store, downloads and stats relative to the working directory
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    from terabox_downloader_advanced import TeraBoxDownloaderAdvanced
+    TeraBoxDownloaderAdvanced.api_hosts = (base_url, base_url)
+    import app
+
+    client = app.app.test_client()
+    status_ms = []
+
+    def download_all():
+        ids = [
+            client.post('/download', json={'url': f'{base_url}/s/1job{index:03d}'}).get_json()['download_id']
+            for index in range(params['jobs'])
+        ]
+        pending = set(ids)
+        while pending:
+            for download_id in list(pending):
+                started = time.perf_counter()
+                status = client.get(f'/status/{download_id}').get_json()
+                status_ms.append((time.perf_counter() - started) * 1000)
+                if status['status'] == 'completed':
+                    pending.discard(download_id)
+                elif status['status'] in ('error', 'cancelled'):
+                    raise RuntimeError(status['message'])
+            time.sleep(0.05)
+        return ids
+
+    ids, wall, cpu = timed(download_all)
+    size = params['jobs'] * params['job_mb'] * MIB
+    results = {'end_to_end': throughput(size, wall, cpu)}
+
+    def serve_all():
+        served = 0
+        for download_id in ids:
+            response = client.get(f'/download-file/{download_id}')
+            for chunk in response.iter_encoded():
+                served += len(chunk)
+            response.close()
+        return served
+
+    served, wall, cpu = timed(serve_all)
+    assert served == size, (served, size)
+    results['download_file'] = throughput(served, wall, cpu)
+    results['status_ms_p50'] = round(statistics.median(status_ms), 2)
+    results['status_ms_p95'] = round(percentile(status_ms, 0.95), 2)
+    return results
+
+
+def run_server(conditions, shares, ready):
+    fake = FakeTeraBox(conditions)
+    for code, files in shares.items():
+        fake.add_share(code, files)
+    serve(fake, ready=ready)
+
+
+def run_scenario(name, params, base_url, results):
+    function, _, _ = SCENARIOS[name]
+    baseline_rss = peak_rss_mb()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # Progress output is still formatted and written, as in production
+        metrics = function(base_url, params)
+    metrics['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    metrics['rss_growth_mb'] = round(peak_rss_mb() - baseline_rss, 1)
+    results.put(metrics)
+
+
+def measure(name, params):
+    context = multiprocessing.get_context('spawn')
+    _, conditions, shares = SCENARIOS[name]
+    ready = context.Queue()
+    server = context.Process(target=run_server, args=(conditions, shares(params) if shares else {}, ready), daemon=True)
+    server.start()
+    try:
+        base_url = ready.get(timeout=120)
+        results = context.Queue()
+        worker = context.Process(target=run_scenario, args=(name, params, base_url, results))
+        worker.start()
+        worker.join()
+        if worker.exitcode != 0:
+            return {'error': f'exit code {worker.exitcode}'}
+        return dict(results.get(), conditions=conditions)
+    finally:
+        server.terminate()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(metrics, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, numbers only"""
+    flat = {}
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline, report):
+    print(f"\nChange against {baseline['meta'].get('commit', '?')[:12]}:")
+    for name, metrics in report['scenarios'].items():
+        old = flatten({k: v for k, v in baseline['scenarios'].get(name, {}).items() if k != 'conditions'})
+        for key, value in flatten({k: v for k, v in metrics.items() if k != 'conditions'}).items():
+            if old.get(key):
+                print(f"  {name}.{key}: {old[key]} -> {value} ({(value - old[key]) / old[key] * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='run only this scenario (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='small files and few runs, for CI')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    mode = 'quick' if args.quick else 'full'
+    params = PARAMS[mode]
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'mode': mode,
+            'params': params,
+        },
+        'scenarios': {},
+    }
+
+    for name in args.scenario or SCENARIOS:
+        print(f"⏱️ {name}...", flush=True)
+        report['scenarios'][name] = metrics = measure(name, params)
+        print(f"   {json.dumps({k: v for k, v in metrics.items() if k != 'conditions'})}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import time
+
+
+class AdaptiveReader:
+    """Reads a streamed response body into one reused buffer, sizing reads to the throughput.
+
+    Each read aims to take about target_interval seconds, so fast links move
+    megabytes per Python-level iteration while slow ones still report
+    progress (and notice cancellation) several times a second.
+    """
+
+    def __init__(self, response, min_size=64 * 1024, max_size=4 * 1024 * 1024, target_interval=0.25):
+        self.response = response
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_interval = target_interval
+        self.size = min_size
+        self._buffer = memoryview(bytearray(max_size))
+
+    def __iter__(self):
+        """Yield memoryviews of the body; each is only valid until the next one is requested"""
+        raw = self.response.raw
+        fp = getattr(raw, '_fp', None)
+        encoding = self.response.headers.get('content-encoding', 'identity').lower()
+
+        if fp is None or not hasattr(fp, 'readinto') or encoding != 'identity':
+            # Compressed bodies need urllib3's decoder; no zero-allocation path for those
+            for chunk in self.response.iter_content(chunk_size=self.max_size):
+                yield memoryview(chunk)
+            return
+
+        # readinto on the underlying http.client response fills the buffer in
+        # place instead of allocating a bytes object per chunk
+        while True:
+            started = time.monotonic()
+            count = fp.readinto(self._buffer[:self.size])
+            if fp.isclosed():
+                # Body complete. It was read past urllib3, so hand the connection
+                # back to the pool here, before a caller that stops at the last
+                # byte closes the response
+                raw.release_conn()
+            if not count:
+                break
+            # Timed before the caller writes the chunk: only the network sets the size
+            self._resize(count, time.monotonic() - started)
+            yield self._buffer[:count]
+
+    def _resize(self, count, elapsed):
+        if count < self.size:
+            # Short read at the end of the body (or from a slow sender); says nothing of throughput
+            return
+        if elapsed < self.target_interval / 2:
+            self.size = min(self.size * 2, self.max_size)
+        elif elapsed > self.target_interval * 2:
+            self.size = max(self.size // 2, self.min_size)
@@ -0,0 +1,118 @@
+import socket
+import threading
+import time
+from requests.adapters import HTTPAdapter
+
+
+class SharedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools outlive the sessions it is mounted on"""
+
+    def close(self):
+        # Session.close() on one job must not tear down pools other jobs are using
+        pass
+
+    def close_pools(self):
+        super().close()
+
+
+class DNSCache:
+    """TTL cache in front of socket.getaddrinfo"""
+
+    def __init__(self, ttl=300, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._original = None
+
+    def getaddrinfo(self, host, port, *args, **kwargs):
+        key = (host, port, args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+
+        result = self._original(host, port, *args, **kwargs)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (now + self.ttl, result)
+        return result
+
+    def install(self):
+        """Route this process's name lookups through the cache"""
+        if self._original is None:
+            self._original = socket.getaddrinfo
+            socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        if self._original is not None:
+            socket.getaddrinfo = self._original
+            self._original = None
+
+
+class ConnectionManager:
+    """Process-wide keep-alive pools that every downloader session borrows from"""
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_retries=3, host_pools=None,
+                 dns_cache_ttl=None):
+        # pool_connections: hosts with a cached pool; pool_maxsize: idle connections kept per host
+        self.default_adapter = SharedHTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries
+        )
+
+        # URL prefix -> adapter sized for that host, e.g. {'https://d.terabox.com': {'pool_maxsize': 16}}
+        self.host_adapters = {}
+        for prefix, sizing in (host_pools or {}).items():
+            self.host_adapters[prefix] = SharedHTTPAdapter(
+                pool_connections=sizing.get('pool_connections', 1),
+                pool_maxsize=sizing.get('pool_maxsize', pool_maxsize),
+                max_retries=max_retries
+            )
+
+        self.dns_cache = None
+        if dns_cache_ttl:
+            self.dns_cache = DNSCache(ttl=dns_cache_ttl)
+            self.dns_cache.install()
+
+    def mount(self, session):
+        """Point session at the shared pools; headers and cookies stay per-session"""
+        session.mount('http://', self.default_adapter)
+        session.mount('https://', self.default_adapter)
+        for prefix, adapter in self.host_adapters.items():
+            session.mount(prefix, adapter)
+        return session
+
+    def close(self):
+        """Close every pooled connection and restore normal name resolution"""
+        self.default_adapter.close_pools()
+        for adapter in self.host_adapters.values():
+            adapter.close_pools()
+        if self.dns_cache:
+            self.dns_cache.uninstall()
+
+
+_default_manager = None
+_default_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Replace the process-wide manager; call once at startup before creating downloaders"""
+    global _default_manager
+    with _default_lock:
+        if _default_manager is not None:
+            _default_manager.close()
+        _default_manager = ConnectionManager(**kwargs)
+        return _default_manager
+
+
+def get_connection_manager():
+    """The process-wide manager, created with defaults on first use"""
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            _default_manager = ConnectionManager()
+        return _default_manager
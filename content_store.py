@@ -0,0 +1,100 @@
+import os
+import hashlib
+import threading
+
+
+class ContentHasher:
+    """Hashes a file while it is being written, in file order.
+
+    Chunks that extend the hashed prefix are hashed straight from memory.
+    Segments written ahead of it are read back (normally still in the page
+    cache) once the contiguous prefix reaches them.
+    """
+
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, filepath, algorithms=('sha256',)):
+        self.filepath = filepath
+        self.position = 0
+        self._hashes = {name: hashlib.new(name) for name in algorithms}
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def update(self, start, data, available=None):
+        """Offer bytes just written at start; available is the file's contiguous prefix.
+
+        Never blocks: if another thread is hashing, the bytes are picked up
+        from disk later instead. Without available only data itself is hashed,
+        and segments written ahead are left for catch_up.
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            end = start + len(data)
+            if start <= self.position < end:
+                self._hash(memoryview(data)[self.position - start:])
+            if available is not None:
+                self._catch_up(available)
+        finally:
+            self._lock.release()
+
+    def catch_up(self, available):
+        """Read back and hash the file up to available; disk reads, so keep it off event loops"""
+        with self._lock:
+            self._catch_up(available)
+
+    def finish(self, total_size):
+        """Hash whatever is left up to total_size; returns {algorithm: hexdigest}"""
+        with self._lock:
+            self._catch_up(total_size)
+            self._close()
+            return {name: h.hexdigest() for name, h in self._hashes.items()}
+
+    def close(self):
+        """Release the read handle of a transfer that will not finish"""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _hash(self, data):
+        for h in self._hashes.values():
+            h.update(data)
+        self.position += len(data)
+
+    def _catch_up(self, available):
+        while self.position < available:
+            if self._fd is None:
+                self._fd = os.open(self.filepath, os.O_RDONLY)
+            data = os.pread(self._fd, min(self.READ_SIZE, available - self.position), self.position)
+            if not data:
+                break
+            self._hash(data)
+
+
+class ContentStore:
+    """Finished files stored once per content under <root>/objects/<sha256>"""
+
+    def __init__(self, root):
+        self.directory = os.path.join(root, 'objects')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, sha256):
+        return os.path.join(self.directory, sha256)
+
+    def add(self, filepath, sha256):
+        """Move a finished download into the store; returns the object's path.
+
+        Identical content already stored is kept and the new copy dropped, so
+        every share link for the same file shares one object on disk.
+        """
+        object_path = self.path_for(sha256)
+        if os.path.exists(object_path):
+            os.remove(filepath)
+            print(f"♻️ Same content already stored as {sha256[:12]}, dropped the duplicate")
+        else:
+            os.replace(filepath, object_path)
+        return object_path
@@ -0,0 +1,186 @@
+import os
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from download_checkpoint import DownloadCheckpoint
+
+
+class InsufficientSpace(Exception):
+    """Not enough disk space or quota for a transfer, even after evicting idle files"""
+
+
+class DownloadCache:
+    """Download folder managed as an LRU cache under a byte quota and free-space watermarks.
+
+    Recency is the file's atime, set explicitly on every access, so it is shared
+    by all worker processes and survives restarts; mtime (and so the ETag) is
+    left alone.
+    """
+
+    def __init__(self, folder, quota_bytes=None, min_free_bytes=0, target_free_bytes=None,
+                 write_grace=60, on_evict=None):
+        self.folder = folder
+        # Upper bound on the bytes the folder may hold; None for no quota
+        self.quota_bytes = quota_bytes
+        # Low watermark: evict once free disk space would drop below this...
+        self.min_free_bytes = min_free_bytes
+        # ...until this much is free again (high watermark)
+        self.target_free_bytes = max(target_free_bytes or 0, min_free_bytes)
+        # Files modified this recently may be written by another worker and are never evicted
+        self.write_grace = write_grace
+        # Called with the path of every evicted file
+        self.on_evict = on_evict
+
+        self._pins = {}
+        self._reserved = {}
+        self._lock = threading.Lock()
+        # Serializes _make_room, so concurrent reservations never decide on
+        # the same snapshot and evict twice for one shortfall
+        self._evict_lock = threading.Lock()
+
+    def _key(self, filepath):
+        return os.path.abspath(filepath)
+
+    def touch(self, filepath):
+        """Mark filepath as just used"""
+        try:
+            os.utime(filepath, (time.time(), os.stat(filepath).st_mtime))
+        except OSError:
+            pass
+
+    def pin(self, filepath):
+        """Protect filepath from eviction until the matching unpin"""
+        key = self._key(filepath)
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, filepath):
+        key = self._key(filepath)
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+
+    @contextmanager
+    def pinned(self, filepath):
+        self.pin(filepath)
+        try:
+            yield
+        finally:
+            self.unpin(filepath)
+
+    def reserve(self, filepath, total_size):
+        """Make room for a transfer of total_size bytes into filepath, pinning it.
+
+        Raises InsufficientSpace, without reserving anything, if evicting idle
+        files cannot make enough room.
+        """
+        key = self._key(filepath)
+        with self._lock:
+            if key not in self._reserved:
+                self._pins[key] = self._pins.get(key, 0) + 1
+            self._reserved[key] = total_size
+
+        shortfall = self._make_room()
+        if shortfall > 0:
+            self.release(filepath)
+            raise InsufficientSpace(
+                f'Not enough disk space for {total_size / (1024 * 1024):.1f} MB '
+                f'({shortfall / (1024 * 1024):.1f} MB short even with every idle file evicted)'
+            )
+
+    def release(self, filepath):
+        """End a reservation once its transfer has finished or failed"""
+        key = self._key(filepath)
+        with self._lock:
+            if self._reserved.pop(key, None) is None:
+                return
+        self.unpin(filepath)
+
+    def enforce(self):
+        """Evict idle files until the quota and watermarks hold again"""
+        self._make_room()
+
+    def disk_usage(self):
+        """Bytes on disk under the folder, partial files included"""
+        return sum(size for _, size, _, _ in self._entries())
+
+    def _entries(self):
+        """(path, bytes on disk, atime, mtime) for every file under the folder"""
+        entries = []
+        for directory, _, names in os.walk(self.folder):
+            for name in names:
+                if name.endswith((DownloadCheckpoint.SUFFIX, '.tmp')):
+                    continue
+                path = os.path.abspath(os.path.join(directory, name))
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # Blocks rather than st_size: preallocated partial files are sparse
+                entries.append((path, stat.st_blocks * 512, stat.st_atime, stat.st_mtime))
+        return entries
+
+    def _make_room(self):
+        """Evict least recently used idle files; returns the bytes still missing"""
+        with self._evict_lock:
+            return self._evict()
+
+    def _evict(self):
+        entries = self._entries()
+        with self._lock:
+            reserved = dict(self._reserved)
+            pins = set(self._pins)
+
+        on_disk = {path: size for path, size, _, _ in entries}
+        # Reserved transfers count at full size against the quota, and their
+        # not-yet-written bytes against free space
+        used = sum(size for path, size, _, _ in entries if path not in reserved) + sum(reserved.values())
+        outstanding = sum(max(size - on_disk.get(path, 0), 0) for path, size in reserved.items())
+        free = shutil.disk_usage(self.folder).free - outstanding
+
+        # Bytes that must go to meet the quota and low watermark, and the
+        # (larger) amount that brings free space back up to the high watermark
+        required = 0
+        if self.quota_bytes is not None:
+            required = used - self.quota_bytes
+        required = max(required, self.min_free_bytes - free, 0)
+        if required <= 0:
+            return 0
+        to_free = max(required, self.target_free_bytes - free)
+
+        now = time.time()
+        candidates = sorted(
+            (entry for entry in entries
+             if entry[0] not in pins and now - entry[3] >= self.write_grace),
+            key=lambda entry: entry[2]
+        )
+        evictable = sum(entry[1] for entry in candidates)
+        if evictable < required:
+            # Evicting cannot make enough room; keep the files
+            return required - evictable
+
+        freed = 0
+        for path, size, _, _ in candidates:
+            if freed >= to_free:
+                break
+            with self._lock:
+                if path in self._pins:
+                    # Pinned by a reader since the snapshot above
+                    continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            if os.path.exists(path + DownloadCheckpoint.SUFFIX):
+                os.remove(path + DownloadCheckpoint.SUFFIX)
+            freed += size
+            print(f"🧹 Evicted {os.path.basename(path)} ({size / (1024 * 1024):.1f} MB)")
+            if self.on_evict:
+                self.on_evict(path)
+
+        # Short of the high watermark is fine as long as the hard limits hold
+        return max(required - freed, 0)
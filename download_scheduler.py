@@ -0,0 +1,204 @@
+import asyncio
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from urllib.parse import urlparse
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled while running"""
+
+
+class DownloadScheduler:
+    """Fixed worker pool pulling download jobs from a priority queue"""
+
+    def __init__(self, max_workers=4, per_host_limit=2):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+
+        # Heap of (-priority, sequence, job_id); higher priority runs first, FIFO within a priority
+        self._queue = []
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self._condition = threading.Condition()
+
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+
+        self._workers = []
+        for index in range(max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'download-worker-{index}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, job_id, job, priority=0):
+        """Queue job (a callable taking the cancel event) under job_id"""
+        with self._condition:
+            self._jobs[job_id] = {
+                'job': job,
+                'priority': priority,
+                'state': 'queued',
+                'cancel_event': threading.Event(),
+            }
+            heapq.heappush(self._queue, (-priority, next(self._sequence), job_id))
+            self._condition.notify()
+
+    def position(self, job_id):
+        """1-based position of a queued job, or None if it is not waiting"""
+        return self.positions().get(job_id)
+
+    def positions(self):
+        """{job id: 1-based position} of every waiting job, from one sort of the queue"""
+        with self._condition:
+            waiting = sorted(item for item in self._queue if self._jobs[item[2]]['state'] == 'queued')
+        return {item[2]: index + 1 for index, item in enumerate(waiting)}
+
+    def queue_depth(self):
+        """Number of jobs waiting for a worker"""
+        with self._condition:
+            return sum(1 for entry in self._jobs.values() if entry['state'] == 'queued')
+
+    def active_count(self):
+        """Number of jobs currently running on a worker"""
+        with self._condition:
+            return sum(1 for entry in self._jobs.values() if entry['state'] == 'running')
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job.
+
+        Returns the state it was cancelled in ('queued' jobs never run, 'running'
+        ones stop themselves), or False if it is unknown or already finished.
+        """
+        with self._condition:
+            entry = self._jobs.get(job_id)
+            if not entry or entry['state'] == 'cancelled':
+                return False
+
+            state = entry['state']
+            entry['cancel_event'].set()
+            if state == 'queued':
+                # Lazily dropped from the heap by the worker loop
+                entry['state'] = 'cancelled'
+            return state
+
+    def is_cancelled(self, job_id):
+        """Whether cancel() has been called for a job that has not finished yet"""
+        entry = self._jobs.get(job_id)
+        return bool(entry and entry['cancel_event'].is_set())
+
+    @contextmanager
+    def host_slot(self, url, cancel_event=None):
+        """Hold one of the per-host transfer slots for the host of url"""
+        host = urlparse(url).hostname or ''
+        with self._host_lock:
+            slot = self._host_slots.setdefault(host, threading.BoundedSemaphore(self.per_host_limit))
+
+        # Poll so a cancelled job does not sit on a busy host forever
+        while not slot.acquire(timeout=0.5):
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled('Cancelled while waiting for a transfer slot')
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                _, _, job_id = heapq.heappop(self._queue)
+                entry = self._jobs[job_id]
+                if entry['state'] != 'queued':
+                    del self._jobs[job_id]
+                    continue
+                entry['state'] = 'running'
+
+            try:
+                entry['job'](entry['cancel_event'])
+            except Exception as e:
+                print(f"❌ Job {job_id} crashed: {e}")
+            finally:
+                with self._condition:
+                    # Finished jobs are forgotten; their outcome lives in the status store
+                    del self._jobs[job_id]
+
+
+class AsyncDownloadScheduler(DownloadScheduler):
+    """Priority queue feeding coroutine jobs to an AsyncEngine's event loop.
+
+    Same interface as DownloadScheduler, but jobs are coroutine functions taking
+    the cancel event and run as tasks instead of on worker threads, so
+    max_concurrent can be in the thousands.
+    """
+
+    def __init__(self, engine, max_concurrent=1000, per_host_limit=2):
+        self.engine = engine
+        self.max_concurrent = max_concurrent
+        self.per_host_limit = per_host_limit
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._jobs = {}
+        # Guards the queue and job table, which request threads read and write
+        self._condition = threading.Condition()
+        self._running = 0
+
+        # asyncio semaphores, only touched on the loop
+        self._host_slots = {}
+
+    def submit(self, job_id, job, priority=0):
+        """Queue job (a coroutine function taking the cancel event) under job_id"""
+        with self._condition:
+            self._jobs[job_id] = {
+                'job': job,
+                'priority': priority,
+                'state': 'queued',
+                'cancel_event': threading.Event(),
+            }
+            heapq.heappush(self._queue, (-priority, next(self._sequence), job_id))
+        self.engine.loop.call_soon_threadsafe(self._dispatch)
+
+    def _dispatch(self):
+        """Start queued jobs while there is room; runs on the loop"""
+        with self._condition:
+            while self._queue and self._running < self.max_concurrent:
+                _, _, job_id = heapq.heappop(self._queue)
+                entry = self._jobs[job_id]
+                if entry['state'] != 'queued':
+                    del self._jobs[job_id]
+                    continue
+                entry['state'] = 'running'
+                self._running += 1
+                self.engine.loop.create_task(self._run(job_id, entry))
+
+    async def _run(self, job_id, entry):
+        try:
+            await entry['job'](entry['cancel_event'])
+        except Exception as e:
+            print(f"❌ Job {job_id} crashed: {e}")
+        finally:
+            with self._condition:
+                del self._jobs[job_id]
+                self._running -= 1
+            self._dispatch()
+
+    @asynccontextmanager
+    async def host_slot(self, url, cancel_event=None):
+        """Hold one of the per-host transfer slots for the host of url"""
+        host = urlparse(url).hostname or ''
+        slot = self._host_slots.setdefault(host, asyncio.BoundedSemaphore(self.per_host_limit))
+
+        # Poll so a cancelled job does not sit on a busy host forever
+        while True:
+            try:
+                await asyncio.wait_for(slot.acquire(), 0.5)
+                break
+            except asyncio.TimeoutError:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled('Cancelled while waiting for a transfer slot')
+        try:
+            yield
+        finally:
+            slot.release()
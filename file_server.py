@@ -0,0 +1,211 @@
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+from flask import Response
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+
+# More ranges than this (after coalescing) are answered with the whole file,
+# which RFC 7233 allows and which keeps a Range header from costing more than a full send
+MAX_RANGES = 32
+
+# One byte-range-spec: 'first-last', 'first-' or '-suffix'
+_RANGE_SPEC = re.compile(r'(\d*)-(\d*)')
+
+
+def content_disposition(filename):
+    """Attachment header value that survives non-ASCII filenames"""
+    return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+
+def file_etag(stat):
+    """Strong validator from size and mtime; a rewritten file gets a new one"""
+    return f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+
+
+def parse_ranges(range_header, size):
+    """Satisfiable [start, end) byte ranges, sorted and coalesced.
+
+    Returns None if the header is missing or malformed (serve the whole file)
+    and [] if it is valid but no range overlaps the file (416).
+    """
+    # Parsed here rather than with werkzeug, which rejects the overlapping and
+    # out-of-order ranges RFC 7233 allows (and download managers send)
+    units, _, specs = (range_header or '').partition('=')
+    if units.strip().lower() != 'bytes' or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = _RANGE_SPEC.fullmatch(spec.strip())
+        if not match or match.group(1) == match.group(2) == '':
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(last)), size
+        else:
+            start = int(first)
+            end = size if not last else min(int(last) + 1, size)
+            if last and int(last) < start:
+                return None
+        if start < end:
+            ranges.append([start, end])
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _if_range_matches(environ, etag, last_modified):
+    """False if If-Range names an older version, meaning the Range must be ignored"""
+    if_range = environ.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == f'"{etag}"'
+    return if_range == http_date(last_modified)
+
+
+def _read_range(file, start, end, block_size):
+    """Yield bytes [start, end) of an open file"""
+    file.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        data = file.read(min(block_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+class FileServer:
+    """Conditional, single- and multi-range file responses for finished downloads"""
+
+    def __init__(self, block_size=256 * 1024, sendfile_header=None, accel_prefix='/protected/',
+                 root=None):
+        self.block_size = block_size
+        # None: Python sends the file; 'X-Sendfile' or 'X-Accel-Redirect': a front
+        # proxy (Apache mod_xsendfile, lighttpd, nginx) sends it from the header alone
+        self.sendfile_header = sendfile_header
+        # nginx internal location that maps onto root, for X-Accel-Redirect
+        self.accel_prefix = accel_prefix
+        self.root = root
+
+    def serve(self, environ, filepath, download_name, mimetype='application/octet-stream'):
+        """Response for filepath honouring Range, If-Range and the usual validators"""
+        if self.sendfile_header:
+            return self._offload(filepath, download_name, mimetype)
+
+        stat = os.stat(filepath)
+        size = stat.st_size
+        etag = file_etag(stat)
+        last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+
+        headers = {
+            'Content-Disposition': content_disposition(download_name),
+            'Accept-Ranges': 'bytes',
+            'ETag': f'"{etag}"',
+            'Last-Modified': http_date(last_modified),
+        }
+
+        if not is_resource_modified(environ, etag=etag, last_modified=last_modified,
+                                    ignore_if_range=True):
+            return Response(status=304, headers=headers)
+
+        ranges = None
+        if environ.get('HTTP_RANGE') and _if_range_matches(environ, etag, last_modified):
+            ranges = parse_ranges(environ['HTTP_RANGE'], size)
+            if ranges is not None and len(ranges) > MAX_RANGES:
+                ranges = None
+
+        if ranges == []:
+            headers['Content-Range'] = f'bytes */{size}'
+            return Response(status=416, headers=headers)
+
+        file = open(filepath, 'rb')
+        try:
+            if not ranges:
+                return self._whole(environ, file, size, mimetype, headers)
+            if len(ranges) == 1:
+                return self._single(environ, file, size, ranges[0], mimetype, headers)
+            return self._multipart(file, size, ranges, mimetype, headers)
+        except Exception:
+            file.close()
+            raise
+
+    def _whole(self, environ, file, size, mimetype, headers):
+        headers['Content-Length'] = str(size)
+        # wrap_file hands the file to the server's wsgi.file_wrapper, which
+        # servers such as gunicorn send with os.sendfile
+        body = wrap_file(environ, file, self.block_size)
+        return Response(body, status=200, mimetype=mimetype, headers=headers, direct_passthrough=True)
+
+    def _single(self, environ, file, size, byte_range, mimetype, headers):
+        start, end = byte_range
+        headers['Content-Length'] = str(end - start)
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+
+        if end == size:
+            # Open-ended ranges (resumes, most player seeks) run to EOF, so the
+            # file wrapper can still send them zero-copy from the seek position
+            file.seek(start)
+            body = wrap_file(environ, file, self.block_size)
+        else:
+            body = self._closing(file, _read_range(file, start, end, self.block_size))
+        return Response(body, status=206, mimetype=mimetype, headers=headers, direct_passthrough=True)
+
+    def _multipart(self, file, size, ranges, mimetype, headers):
+        boundary = uuid.uuid4().hex
+        parts = []
+        length = 0
+        for start, end in ranges:
+            part_header = (
+                f'\r\n--{boundary}\r\n'
+                f'Content-Type: {mimetype}\r\n'
+                f'Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n'
+            ).encode('ascii')
+            parts.append((part_header, start, end))
+            length += len(part_header) + end - start
+        trailer = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        length += len(trailer)
+
+        def generate():
+            for part_header, start, end in parts:
+                yield part_header
+                yield from _read_range(file, start, end, self.block_size)
+            yield trailer
+
+        headers['Content-Length'] = str(length)
+        return Response(
+            self._closing(file, generate()),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+            headers=headers,
+            direct_passthrough=True
+        )
+
+    def _closing(self, file, iterator):
+        """Iterate, closing the file when the response ends or the client goes away"""
+        try:
+            yield from iterator
+        finally:
+            file.close()
+
+    def _offload(self, filepath, download_name, mimetype):
+        """Empty response telling the front proxy which file to send"""
+        headers = {'Content-Disposition': content_disposition(download_name)}
+        if self.sendfile_header == 'X-Accel-Redirect':
+            relative = os.path.relpath(os.path.abspath(filepath), os.path.abspath(self.root or '.'))
+            headers['X-Accel-Redirect'] = self.accel_prefix.rstrip('/') + '/' + quote(relative.replace(os.sep, '/'))
+        else:
+            headers[self.sendfile_header] = os.path.abspath(filepath)
+        return Response(status=200, mimetype=mimetype, headers=headers)
@@ -0,0 +1,367 @@
+import os
+import json
+import time
+import atexit
+import socket
+import sqlite3
+import threading
+
+
+# Jobs in these states (and records attached to another job) expire after the TTL
+FINISHED_STATES = ('completed', 'error', 'cancelled')
+# States of jobs that still need a worker
+ACTIVE_STATES = ('queued', 'processing', 'downloading')
+
+# Records of jobs still queued or running are kept this long, so orphans that
+# recover() cannot attribute (e.g. written on another host) are dropped too
+ORPHAN_TTL = 7 * 24 * 3600
+
+
+def _expires_at(record, ttl, now):
+    if record.get('status') in FINISHED_STATES or record.get('attached_to'):
+        return now + ttl
+    return now + max(ttl, ORPHAN_TTL)
+
+
+def _boot_time():
+    """Machine boot time from /proc/stat, or '' where there is no /proc"""
+    try:
+        with open('/proc/stat', 'r') as f:
+            for line in f:
+                if line.startswith('btime '):
+                    return line.split()[1]
+    except OSError:
+        pass
+    return ''
+
+
+def _process_start(pid):
+    """Start time of a process in clock ticks since boot, '' without /proc, None if it is gone"""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            # Field 22; the command name before it may contain spaces
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except FileNotFoundError:
+        return None if os.path.isdir('/proc/self') else ''
+    except (OSError, IndexError):
+        return ''
+
+
+HOSTNAME = socket.gethostname()
+BOOT_TIME = _boot_time()
+
+
+def current_owner():
+    """Owner id of records written by this process: host, boot time, pid and process start time"""
+    pid = os.getpid()
+    return f'{HOSTNAME}:{BOOT_TIME}:{pid}:{_process_start(pid) or ""}'
+
+
+def owner_alive(owner):
+    """Whether the process that wrote a record may still be running.
+
+    The start time tells a reused pid (as after a container restart) from the
+    original process. Owners on other hosts cannot be checked and count as alive.
+    """
+    host, boot_time, pid, start = owner.rsplit(':', 3)
+    if host != HOSTNAME:
+        return True
+    if boot_time and BOOT_TIME and boot_time != BOOT_TIME:
+        return False
+    if start:
+        return _process_start(int(pid)) == start
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, ValueError):
+        pass
+    return True
+
+
+class JobStore:
+    """Status records of download jobs, keyed by download id.
+
+    set() replaces a record and is visible at once; update() merges progress
+    fields and may be batched. Finished records are dropped ttl seconds after
+    their last write.
+    """
+
+    def get(self, download_id):
+        """The job's record, or {} if unknown or expired"""
+        raise NotImplementedError
+
+    def get_many(self, download_ids):
+        """{download id: record} of the known, unexpired jobs among download_ids"""
+        records = {}
+        for download_id in download_ids:
+            record = self.get(download_id)
+            if record:
+                records[download_id] = record
+        return records
+
+    def set(self, download_id, record):
+        raise NotImplementedError
+
+    def update(self, download_id, **fields):
+        raise NotImplementedError
+
+    def find(self, field, value):
+        """Ids of the unexpired jobs whose record has field == value"""
+        raise NotImplementedError
+
+    def delete(self, download_id):
+        raise NotImplementedError
+
+    def prune(self):
+        """Drop expired records; returns how many were removed"""
+        raise NotImplementedError
+
+    def recover(self):
+        """Mark jobs left active by a process that has exited as interrupted; returns how many.
+
+        Per-process stores die with their jobs, so there is nothing to recover.
+        """
+        return 0
+
+
+class MemoryJobStore(JobStore):
+    """Per-process store, for a single worker"""
+
+    def __init__(self, ttl=24 * 3600, prune_interval=60):
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        # download id -> (record, expires_at)
+        self._records = {}
+        self._next_prune = time.monotonic() + prune_interval
+        self._lock = threading.Lock()
+
+    def get(self, download_id):
+        with self._lock:
+            entry = self._records.get(download_id)
+        if not entry or entry[1] <= time.time():
+            return {}
+        return dict(entry[0])
+
+    def set(self, download_id, record):
+        now = time.time()
+        with self._lock:
+            self._records[download_id] = (dict(record), _expires_at(record, self.ttl, now))
+            due = time.monotonic() >= self._next_prune
+        if due:
+            self.prune()
+
+    def update(self, download_id, **fields):
+        with self._lock:
+            entry = self._records.get(download_id)
+            if entry:
+                entry[0].update(fields)
+
+    def find(self, field, value):
+        now = time.time()
+        with self._lock:
+            return [
+                download_id for download_id, (record, expires_at) in self._records.items()
+                if expires_at > now and record.get(field) == value
+            ]
+
+    def delete(self, download_id):
+        with self._lock:
+            self._records.pop(download_id, None)
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            self._next_prune = time.monotonic() + self.prune_interval
+            expired = [key for key, (_, expires_at) in self._records.items() if expires_at <= now]
+            for key in expired:
+                del self._records[key]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """Store in a SQLite database in WAL mode, shared by every worker process"""
+
+    # Ids per query of get_many, below SQLite's limit on bound parameters
+    GET_MANY_BATCH = 500
+
+    def __init__(self, path, ttl=24 * 3600, prune_interval=60, flush_interval=1.0):
+        self.path = path
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        # Progress updates are merged in memory and written together at most this often
+        self.flush_interval = flush_interval
+
+        self._local = threading.local()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._next_prune = time.monotonic() + prune_interval
+        self._lock = threading.Lock()
+
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, '
+                'status TEXT, '
+                'data TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, '
+                'expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+            # Databases created before records had an owner
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+            if 'owner' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+
+        atexit.register(self.flush)
+
+    def _connection(self):
+        """This thread's connection; sqlite3 connections must not be shared across threads"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            # WAL lets status readers in other workers proceed while a job writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, download_id):
+        row = self._connection().execute(
+            'SELECT data, expires_at FROM jobs WHERE id = ?', (download_id,)
+        ).fetchone()
+        with self._lock:
+            pending = dict(self._pending.get(download_id, {}))
+
+        if not row or row[1] <= time.time():
+            return {}
+        record = json.loads(row[0])
+        record.update(pending)
+        return record
+
+    def get_many(self, download_ids):
+        """Records of many jobs, read with one query per GET_MANY_BATCH ids"""
+        download_ids = list(download_ids)
+        rows = []
+        conn = self._connection()
+        for start in range(0, len(download_ids), self.GET_MANY_BATCH):
+            batch = download_ids[start:start + self.GET_MANY_BATCH]
+            rows.extend(conn.execute(
+                f'SELECT id, data FROM jobs WHERE expires_at > ? AND id IN ({", ".join("?" * len(batch))})',
+                [time.time()] + batch
+            ).fetchall())
+        with self._lock:
+            pending = {download_id: dict(self._pending[download_id]) for download_id, _ in rows if download_id in self._pending}
+
+        records = {}
+        for download_id, data in rows:
+            record = json.loads(data)
+            record.update(pending.get(download_id, {}))
+            records[download_id] = record
+        return records
+
+    def set(self, download_id, record):
+        now = time.time()
+        with self._lock:
+            # A new state supersedes progress not yet written for the job
+            self._pending.pop(download_id, None)
+            due = time.monotonic() >= self._next_prune
+
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (id, status, data, updated_at, expires_at, owner) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (download_id, record.get('status'), json.dumps(record), now,
+                 _expires_at(record, self.ttl, now), current_owner())
+            )
+
+        self.flush(force=False)
+        if due:
+            self.prune()
+
+    def update(self, download_id, **fields):
+        with self._lock:
+            self._pending.setdefault(download_id, {}).update(fields)
+        self.flush(force=False)
+
+    def find(self, field, value):
+        # Only fields written by set() are searched; batched progress never holds them
+        rows = self._connection().execute(
+            'SELECT id FROM jobs WHERE expires_at > ? AND json_extract(data, ?) = ?',
+            (time.time(), f'$.{field}', value)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def flush(self, force=True):
+        """Write batched progress in one transaction; unless force, only once the batch is due"""
+        with self._lock:
+            if not self._pending:
+                return
+            if not force and time.monotonic() - self._last_flush < self.flush_interval:
+                return
+            pending = self._pending
+            self._pending = {}
+            self._last_flush = time.monotonic()
+
+        now = time.time()
+        with self._connection() as conn:
+            # Read-modify-write under the write lock so no other worker interleaves
+            conn.execute('BEGIN IMMEDIATE')
+            for download_id, fields in pending.items():
+                row = conn.execute('SELECT data FROM jobs WHERE id = ?', (download_id,)).fetchone()
+                if row:
+                    record = json.loads(row[0])
+                    record.update(fields)
+                    conn.execute(
+                        'UPDATE jobs SET data = ?, updated_at = ? WHERE id = ?',
+                        (json.dumps(record), now, download_id)
+                    )
+
+    def delete(self, download_id):
+        with self._lock:
+            self._pending.pop(download_id, None)
+        with self._connection() as conn:
+            conn.execute('DELETE FROM jobs WHERE id = ?', (download_id,))
+
+    def prune(self):
+        with self._lock:
+            self._next_prune = time.monotonic() + self.prune_interval
+        with self._connection() as conn:
+            cursor = conn.execute('DELETE FROM jobs WHERE expires_at <= ?', (time.time(),))
+        return cursor.rowcount
+
+    def recover(self):
+        """Mark jobs left active by an exited process as failed with interrupted=True.
+
+        Each record names the process that last wrote it, so on startup a
+        worker only touches jobs whose process is gone, never a live sibling's.
+        """
+        now = time.time()
+        alive = {}
+        interrupted = 0
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                f'SELECT id, data, owner FROM jobs WHERE expires_at > ? AND status IN ({", ".join("?" * len(ACTIVE_STATES))})',
+                (now,) + ACTIVE_STATES
+            ).fetchall()
+            for download_id, data, owner in rows:
+                # Records written before owners were stored all predate this process
+                if owner:
+                    if owner not in alive:
+                        alive[owner] = owner_alive(owner)
+                    if alive[owner]:
+                        continue
+                record = json.loads(data)
+                record.update(
+                    status='error',
+                    message='⚠️ Interrupted by a server restart. Submit the link again to resume.',
+                    interrupted=True
+                )
+                conn.execute(
+                    'UPDATE jobs SET status = ?, data = ?, updated_at = ?, expires_at = ? WHERE id = ?',
+                    ('error', json.dumps(record), now, _expires_at(record, self.ttl, now), download_id)
+                )
+                interrupted += 1
+        return interrupted
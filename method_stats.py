@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import random
+import atexit
+import threading
+from urllib.parse import urlparse
+
+
+class MethodStats:
+    """Per-domain success rate and latency of extraction methods and patterns, persisted as JSON"""
+
+    def __init__(self, path=None, exploration=0.1, smoothing=0.2, flush_interval=30):
+        self.path = path
+        # Chance of promoting a random non-leading candidate so recovered methods get noticed
+        self.exploration = exploration
+        # Weight of the newest observation in the moving averages
+        self.smoothing = smoothing
+        self.flush_interval = flush_interval
+
+        self._stats = {}
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._flush_pending = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._stats = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Ignoring unreadable method stats {path}: {e}")
+
+        if path:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def domain_of(url):
+        """Stats bucket for a share URL: its host without www."""
+        host = (urlparse(url).hostname or '').lower()
+        return host[4:] if host.startswith('www.') else host
+
+    def record(self, domain, name, success, latency):
+        """Record one attempt of method or pattern name against domain"""
+        with self._lock:
+            entry = self._stats.setdefault(domain, {}).setdefault(name, {
+                'attempts': 0,
+                'successes': 0,
+                'success_rate': 0.0,
+                'avg_latency': latency,
+            })
+            entry['attempts'] += 1
+            entry['successes'] += 1 if success else 0
+
+            # Moving averages follow TeraBox page changes instead of the all-time totals
+            alpha = 1.0 if entry['attempts'] == 1 else self.smoothing
+            entry['success_rate'] += alpha * ((1.0 if success else 0.0) - entry['success_rate'])
+            entry['avg_latency'] += alpha * (latency - entry['avg_latency'])
+            entry['last_attempt'] = time.time()
+
+            self._dirty = True
+            due = (time.monotonic() - self._last_flush >= self.flush_interval and
+                   not self._flush_pending and self.path)
+            if due:
+                self._flush_pending = True
+
+        if due:
+            # Written on its own thread: record runs inside extractions, on the
+            # asyncio engine's shared loop too
+            threading.Thread(target=self.flush, name='method-stats-flush', daemon=True).start()
+
+    def order(self, domain, candidates, key=lambda candidate: candidate):
+        """Sort candidates by expected time to a successful result on domain.
+
+        Candidates never tried keep their listed order ahead of known ones, so the
+        default cascade is used until there is data.
+        """
+        with self._lock:
+            stats = dict(self._stats.get(domain, {}))
+
+        def score(candidate):
+            entry = stats.get(key(candidate))
+            if not entry:
+                return 0.0
+            return entry['avg_latency'] / max(entry['success_rate'], 0.05) + 1e-6
+
+        ordered = sorted(candidates, key=score)
+        if len(ordered) > 1 and random.random() < self.exploration:
+            ordered.insert(0, ordered.pop(random.randrange(1, len(ordered))))
+        return ordered
+
+    def snapshot(self):
+        """Copy of all statistics, grouped by domain"""
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    def flush(self):
+        """Write the statistics to disk if anything changed"""
+        if not self.path:
+            return
+        with self._lock:
+            self._flush_pending = False
+            if not self._dirty:
+                return
+            data = json.dumps(self._stats)
+            self._dirty = False
+            self._last_flush = time.monotonic()
+
+        with self._flush_lock:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
@@ -0,0 +1,293 @@
+import bisect
+import time
+import threading
+from urllib.parse import urlparse
+
+
+# Seconds, from a cached resolution up to a long transfer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Bytes per second, 64 KiB/s to 1 GiB/s in steps of 4x
+THROUGHPUT_BUCKETS = tuple(64 * 1024 * 4 ** step for step in range(8))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One count per bucket, plus one for values above the largest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Metric:
+    """One metric family: a value per combination of label values"""
+
+    def __init__(self, kind, name, documentation, labelnames=(), buckets=None, function=None):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets or LATENCY_BUCKETS)
+        # Gauges read at scrape time: function returns the value
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The value for these label values, created on first use"""
+        value = self._values.get(values)
+        if value is None:
+            with self._lock:
+                value = self._values.get(values)
+                if value is None:
+                    if self.kind == 'histogram':
+                        value = _HistogramValue(self.buckets)
+                    elif self.kind == 'gauge':
+                        value = _GaugeValue()
+                    else:
+                        value = _CounterValue()
+                    self._values[values] = value
+        return value
+
+    def render(self):
+        """Lines of the Prometheus text format for this family"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        if self.function:
+            try:
+                lines.append(f'{self.name} {_format_value(self.function())}')
+            except Exception as e:
+                print(f"⚠️ Metric {self.name} failed: {e}")
+                return []
+            return lines
+
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            if self.kind != 'histogram':
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value.value)}')
+                continue
+            with value._lock:
+                counts, total, count = list(value.counts), value.sum, value.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """Metric families of this process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Metric('counter', name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        """A gauge set by the code, or read from function() at every scrape"""
+        return self._add(Metric('gauge', name, documentation, labelnames, function=function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Metric('histogram', name, documentation, labelnames, buckets=buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class Span:
+    """Times one stage; outcome is 'success' unless set, or 'error' if the block raised"""
+
+    __slots__ = ('metrics', 'stage', 'name', 'outcome', 'start', 'duration')
+
+    def __init__(self, metrics, stage, name):
+        self.metrics = metrics
+        self.stage = stage
+        self.name = name
+        self.outcome = None
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self.start
+        if self.outcome is None:
+            self.outcome = 'error' if exc_type else 'success'
+        self.metrics.observe(self.stage, self.name, self.duration, self.outcome)
+        return False
+
+
+class Metrics:
+    """Stage timings, transfer throughput and HTTP statuses of the downloader and app.
+
+    Stages are 'method' (one extraction method), 'api_probe' (one share-info
+    endpoint), 'listing' (one share-list page), 'ttfb' (request to response
+    headers on the download host), 'transfer' (a whole download) and 'serve'
+    (sending a file to a client).
+    """
+
+    enabled = True
+
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        self.stage_seconds = self.registry.histogram(
+            'terabox_stage_duration_seconds',
+            'Time spent in each stage of resolving, downloading and serving files',
+            ('stage', 'name')
+        )
+        self.stage_total = self.registry.counter(
+            'terabox_stage_total',
+            'Stage attempts by outcome (success, failure, error or skipped)',
+            ('stage', 'name', 'outcome')
+        )
+        self.throughput = self.registry.histogram(
+            'terabox_throughput_bytes_per_second',
+            'Average rate of each completed transfer or file response',
+            ('stage',),
+            buckets=THROUGHPUT_BUCKETS
+        )
+        self.bytes_total = self.registry.counter(
+            'terabox_bytes_total',
+            'Bytes downloaded (transfer) and sent to clients (serve)',
+            ('stage',)
+        )
+        self.http_responses = self.registry.counter(
+            'terabox_http_responses_total',
+            'Responses from TeraBox pages, APIs and download hosts by status code',
+            ('host', 'status')
+        )
+
+    def span(self, stage, name=''):
+        """Context manager timing one stage"""
+        return Span(self, stage, name)
+
+    def observe(self, stage, name, seconds, outcome='success'):
+        self.stage_total.labels(stage, name, outcome).inc()
+        # Skipped attempts never ran, so their time says nothing about the stage
+        if outcome != 'skipped':
+            self.stage_seconds.labels(stage, name).observe(seconds)
+
+    def transferred(self, stage, size, seconds):
+        """Record size bytes moved by one finished transfer or response"""
+        self.bytes_total.labels(stage).inc(size)
+        if seconds > 0 and size:
+            self.throughput.labels(stage).observe(size / seconds)
+
+    def http_response(self, host, status):
+        self.http_responses.labels(host or '', str(status)).inc()
+
+    def requests_hook(self, response, *args, **kwargs):
+        """requests response hook counting every response of a session"""
+        self.http_response(urlparse(response.url).hostname, response.status_code)
+
+    def gauge(self, name, documentation, function):
+        """Gauge read from function() at every scrape"""
+        return self.registry.gauge(name, documentation, function=function)
+
+    def render(self):
+        return self.registry.render()
+
+
+class _NullSpan:
+    """Shared do-nothing span; the assignments instrumented code makes are discarded"""
+
+    outcome = None
+    duration = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+class NullMetrics:
+    """Stand-in for Metrics when metrics are turned off: every hook returns at once"""
+
+    enabled = False
+
+    _span = _NullSpan()
+
+    def span(self, stage, name=''):
+        return self._span
+
+    def observe(self, stage, name, seconds, outcome='success'):
+        pass
+
+    def transferred(self, stage, size, seconds):
+        pass
+
+    def http_response(self, host, status):
+        pass
+
+    def gauge(self, name, documentation, function):
+        pass
+
+
+# Default of every instrumented component
+DISABLED = NullMetrics()
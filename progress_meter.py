@@ -0,0 +1,48 @@
+import time
+import threading
+
+
+class ProgressMeter:
+    """Throttled progress reports with smoothed throughput and ETA.
+
+    Reports are dicts with downloaded, total_size, speed (bytes/s) and eta
+    (seconds, or None while unknown).
+    """
+
+    def __init__(self, callback, interval=0.5, smoothing=0.3):
+        self.callback = callback
+        # Minimum seconds between reports; updates in between are dropped
+        self.interval = interval
+        # Weight of the newest interval in the moving-average speed
+        self.smoothing = smoothing
+        self.speed = 0.0
+
+        self._last_report = None
+        self._last_bytes = 0
+        self._lock = threading.Lock()
+
+    def update(self, downloaded, total_size=None, force=False):
+        """Record bytes done so far (from any thread); reports if the interval has passed"""
+        now = time.monotonic()
+        with self._lock:
+            if self._last_report is not None:
+                elapsed = now - self._last_report
+                if elapsed < self.interval and not force:
+                    return
+                if elapsed > 0:
+                    rate = max(downloaded - self._last_bytes, 0) / elapsed
+                    self.speed = rate if not self.speed else self.speed + self.smoothing * (rate - self.speed)
+            self._last_report = now
+            self._last_bytes = downloaded
+
+            eta = None
+            if total_size and self.speed > 0:
+                eta = max(total_size - downloaded, 0) / self.speed
+            report = {
+                'downloaded': downloaded,
+                'total_size': total_size,
+                'speed': round(self.speed),
+                'eta': round(eta) if eta is not None else None,
+            }
+
+        self.callback(report)
@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+
+class JSONFileBackend:
+    """On-disk backend storing one JSON file per share code"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, entry):
+        path = self._path(key)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def prune(self, max_entries=None):
+        """Remove expired and unreadable entries, then the oldest beyond max_entries; returns how many"""
+        now = time.time()
+        kept = []
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith('.tmp'):
+                    # Left by an interrupted write, unless another process is writing it now
+                    if os.path.getmtime(path) > now - 60:
+                        continue
+                else:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        entry = json.load(f)
+                    if entry['expires_at'] > now:
+                        kept.append((os.path.getmtime(path), path))
+                        continue
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+            removed += self._remove(path)
+
+        if max_entries is not None and len(kept) > max_entries:
+            kept.sort()
+            for _, path in kept[:len(kept) - max_entries]:
+                removed += self._remove(path)
+        return removed
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+
+class ResolutionCache:
+    """LRU cache of resolved shares keyed by share code, expiring with the dlink"""
+
+    # Only the extracted fields are cached, never the page content
+    FIELDS = ('filename', 'download_url', 'final_url', 'size', 'md5')
+    # Share listings are kept under their share code with this prefix
+    LISTING_PREFIX = 'list:'
+
+    def __init__(self, max_entries=256, default_ttl=3600, safety_margin=120, backend=None, prune_interval=600):
+        self.max_entries = max_entries
+        # TTL for dlinks without an expiry, and an upper bound for the rest
+        self.default_ttl = default_ttl
+        # Entries expire this many seconds before the dlink itself does
+        self.safety_margin = safety_margin
+        self.backend = backend
+        # Seconds between sweeps of expired entries out of the backend
+        self.prune_interval = prune_interval
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_prune = time.monotonic()
+        self.prune()
+
+    def get(self, share_code):
+        """Cached resolution for share_code, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(share_code)
+            if entry:
+                self._entries.move_to_end(share_code)
+
+        if entry is None and self.backend:
+            entry = self.backend.get(share_code)
+            if entry:
+                self._store(share_code, entry)
+
+        if entry is None:
+            return None
+        if entry['expires_at'] <= now:
+            self.invalidate(share_code)
+            return None
+        return dict(entry['result'])
+
+    def put(self, share_code, result):
+        """Cache the extracted fields of a successful resolution"""
+        ttl = self.ttl_for(result.get('download_url'))
+        if ttl <= 0:
+            return
+
+        self._put(share_code, {field: result.get(field) for field in self.FIELDS if result.get(field) is not None}, ttl)
+
+    def get_listing(self, share_code):
+        """Cached list_files files of share_code, or None if missing or expired"""
+        cached = self.get(self.LISTING_PREFIX + share_code)
+        return cached['files'] if cached else None
+
+    def put_listing(self, share_code, files):
+        """Cache a share's files until the first of their dlinks expires.
+
+        Listings with a file lacking a dlink are not cached: that file would
+        fail again on every resubmission until the entry expired.
+        """
+        if not files or not all(file_info.get('download_url') for file_info in files):
+            return
+        ttl = min(self.ttl_for(file_info['download_url']) for file_info in files)
+        if ttl > 0:
+            self._put(self.LISTING_PREFIX + share_code, {'files': files}, ttl)
+
+    def invalidate_listing(self, share_code):
+        self.invalidate(self.LISTING_PREFIX + share_code)
+
+    def _put(self, key, result, ttl):
+        entry = {'expires_at': time.time() + ttl, 'result': result}
+        self._store(key, entry)
+        if self.backend:
+            self.backend.set(key, entry)
+            if time.monotonic() >= self._next_prune:
+                self.prune()
+
+    def prune(self):
+        """Drop expired entries from the backend, and any beyond max_entries; returns how many"""
+        self._next_prune = time.monotonic() + self.prune_interval
+        if not self.backend:
+            return 0
+        return self.backend.prune(self.max_entries)
+
+    def invalidate(self, share_code):
+        with self._lock:
+            self._entries.pop(share_code, None)
+        if self.backend:
+            self.backend.delete(share_code)
+
+    def _store(self, share_code, entry):
+        evicted = []
+        with self._lock:
+            self._entries[share_code] = entry
+            self._entries.move_to_end(share_code)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+        # Evicted entries leave the backend too, so it stays within max_entries
+        if self.backend:
+            for key in evicted:
+                self.backend.delete(key)
+
+    def ttl_for(self, download_url):
+        """Seconds a dlink stays usable, from its time/expires query parameters"""
+        if not download_url:
+            return 0
+
+        query = parse_qs(urlparse(download_url).query)
+        lifetime = self._parse_duration(query.get('expires', [None])[0])
+        if lifetime is None:
+            return self.default_ttl
+
+        issued = query.get('time', [None])[0]
+        if issued and issued.isdigit():
+            remaining = int(issued) + lifetime - time.time()
+        else:
+            remaining = lifetime
+        return min(remaining, self.default_ttl) - self.safety_margin
+
+    def _parse_duration(self, value):
+        """Parse '8h', '30m', '3600s' or '3600' into seconds"""
+        if not value:
+            return None
+        match = re.fullmatch(r'(\d+)([smhd]?)', value.strip().lower())
+        if not match:
+            return None
+        units = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+        return int(match.group(1)) * units[match.group(2)]
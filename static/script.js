@@ -1,5 +1,7 @@
 let currentDownloadId = null;
 let statusCheckInterval = null;
+let statusEvents = null;
+let currentStatus = null;
 
 function startDownload() {
     const urlInput = document.getElementById('teraboxUrl');
@@ -53,10 +55,36 @@ function startDownload() {
     });
 }
 
-function startStatusChecking() {
-    // Clear existing interval
+function isFinished(status) {
+    return status.status === 'completed' || status.status === 'error' || status.status === 'cancelled';
+}
+
+function stopStatusChecking() {
+    if (statusEvents) {
+        statusEvents.close();
+        statusEvents = null;
+    }
     if (statusCheckInterval) {
         clearInterval(statusCheckInterval);
+        statusCheckInterval = null;
+    }
+}
+
+function startStatusChecking() {
+    stopStatusChecking();
+    
+    // The server pushes every status change; fall back to polling without EventSource
+    if (window.EventSource) {
+        statusEvents = new EventSource(`/events/${currentDownloadId}`);
+        statusEvents.onmessage = (event) => {
+            const status = JSON.parse(event.data);
+            updateUI(status);
+            if (isFinished(status) || !status.status) {
+                stopStatusChecking();
+                resetDownloadButton();
+            }
+        };
+        return;
     }
     
     // Check status every 2 seconds
@@ -73,9 +101,9 @@ function checkStatus() {
         .then(status => {
             updateUI(status);
             
-            // Stop checking if completed or error
-            if (status.status === 'completed' || status.status === 'error') {
-                clearInterval(statusCheckInterval);
+            // Stop checking once the job has finished
+            if (isFinished(status)) {
+                stopStatusChecking();
                 resetDownloadButton();
             }
         })
@@ -85,6 +113,8 @@ function checkStatus() {
 }
 
 function updateUI(status) {
+    currentStatus = status.status;
+    
     const statusIndicator = document.getElementById('statusIndicator');
     const statusMessage = document.getElementById('statusMessage');
     const progressInfo = document.getElementById('progressInfo');
@@ -94,8 +124,11 @@ function updateUI(status) {
     statusIndicator.className = `status-indicator ${status.status}`;
     statusMessage.textContent = status.message;
     
-    // Update file info
-    if (status.filename) {
+    // Update file info; folder shares list every file with its own link
+    if (status.files) {
+        fileInfo.replaceChildren(...status.files.map(renderFileEntry));
+        fileInfo.style.display = 'block';
+    } else if (status.filename) {
         fileInfo.textContent = `File: ${status.filename}`;
         fileInfo.style.display = 'block';
     } else {
@@ -107,19 +140,76 @@ function updateUI(status) {
         const sizeMB = (status.file_size / (1024 * 1024)).toFixed(2);
         progressInfo.textContent = `Size: ${sizeMB} MB`;
         progressInfo.style.display = 'block';
+    } else if (status.status === 'downloading' && status.downloaded !== undefined) {
+        progressInfo.textContent = formatProgress(status);
+        progressInfo.style.display = 'block';
     } else {
         progressInfo.style.display = 'none';
     }
     
+    // Cancelling only makes sense while the job is queued or running
+    const cancelBtn = document.getElementById('cancelBtn');
+    const active = ['queued', 'processing', 'downloading'].includes(status.status);
+    cancelBtn.classList.toggle('hidden', !active);
+    
     // Show appropriate buttons
-    if (status.status === 'completed') {
+    document.getElementById('downloadFileBtn').classList.toggle('hidden', Boolean(status.files));
+    if (status.status === 'completed' || status.status === 'downloading') {
+        // The file can be fetched while the server is still downloading it
         showActionButtons();
     } else if (status.status === 'error') {
         showError(status.message);
         showNewDownloadButton();
+    } else if (status.status === 'cancelled') {
+        showNewDownloadButton();
     }
 }
 
+function renderFileEntry(file) {
+    const entry = document.createElement('div');
+    if (file.status === 'completed') {
+        const link = document.createElement('a');
+        link.href = `/download-file/${file.download_id}`;
+        link.textContent = file.filename;
+        entry.appendChild(link);
+    } else {
+        entry.textContent = `${file.filename || file.url}: ${file.message || file.status}`;
+    }
+    return entry;
+}
+
+function formatProgress(status) {
+    const doneMB = (status.downloaded / (1024 * 1024)).toFixed(1);
+    let text = status.total_size
+        ? `${doneMB} / ${(status.total_size / (1024 * 1024)).toFixed(1)} MB`
+        : `${doneMB} MB`;
+    if (status.speed) {
+        text += ` · ${(status.speed / (1024 * 1024)).toFixed(2)} MB/s`;
+    }
+    if (status.eta !== null && status.eta !== undefined) {
+        const minutes = Math.floor(status.eta / 60);
+        const seconds = status.eta % 60;
+        text += ` · ETA ${minutes > 0 ? `${minutes}m ` : ''}${seconds}s`;
+    }
+    return text;
+}
+
+function cancelDownload() {
+    if (!currentDownloadId) return;
+    
+    fetch(`/download/${currentDownloadId}`, { method: 'DELETE' })
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            checkStatus();
+        })
+        .catch(error => {
+            showError(error.message);
+        });
+}
+
 function updateStatus(status, message) {
     const statusIndicator = document.getElementById('statusIndicator');
     const statusMessage = document.getElementById('statusMessage');
@@ -131,12 +221,18 @@ function updateStatus(status, message) {
 function downloadFile() {
     if (!currentDownloadId) return;
     
-    window.location.href = `/download-file/${currentDownloadId}`;
+    if (currentStatus === 'completed') {
+        window.location.href = `/download-file/${currentDownloadId}`;
+    } else {
+        window.location.href = `/stream/${currentDownloadId}`;
+    }
 }
 
 function newDownload() {
     // Reset everything
+    stopStatusChecking();
     currentDownloadId = null;
+    currentStatus = null;
     
     // Clear URL input
     document.getElementById('teraboxUrl').value = '';
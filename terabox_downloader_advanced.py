@@ -1,70 +1,210 @@
 import requests
 import re
 import os
-import json
 import time
 import random
-from urllib.parse import unquote, urlparse, parse_qs
+import codecs
+import html
+import hashlib
+from urllib.parse import unquote, urlparse, parse_qs, urlencode
 import urllib3
-from requests.adapters import HTTPAdapter
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from functools import partial
+from download_checkpoint import DownloadCheckpoint
+from connection_manager import get_connection_manager
+from progress_meter import ProgressMeter
+from content_store import ContentHasher
+from chunk_reader import AdaptiveReader
+from page_scanner import scanner, find_url_in_json, find_md5_in_json, find_entries_in_json, StreamScan
+from metrics import DISABLED
 
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+class LinkExpiredError(Exception):
+    """The signed download link was rejected (HTTP 403/410) and must be re-resolved"""
+
+class DownloadCancelled(Exception):
+    """The caller set the cancel event while the download was running"""
+
+def extract_share_code(url):
+    """Extract share code from TeraBox URL"""
+    patterns = [
+        r'/s/([a-zA-Z0-9_-]+)',
+        r'share/([a-zA-Z0-9_-]+)',
+        r'/([a-zA-Z0-9_-]{10,})',
+    ]
+    
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/121.0',
+]
+
+MOBILE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Linux; Android 10; SM-G981B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.162 Mobile Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+}
+
+# Headers of the XHR calls the share page makes to TeraBox's APIs
+API_HEADERS = {
+    'Referer': 'https://www.terabox.com/',
+    'X-Requested-With': 'XMLHttpRequest',
+}
+
+# Entries per share-list page, and the most files taken from one share
+SHARE_LIST_PAGE_SIZE = 100
+MAX_SHARE_FILES = 10000
+# Most share-list requests for one share: room for MAX_SHARE_FILES plus the folders holding them
+MAX_SHARE_LIST_PAGES = 2 * MAX_SHARE_FILES // SHARE_LIST_PAGE_SIZE
+
+# Folder inside the download folder holding in-progress downloads, see partial_path
+PARTIAL_FOLDER = 'partial'
+
+def partial_path(download_folder, share_url=None, share_path=None, download_url=None, total_size=None):
+    """Where an in-progress download is written, under <download_folder>/partial.
+    
+    Named after the file it holds (share and path inside it, or else the link's
+    path and size) rather than its filename, so a restart resumes the same file
+    and two different files with the same name never share a partial file.
+    """
+    if share_url:
+        key = f'share:{extract_share_code(share_url) or share_url}:{share_path or ""}'
+    else:
+        parsed = urlparse(download_url or '')
+        key = f'link:{parsed.netloc}{parsed.path}:{total_size}'
+    return os.path.join(download_folder, PARTIAL_FOLDER, hashlib.sha256(key.encode('utf-8')).hexdigest()[:32])
+
+def browser_headers():
+    """Desktop browser headers with a random user agent"""
+    return {
+        'User-Agent': random.choice(USER_AGENTS),
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'none',
+        'Cache-Control': 'max-age=0',
+    }
+
 class TeraBoxDownloaderAdvanced:
-    def __init__(self):
+    # Share API hosts: the main site, then its mirror (benchmarks point both at a stand-in)
+    api_hosts = ('https://www.terabox.com', 'https://www.1024tera.com')
+    
+    def __init__(self, segments=4, min_segment_size=8 * 1024 * 1024, retries=3, max_link_refreshes=3,
+                 connection_manager=None, resolution_cache=None, hedged=False, extraction_deadline=30,
+                 request_delay=2.0, method_stats=None, stream_pages=True, progress_callback=None,
+                 progress_interval=0.5, space_check=None, metrics=None, content_store=None):
+        # Parallel range requests per file; files smaller than two segments use one stream
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        # Resume attempts from the on-disk checkpoint before giving up
+        self.retries = retries
+        # Times an expired dlink may be re-resolved from the share URL per download
+        self.max_link_refreshes = max_link_refreshes
+        # Optional ResolutionCache shared between downloaders; hits skip extraction
+        self.resolution_cache = resolution_cache
+        
+        # Hedged mode races all methods and API endpoints against one deadline
+        self.hedged = hedged
+        self.extraction_deadline = extraction_deadline
+        # Politeness: minimum spacing in seconds between requests to TeraBox pages/APIs
+        self.request_delay = request_delay
+        self._next_request_at = 0.0
+        self._delay_lock = threading.Lock()
+        self._deadline = None
+        self._extraction_done = threading.Event()
+        # Optional MethodStats shared between downloaders; reorders methods and patterns per domain
+        self.method_stats = method_stats
+        self._stats_domain = ''
+        # Scan share pages while they download and stop reading once a link is found
+        self.stream_pages = stream_pages
+        
+        # Set by download_file; checked between chunks so a job can be cancelled
+        self.cancel_event = None
+        # Path inside the share of the file being downloaded, for one file of a
+        # folder share; expired links are then refreshed from a new listing
+        self.share_path = None
+        
+        # Called with bytes done, total, speed and ETA at most every progress_interval seconds
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self._meter = None
+        self._next_print = 0.0
+        
+        # Called with (filepath, total_size) before any bytes are written once the
+        # size is known; raises to refuse a transfer that would not fit on disk
+        self.space_check = space_check
+        
+        # Metrics receiving stage timings and HTTP statuses; DISABLED does nothing
+        self.metrics = metrics or DISABLED
+        
+        # Optional ContentStore taking finished files; without one they are moved
+        # to their filename in the download folder
+        self.content_store = content_store
+        
+        # Live view of the transfer for readers following the partial file:
+        # transfer_filepath is set once the file exists, transfer_state ends as
+        # 'completed' or 'failed'
+        self.transfer_filepath = None
+        self.transfer_total = 0
+        self.transfer_state = None
+        self._checkpoint = None
+        self._streamed_bytes = 0
+        self._hasher = None
+        
         self.session = requests.Session()
         self.session.verify = False
         
-        # Add retry strategy
-        adapter = HTTPAdapter(max_retries=3)
-        self.session.mount('http://', adapter)
-        self.session.mount('https://', adapter)
+        # Borrow the process-wide keep-alive pools (with their retry strategy);
+        # headers set by update_headers stay on this job's session
+        (connection_manager or get_connection_manager()).mount(self.session)
+        if self.metrics.enabled:
+            self.session.hooks['response'].append(self.metrics.requests_hook)
         
         self.update_headers()
     
     def update_headers(self):
         """Update headers with random user agent"""
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/121.0',
-        ]
-        
-        self.session.headers.update({
-            'User-Agent': random.choice(user_agents),
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Cache-Control': 'max-age=0',
-        })
+        self.session.headers.update(browser_headers())
     
     def extract_file_info(self, terabox_url):
         """Extract file information using multiple methods"""
         try:
             print(f"🔍 Processing URL: {terabox_url}")
             
-            # Method 1: Direct page analysis
-            result = self._method_direct_analysis(terabox_url)
-            if result['success']:
-                return result
+            share_code = self._extract_share_code(terabox_url)
+            if self.resolution_cache and share_code:
+                cached = self.resolution_cache.get(share_code)
+                if cached:
+                    print(f"⚡ Using cached resolution for {share_code}")
+                    cached['success'] = True
+                    return cached
             
-            # Method 2: API endpoint discovery
-            result = self._method_api_discovery(terabox_url)
-            if result['success']:
-                return result
+            if self.method_stats:
+                self._stats_domain = self.method_stats.domain_of(terabox_url)
+            
+            if self.hedged:
+                result = self._extract_hedged(terabox_url, share_code)
+            else:
+                result = self._extract_sequential(terabox_url)
             
-            # Method 3: Mobile user agent approach
-            result = self._method_mobile_approach(terabox_url)
             if result['success']:
+                if self.resolution_cache and share_code:
+                    self.resolution_cache.put(share_code, result)
                 return result
             
             return {
@@ -78,58 +218,121 @@ class TeraBoxDownloaderAdvanced:
                 'error': f'Extraction failed: {str(e)}'
             }
     
+    def _extract_sequential(self, terabox_url):
+        """Try each method in turn, stopping at the first success"""
+        self._deadline = None
+        self._extraction_done = threading.Event()
+        
+        methods = self._ordered([
+            ('direct', self._method_direct_analysis),
+            ('api', self._method_api_discovery),
+            ('mobile', self._method_mobile_approach),
+        ])
+        for name, method in methods:
+            result = self._attempt(name, method, terabox_url)
+            if result['success']:
+                return result
+        return {'success': False}
+    
+    def _extract_hedged(self, terabox_url, share_code):
+        """Race every method and API endpoint under one deadline; the first valid result wins"""
+        self._deadline = time.monotonic() + self.extraction_deadline
+        self._extraction_done = threading.Event()
+        
+        tasks = [('direct', self._method_direct_analysis)]
+        if share_code:
+            tasks += [
+                (self._endpoint_name(api_url), partial(self._probe_api_endpoint, api_url))
+                for api_url in self._api_endpoints(share_code)
+            ]
+        tasks.append(('mobile', self._method_mobile_approach))
+        
+        # Historically fastest paths get the earliest politeness slots
+        tasks = self._ordered(tasks)
+        
+        pool = ThreadPoolExecutor(max_workers=len(tasks))
+        futures = [pool.submit(self._attempt, name, task, terabox_url) for name, task in tasks]
+        try:
+            for future in as_completed(futures, timeout=max(0, self._deadline - time.monotonic())):
+                result = future.result()
+                if result['success']:
+                    return result
+        except FuturesTimeoutError:
+            print(f"⏱️ Extraction deadline of {self.extraction_deadline}s reached")
+        finally:
+            # Losers that have not sent their request yet give up; in-flight ones hit the deadline timeout
+            self._extraction_done.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        return {'success': False}
+    
+    def _ordered(self, candidates):
+        """Order (name, value) pairs by observed performance on the current domain"""
+        if not self.method_stats:
+            return candidates
+        return self.method_stats.order(self._stats_domain, candidates, key=lambda candidate: candidate[0])
+    
+    def _attempt(self, name, method, url):
+        """Run one extraction method or endpoint probe and record how it did"""
+        start = time.monotonic()
+        with self.metrics.span(self._stage_of(name), name) as span:
+            result = method(url)
+            span.outcome = 'skipped' if result.get('skipped') else 'success' if result['success'] else 'failure'
+        if self.method_stats and not result.get('skipped'):
+            self.method_stats.record(self._stats_domain, name, result['success'], time.monotonic() - start)
+        return result
+    
+    def _stage_of(self, name):
+        """Metrics stage of an extraction attempt: an API endpoint probe or a whole method"""
+        return 'api_probe' if name.startswith('api:') else 'method'
+    
+    def _record_patterns(self, prefix, tried, winner, elapsed):
+        """Record hits and misses of the patterns searched on one page.
+        
+        Names listed after the winner found a link too, so they count as hits.
+        """
+        if not self.method_stats:
+            return
+        hits = set(tried[tried.index(winner):]) if winner in tried else set()
+        for name in tried:
+            self.method_stats.record(self._stats_domain, f'{prefix}/{name}', name in hits, elapsed / len(tried))
+    
+    def _polite_delay(self):
+        """Wait for this request's slot, keeping requests request_delay seconds apart.
+        
+        Returns False if the extraction already finished and the request should be skipped.
+        """
+        with self._delay_lock:
+            now = time.monotonic()
+            start = max(now, self._next_request_at)
+            self._next_request_at = start + self.request_delay
+        
+        if start > now:
+            if self._deadline and start >= self._deadline:
+                return False
+            time.sleep(start - now)
+        return not self._extraction_done.is_set()
+    
+    def _request_timeout(self, default=30):
+        """Per-request timeout, clipped to the extraction deadline in hedged mode"""
+        if self._deadline is None:
+            return default
+        return max(1, min(default, self._deadline - time.monotonic()))
+    
     def _method_direct_analysis(self, url):
         """Method 1: Direct page analysis"""
         try:
             print("🔄 Trying Method 1: Direct page analysis...")
-            time.sleep(2)
-            
-            response = self.session.get(url, timeout=30, allow_redirects=True)
+            if not self._polite_delay():
+                return {'success': False, 'skipped': True}
             
-            # Look for common TeraBox patterns
-            patterns = [
-                r'window\.yunData\s*=\s*({[^;]+});',
-                r'window\.data\s*=\s*({[^;]+});',
-                r'"dlink"\s*:\s*"([^"]+)"',
-                r'"downloadUrl"\s*:\s*"([^"]+)"',
-                r'<meta property="og:video" content="([^"]+)"',
-                r'<video[^>]+src="([^"]+)"',
-            ]
-            
-            for pattern in patterns:
-                matches = re.findall(pattern, response.text, re.DOTALL)
-                for match in matches:
-                    if isinstance(match, tuple):
-                        match = match[0]
-                    
-                    if match.startswith('{'):
-                        # JSON data found
-                        try:
-                            data = json.loads(match)
-                            download_url = self._find_url_in_json(data)
-                            if download_url:
-                                filename = self._extract_filename(response.text)
-                                return {
-                                    'success': True,
-                                    'filename': filename,
-                                    'final_url': response.url,
-                                    'content': response.text,
-                                    'download_url': download_url
-                                }
-                        except:
-                            continue
-                    elif match.startswith('http'):
-                        # Direct URL found
-                        filename = self._extract_filename(response.text)
-                        return {
-                            'success': True,
-                            'filename': filename,
-                            'final_url': response.url,
-                            'content': response.text,
-                            'download_url': match
-                        }
-            
-            return {'success': False}
+            # Look for common TeraBox patterns; the weaker video tags alone do not end a streamed fetch
+            return self._scan_page(
+                'direct',
+                scanner.DIRECT_PATTERNS,
+                url,
+                wanted=('yunData', 'window.data', 'dlink', 'downloadUrl')
+            )
             
         except Exception as e:
             print(f"❌ Method 1 failed: {e}")
@@ -139,7 +342,6 @@ class TeraBoxDownloaderAdvanced:
         """Method 2: API endpoint discovery"""
         try:
             print("🔄 Trying Method 2: API discovery...")
-            time.sleep(2)
             
             # Extract share code from URL
             share_code = self._extract_share_code(url)
@@ -147,34 +349,13 @@ class TeraBoxDownloaderAdvanced:
                 return {'success': False}
             
             # Try different API endpoints
-            api_endpoints = [
-                f"https://www.terabox.com/api/shorturlinfo?app_id=250528&shorturl={share_code}",
-                f"https://www.terabox.com/share/list?app_id=250528&shorturl={share_code}",
-                f"https://www.1024tera.com/api/shorturlinfo?app_id=250528&shorturl={share_code}",
-            ]
-            
-            for api_url in api_endpoints:
-                try:
-                    headers = {
-                        'Referer': 'https://www.terabox.com/',
-                        'X-Requested-With': 'XMLHttpRequest',
-                    }
-                    
-                    response = self.session.get(api_url, headers=headers, timeout=30)
-                    if response.status_code == 200:
-                        data = response.json()
-                        download_url = self._find_url_in_json(data)
-                        if download_url:
-                            filename = data.get('server_filename', f'file_{int(time.time())}.mp4')
-                            return {
-                                'success': True,
-                                'filename': filename,
-                                'final_url': url,
-                                'content': response.text,
-                                'download_url': download_url
-                            }
-                except:
-                    continue
+            endpoints = self._ordered([
+                (self._endpoint_name(api_url), api_url) for api_url in self._api_endpoints(share_code)
+            ])
+            for name, api_url in endpoints:
+                result = self._attempt(name, partial(self._probe_api_endpoint, api_url), url)
+                if result['success']:
+                    return result
             
             return {'success': False}
             
@@ -182,95 +363,133 @@ class TeraBoxDownloaderAdvanced:
             print(f"❌ Method 2 failed: {e}")
             return {'success': False}
     
+    def _api_endpoints(self, share_code):
+        """Share-info API endpoints to try for share_code"""
+        main, mirror = self.api_hosts
+        return [
+            f"{main}/api/shorturlinfo?app_id=250528&shorturl={share_code}",
+            f"{main}/share/list?app_id=250528&shorturl={share_code}",
+            f"{mirror}/api/shorturlinfo?app_id=250528&shorturl={share_code}",
+        ]
+    
+    def _endpoint_name(self, api_url):
+        """Stats name of an API endpoint: host and path without the share code"""
+        parsed = urlparse(api_url)
+        return f'api:{parsed.netloc}{parsed.path}'
+    
+    def _probe_api_endpoint(self, api_url, url):
+        """Query one share-info API endpoint for a download URL"""
+        try:
+            if not self._polite_delay():
+                return {'success': False, 'skipped': True}
+            
+            response = self.session.get(api_url, headers=API_HEADERS, timeout=self._request_timeout())
+            if response.status_code == 200:
+                data = response.json()
+                download_url = self._find_url_in_json(data)
+                if download_url:
+                    filename = data.get('server_filename', f'file_{int(time.time())}.mp4')
+                    return {
+                        'success': True,
+                        'filename': filename,
+                        'final_url': url,
+                        'download_url': download_url,
+                        'md5': find_md5_in_json(data)
+                    }
+        except Exception:
+            pass
+        return {'success': False}
+    
     def _method_mobile_approach(self, url):
         """Method 3: Mobile user agent approach"""
         try:
             print("🔄 Trying Method 3: Mobile approach...")
-            time.sleep(2)
-            
-            # Switch to mobile user agent
-            mobile_headers = {
-                'User-Agent': 'Mozilla/5.0 (Linux; Android 10; SM-G981B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.162 Mobile Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            }
-            
-            response = self.session.get(url, headers=mobile_headers, timeout=30)
+            if not self._polite_delay():
+                return {'success': False, 'skipped': True}
             
             # Look for mobile-specific patterns
-            patterns = [
-                r'data-url="([^"]+)"',
-                r'data-file="([^"]+)"',
-                r'download-link="([^"]+)"',
-            ]
-            
-            for pattern in patterns:
-                matches = re.findall(pattern, response.text)
-                for match in matches:
-                    if match.startswith('http'):
-                        filename = self._extract_filename(response.text)
-                        return {
-                            'success': True,
-                            'filename': filename,
-                            'final_url': response.url,
-                            'content': response.text,
-                            'download_url': match
-                        }
-            
-            return {'success': False}
+            return self._scan_page('mobile', scanner.MOBILE_PATTERNS, url, headers=MOBILE_HEADERS)
             
         except Exception as e:
             print(f"❌ Method 3 failed: {e}")
             return {'success': False}
     
+    def _scan_page(self, prefix, pattern_names, url, headers=None, wanted=None):
+        """Fetch a page and search it with the precompiled patterns, most productive first.
+        
+        In streaming mode the page is decoded and scanned chunk by chunk and the
+        connection is closed as soon as a link and a filename are found. Only the
+        extracted fields are returned, never the page itself.
+        """
+        names = [name for name, _ in self._ordered([(name, None) for name in pattern_names])]
+        response = self.session.get(
+            url,
+            headers=headers,
+            timeout=self._request_timeout(),
+            allow_redirects=True,
+            stream=self.stream_pages
+        )
+        
+        scan_start = time.monotonic()
+        if self.stream_pages:
+            name, download_url, tried, filename, md5 = self._stream_scan(response, names, wanted)
+        else:
+            name, download_url, tried = scanner.find_link(response.text, names)
+            filename = scanner.find_filename(response.text) if download_url else None
+            md5 = scanner.find_md5(response.text) if download_url else None
+        self._record_patterns(prefix, tried, name, time.monotonic() - scan_start)
+        
+        if not download_url:
+            return {'success': False}
+        
+        return {
+            'success': True,
+            'filename': self._clean_filename(filename),
+            'final_url': response.url,
+            'download_url': download_url,
+            'md5': md5
+        }
+    
+    def _stream_scan(self, response, names, wanted=None):
+        """Feed a streamed response to a StreamScan, stopping the transfer once it has enough"""
+        # Same default as browsers for HTML without a declared charset, rather than requests' ISO-8859-1
+        content_type = response.headers.get('content-type', '').lower()
+        encoding = response.encoding if 'charset' in content_type else 'utf-8'
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        
+        scan = StreamScan(names, wanted)
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if scan.feed(decoder.decode(chunk)):
+                    break
+            else:
+                scan.feed(decoder.decode(b'', final=True), final=True)
+        finally:
+            response.close()
+        
+        name, download_url, tried = scan.result()
+        return name, download_url, tried, scan.filename(), scan.md5
+    
     def _extract_share_code(self, url):
         """Extract share code from TeraBox URL"""
-        patterns = [
-            r'/s/([a-zA-Z0-9_-]+)',
-            r'share/([a-zA-Z0-9_-]+)',
-            r'/([a-zA-Z0-9_-]{10,})',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
-        return None
+        return extract_share_code(url)
     
     def _find_url_in_json(self, data):
         """Recursively find download URL in JSON data"""
-        if isinstance(data, dict):
-            for key, value in data.items():
-                if key in ['dlink', 'download_url', 'direct_link', 'url'] and isinstance(value, str) and value.startswith('http'):
-                    return value
-                if isinstance(value, (dict, list)):
-                    result = self._find_url_in_json(value)
-                    if result:
-                        return result
-        elif isinstance(data, list):
-            for item in data:
-                result = self._find_url_in_json(item)
-                if result:
-                    return result
-        return None
+        return find_url_in_json(data)
     
     def _extract_filename(self, html_content):
         """Extract filename from HTML content"""
-        patterns = [
-            r'<title>([^<]+)</title>',
-            r'"server_filename":"([^"]+)"',
-            r'"filename":"([^"]+)"',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, html_content)
-            if match:
-                filename = match.group(1).strip()
-                if filename:
-                    filename = unquote(filename)
-                    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-                    if not re.search(r'\.[a-zA-Z0-9]{2,4}$', filename):
-                        filename += '.mp4'
-                    return filename
+        return self._clean_filename(scanner.find_filename(html_content))
+    
+    def _clean_filename(self, filename):
+        """Make a raw filename hint safe to use as a local file name"""
+        if filename:
+            filename = html.unescape(unquote(filename.strip()))
+            filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
+            if not re.search(r'\.[a-zA-Z0-9]{2,4}$', filename):
+                filename += '.mp4'
+            return filename
         
         return f'terabox_file_{int(time.time())}.mp4'
     
@@ -291,70 +510,216 @@ class TeraBoxDownloaderAdvanced:
     
     def _find_url_in_content(self, html_content):
         """Find download URL in existing HTML content"""
-        patterns = [
-            r'"dlink"\s*:\s*"([^"]+)"',
-            r'"downloadUrl"\s*:\s*"([^"]+)"',
-            r'window\.yunData\s*=\s*({[^;]+});',
-        ]
+        _, download_url, _ = scanner.find_link(html_content, ('dlink', 'downloadUrl', 'yunData'))
+        return download_url
+    
+    def list_files(self, terabox_url, max_files=MAX_SHARE_FILES):
+        """Every file in a share, walking its folders through the share-list API.
+        
+        Each file is shaped like an extract_file_info result, plus its size and
+        its path in the share. Files in subfolders are named after their path
+        below the share root, so names stay unique in the download folder.
+        """
+        share_code = self._extract_share_code(terabox_url)
+        if not share_code:
+            return {'success': False, 'error': 'No share code in the URL'}
         
-        for pattern in patterns:
-            matches = re.findall(pattern, html_content, re.DOTALL)
-            for match in matches:
-                if match.startswith('{'):
-                    try:
-                        data = json.loads(match)
-                        return self._find_url_in_json(data)
-                    except:
-                        continue
-                elif match.startswith('http'):
-                    return match
+        cached = self._cached_listing(share_code)
+        if cached:
+            return cached
+        
+        print(f"📂 Listing share: {terabox_url}")
+        self._deadline = None
+        self._extraction_done = threading.Event()
+        try:
+            files = []
+            # Breadth first: (folder path or None for the root, name prefix)
+            folders = [(None, '')]
+            listed = set()
+            pages_left = MAX_SHARE_LIST_PAGES
+            while folders and len(files) < max_files and pages_left > 0:
+                directory, prefix = folders.pop(0)
+                entries, pages = self._list_directory(share_code, directory, max_files - len(files), pages_left)
+                pages_left -= pages
+                self._take_entries(entries, prefix, terabox_url, files, folders, listed)
+        except Exception as e:
+            return {'success': False, 'error': f'Listing failed: {str(e)}'}
+        
+        if not files:
+            return {'success': False, 'error': 'The share lists no files'}
+        if self.resolution_cache:
+            self.resolution_cache.put_listing(share_code, files[:max_files])
+        return {'success': True, 'files': files[:max_files]}
+    
+    def _cached_listing(self, share_code):
+        """list_files result from the resolution cache: a cached listing, or a cached single-file resolution"""
+        if not self.resolution_cache:
+            return None
+        files = self.resolution_cache.get_listing(share_code)
+        if files:
+            print(f"⚡ Using cached listing for {share_code}")
+            return {'success': True, 'files': files}
+        cached = self.resolution_cache.get(share_code)
+        if cached:
+            print(f"⚡ Using cached resolution for {share_code}")
+            return {'success': True, 'files': [dict(cached, success=True, path=None)]}
         return None
     
-    def download_file(self, download_url, filename, download_folder, chunk_size=8192):
-        """Download the file with proper headers"""
+    def _list_directory(self, share_code, directory, max_files=MAX_SHARE_FILES, max_pages=MAX_SHARE_LIST_PAGES):
+        """Entries of one share folder, following the list's pages; returns (entries, pages requested).
+        
+        Stops at a short page, once max_files files are listed, after max_pages,
+        or when a page repeats the previous one (an API ignoring page).
+        """
+        entries = []
+        previous = None
+        for page in range(1, max_pages + 1):
+            self._polite_delay()
+            with self.metrics.span('listing', 'share/list'):
+                response = self.session.get(
+                    self._share_list_url(share_code, directory, page),
+                    headers=API_HEADERS,
+                    timeout=self._request_timeout()
+                )
+                response.raise_for_status()
+                batch = find_entries_in_json(response.json())
+            if self._last_list_page(entries, batch, previous, max_files):
+                return entries, page
+            previous = batch
+        return entries, max_pages
+    
+    def _last_list_page(self, entries, batch, previous, max_files):
+        """Add a share-list page to entries; True if no further page should be requested"""
+        if batch == previous:
+            return True
+        entries.extend(batch)
+        files = sum(1 for entry in entries if str(entry.get('isdir', 0)) != '1')
+        return len(batch) < SHARE_LIST_PAGE_SIZE or files >= max_files
+    
+    def _take_entries(self, entries, prefix, share_url, files, folders, listed):
+        """Sort one folder's entries into files and subfolders still to list"""
+        for entry in entries:
+            name = entry.get('server_filename') or os.path.basename(entry.get('path') or '')
+            if not name:
+                continue
+            if str(entry.get('isdir', 0)) == '1':
+                # Without a path the API lists the root again; listed breaks folder cycles
+                path = entry.get('path')
+                if path and path not in listed:
+                    listed.add(path)
+                    folders.append((path, prefix + name + '/'))
+            else:
+                files.append(self._share_file(entry, prefix + name, share_url))
+    
+    def _share_list_url(self, share_code, directory=None, page=1):
+        """share/list URL for a folder of the share (its root when directory is None)"""
+        params = {'app_id': '250528', 'shorturl': share_code, 'page': page, 'num': SHARE_LIST_PAGE_SIZE}
+        if directory:
+            params['dir'] = directory
+        else:
+            params['root'] = 1
+        return f"{self.api_hosts[0]}/share/list?{urlencode(params)}"
+    
+    def _share_file(self, entry, name, share_url):
+        """File info for one share-list entry, named name"""
+        return {
+            'success': True,
+            'filename': self._clean_filename(name),
+            'final_url': share_url,
+            'download_url': entry.get('dlink') or None,
+            'md5': find_md5_in_json(entry),
+            'size': int(entry.get('size') or 0),
+            'path': entry.get('path'),
+        }
+    
+    def download_file(self, download_url, filename, download_folder, chunk_size=None, share_url=None,
+                      cancel_event=None, expected_md5=None, share_path=None):
+        """Download the file with proper headers, re-resolving the link from share_url if it expires.
+        
+        The content is hashed while it is written; the result carries its sha256,
+        and expected_md5 (from share metadata) is checked at the end. Reads are
+        sized to the measured throughput unless chunk_size fixes them. For one
+        file of a folder share, share_path is its path from list_files.
+        """
+        with self.metrics.span('transfer') as span:
+            result = self._download_file(download_url, filename, download_folder, chunk_size, share_url,
+                                         cancel_event, expected_md5, share_path)
+            span.outcome = self._transfer_outcome(result)
+        if result['success']:
+            self.metrics.transferred('transfer', result['file_size'], span.duration)
+        return result
+    
+    def _transfer_outcome(self, result):
+        """Metrics outcome of a download_file result"""
+        if result['success']:
+            return 'success'
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return 'cancelled'
+        return 'failure'
+    
+    def _download_file(self, download_url, filename, download_folder, chunk_size, share_url,
+                       cancel_event, expected_md5, share_path):
+        checkpoint = None
+        self.cancel_event = cancel_event
+        self.share_path = share_path
+        if self.progress_callback:
+            self._meter = ProgressMeter(self.progress_callback, interval=self.progress_interval)
         try:
-            filepath = os.path.join(download_folder, filename)
-            
             print(f"⬇️ Starting download: {filename}")
             print(f"🔗 From: {download_url}")
             
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Referer': 'https://www.terabox.com/',
-                'Accept': '*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Range': 'bytes=0-',
-            }
+            # Probe size and range support to decide between ranged and single-stream
+            try:
+                probe = self._probe_download(download_url)
+            except LinkExpiredError:
+                if not share_url:
+                    raise
+                print("🔑 Download link already expired, resolving a fresh one...")
+                download_url = self._fresh_download_url(share_url)
+                probe = self._probe_download(download_url)
             
-            response = self.session.get(
-                download_url,
-                stream=True,
-                timeout=60,
-                headers=headers
-            )
+            filepath = partial_path(download_folder, share_url, share_path, download_url, probe and probe['total_size'])
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            
+            if probe and probe['total_size'] and self.space_check:
+                self.space_check(filepath, probe['total_size'])
+            
+            algorithms = ('sha256', 'md5') if expected_md5 else ('sha256',)
+            if probe and probe['accepts_ranges'] and probe['total_size']:
+                checkpoint = self._open_checkpoint(download_url, filepath, probe)
+                self._checkpoint = checkpoint
+                self._hasher = ContentHasher(filepath, algorithms)
+                self._start_transfer(filepath, probe['total_size'])
+                downloaded = self._download_ranged(download_url, checkpoint, chunk_size, share_url)
+            else:
+                self._hasher = ContentHasher(filepath, algorithms)
+                result = self._download_single(download_url, filepath, chunk_size)
+                if not result['success']:
+                    self.transfer_state = 'failed'
+                    self._hasher.close()
+                    return result
+                downloaded = result['downloaded']
+            
+            print(f"\n✅ Download completed: {downloaded} bytes")
+            digests = self._hasher.finish(downloaded)
             
-            if response.status_code != 200:
+            if checkpoint:
+                checkpoint.remove()
+            
+            if expected_md5 and digests['md5'] != expected_md5.lower():
+                self.transfer_state = 'failed'
+                os.remove(filepath)
                 return {
                     'success': False,
-                    'error': f'HTTP {response.status_code}: {response.reason}'
+                    'error': f'MD5 mismatch: expected {expected_md5}, got {digests["md5"]}'
                 }
             
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(filepath, 'wb') as file:
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        file.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        if total_size:
-                            progress = (downloaded / total_size) * 100
-                            print(f"\r📈 Progress: {progress:.1f}%", end='', flush=True)
-            
-            print(f"\n✅ Download completed: {downloaded} bytes")
+            self._report_progress(downloaded, downloaded, force=True)
+            self.transfer_total = downloaded
+            self.transfer_state = 'completed'
             
             if downloaded == 0:
+                self.transfer_state = 'failed'
                 if os.path.exists(filepath):
                     os.remove(filepath)
                 return {
@@ -364,15 +729,355 @@ class TeraBoxDownloaderAdvanced:
             
             return {
                 'success': True,
-                'filepath': filepath,
-                'file_size': downloaded
+                'filepath': self._store_finished(filepath, filename, download_folder, digests['sha256']),
+                'file_size': downloaded,
+                'sha256': digests['sha256']
             }
             
         except Exception as e:
             print(f"❌ Download error: {e}")
-            if 'filepath' in locals() and os.path.exists(filepath):
+            self.transfer_state = 'failed'
+            if self._hasher:
+                self._hasher.close()
+            if checkpoint:
+                # Keep the partial file so the next attempt resumes instead of restarting
+                checkpoint.flush()
+                print(f"💾 Kept partial file: {checkpoint.completed_bytes()} of {checkpoint.total_size} bytes")
+            elif ('filepath' in locals() and os.path.exists(filepath) and
+                  not os.path.exists(filepath + DownloadCheckpoint.SUFFIX)):
+                # A partial file with a checkpoint from an earlier attempt stays resumable
                 os.remove(filepath)
             return {
                 'success': False,
                 'error': str(e)
-            }
\ No newline at end of file
+            }
+    
+    def _store_finished(self, filepath, filename, download_folder, sha256):
+        """Move a finished partial file to its final place; returns that path"""
+        if self.content_store:
+            return self.content_store.add(filepath, sha256)
+        
+        # Never overwrite: a file of the same name may already be there
+        stem, extension = os.path.splitext(os.path.join(download_folder, filename))
+        target = stem + extension
+        copy = 1
+        while True:
+            try:
+                # link() fails rather than replacing an existing file
+                os.link(filepath, target)
+                break
+            except FileExistsError:
+                target = f'{stem} ({copy}){extension}'
+                copy += 1
+        os.remove(filepath)
+        return target
+    
+    def _start_transfer(self, filepath, total_size):
+        """Publish the partial file to readers; called once it exists on disk"""
+        self.transfer_total = total_size
+        self.transfer_state = 'running'
+        self.transfer_filepath = filepath
+    
+    def available_bytes(self):
+        """Bytes from the start of the partial file that are on disk, without gaps.
+        
+        Segments land out of order, so readers streaming the file may only go
+        as far as the contiguous prefix.
+        """
+        checkpoint = self._checkpoint
+        if checkpoint:
+            return checkpoint.contiguous_bytes()
+        return self._streamed_bytes
+    
+    def _reader(self, response, chunk_size):
+        """Body chunks of response, read into a reused buffer"""
+        if chunk_size:
+            return AdaptiveReader(response, min_size=chunk_size, max_size=chunk_size)
+        return AdaptiveReader(response)
+    
+    def _write(self, file, data):
+        """Write all of data to an unbuffered file, so readers following it see it at once"""
+        written = file.write(data)
+        while written < len(data):
+            written += file.write(data[written:])
+    
+    def _report_progress(self, downloaded, total_size, force=False):
+        # Printed by time rather than per chunk: a flushed stdout write per chunk is not free
+        now = time.monotonic()
+        if total_size and not force and now >= self._next_print:
+            self._next_print = now + self.progress_interval
+            print(f"\r📈 Progress: {downloaded / total_size * 100:.1f}%", end='', flush=True)
+        if self._meter:
+            self._meter.update(downloaded, total_size or None, force=force)
+    
+    def _check_cancelled(self, response):
+        """Abort the transfer if the caller's cancel event is set"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            response.close()
+            raise DownloadCancelled('Download cancelled')
+    
+    def _download_headers(self, byte_range='bytes=0-'):
+        """Headers for requests against the download host"""
+        return {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Referer': 'https://www.terabox.com/',
+            'Accept': '*/*',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Range': byte_range,
+        }
+    
+    def _probe_download(self, download_url):
+        """Probe Content-Length, Accept-Ranges and validators of the download URL"""
+        try:
+            # A one-byte ranged GET works on signed links that reject HEAD
+            response = self.session.get(
+                download_url,
+                stream=True,
+                timeout=60,
+                headers=self._download_headers('bytes=0-0')
+            )
+            if response.status_code == 206:
+                # Drain the single byte so the keep-alive connection goes back to the pool
+                response.content
+            response.close()
+            
+            if response.status_code in (403, 410):
+                raise LinkExpiredError(f'HTTP {response.status_code}: {response.reason}')
+            
+            probe = {
+                'etag': response.headers.get('etag'),
+                'last_modified': response.headers.get('last-modified'),
+            }
+            
+            if response.status_code == 206:
+                total = response.headers.get('content-range', '').rsplit('/', 1)[-1]
+                if total.isdigit():
+                    probe.update(total_size=int(total), accepts_ranges=True)
+                    return probe
+                return None
+            
+            if response.status_code == 200:
+                probe.update(
+                    total_size=int(response.headers.get('content-length', 0)),
+                    accepts_ranges=response.headers.get('accept-ranges', '').lower() == 'bytes'
+                )
+                return probe
+        except LinkExpiredError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Range probe failed: {e}")
+        return None
+    
+    def _open_checkpoint(self, download_url, filepath, probe):
+        """Resume from an existing checkpoint for filepath, or start a fresh one"""
+        checkpoint = DownloadCheckpoint.load(filepath)
+        if checkpoint and checkpoint.matches(probe['total_size'], probe['etag'], probe['last_modified']):
+            checkpoint.url = download_url
+            print(f"♻️ Resuming: {checkpoint.completed_bytes()} of {checkpoint.total_size} bytes already on disk")
+            return checkpoint
+        
+        # Preallocate so every range can be written straight to its own offset
+        with open(filepath, 'wb') as file:
+            file.truncate(probe['total_size'])
+        
+        checkpoint = DownloadCheckpoint(
+            filepath,
+            download_url,
+            probe['total_size'],
+            etag=probe['etag'],
+            last_modified=probe['last_modified']
+        )
+        checkpoint.flush()
+        return checkpoint
+    
+    def _segment_count(self, total_size):
+        """Number of segments to split total_size bytes into"""
+        if total_size <= 0:
+            return 1
+        return max(1, min(self.segments, total_size // self.min_segment_size))
+    
+    def _download_single(self, download_url, filepath, chunk_size):
+        """Single-stream download over one connection, for hosts without range support"""
+        with self.metrics.span('ttfb', 'single'):
+            response = self.session.get(
+                download_url,
+                stream=True,
+                timeout=60,
+                headers=self._download_headers()
+            )
+        
+        if response.status_code not in (200, 206):
+            return {
+                'success': False,
+                'error': f'HTTP {response.status_code}: {response.reason}'
+            }
+        
+        total_size = int(response.headers.get('content-length', 0))
+        downloaded = 0
+        
+        if total_size and self.space_check:
+            try:
+                self.space_check(filepath, total_size)
+            except Exception:
+                response.close()
+                raise
+        
+        with open(filepath, 'wb', buffering=0) as file:
+            self._start_transfer(filepath, total_size)
+            for chunk in self._reader(response, chunk_size):
+                self._check_cancelled(response)
+                self._write(file, chunk)
+                self._hasher.update(downloaded, chunk, downloaded + len(chunk))
+                downloaded += len(chunk)
+                self._streamed_bytes = downloaded
+                self._report_progress(downloaded, total_size)
+        
+        return {'success': True, 'downloaded': downloaded}
+    
+    def _download_ranged(self, download_url, checkpoint, chunk_size, share_url=None):
+        """Fetch the ranges still missing from the checkpoint, retrying from where each attempt stopped"""
+        attempt = 0
+        refreshes = 0
+        
+        while True:
+            missing = checkpoint.missing_ranges()
+            if not missing:
+                break
+            
+            try:
+                self._download_segmented(download_url, checkpoint, missing, chunk_size)
+            except DownloadCancelled:
+                checkpoint.flush()
+                raise
+            except LinkExpiredError as e:
+                checkpoint.flush()
+                if not share_url or refreshes >= self.max_link_refreshes:
+                    raise
+                refreshes += 1
+                print(f"\n🔑 Download link expired ({e}), refreshing {refreshes}/{self.max_link_refreshes}...")
+                download_url = self._refresh_download_url(share_url, checkpoint)
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                checkpoint.flush()
+                print(f"\n🔁 Retry {attempt}/{self.retries} from byte checkpoint: {e}")
+                time.sleep(min(2 ** (attempt - 1), 10))
+        
+        checkpoint.flush()
+        if checkpoint.missing_ranges():
+            raise Exception('Download incomplete after retries')
+        return checkpoint.total_size
+    
+    def _fresh_download_url(self, share_url):
+        """Resolve a new signed download link for the original share URL"""
+        if self.share_path:
+            return self._listed_download_url(share_url)
+        
+        share_code = self._extract_share_code(share_url)
+        if self.resolution_cache and share_code:
+            # The cached link is the one that just expired
+            self.resolution_cache.invalidate(share_code)
+        
+        result = self.extract_file_info(share_url)
+        if not result['success'] or not result.get('download_url'):
+            raise Exception('Could not refresh the expired download link')
+        return result['download_url']
+    
+    def _listed_download_url(self, share_url):
+        """Fresh link for the file at share_path, from a new listing of its share"""
+        share_code = self._extract_share_code(share_url)
+        if self.resolution_cache and share_code:
+            # The cached listing holds the link that just expired
+            self.resolution_cache.invalidate_listing(share_code)
+        
+        for file_info in self.list_files(share_url).get('files', []):
+            if file_info['path'] == self.share_path and file_info['download_url']:
+                return file_info['download_url']
+        raise Exception('Could not refresh the expired download link')
+    
+    def _refresh_download_url(self, share_url, checkpoint):
+        """Swap an expired link for a fresh one that still points at the same file"""
+        download_url = self._fresh_download_url(share_url)
+        
+        probe = self._probe_download(download_url)
+        if not probe or probe['total_size'] != checkpoint.total_size:
+            raise Exception('Refreshed download link points to a different file (size changed)')
+        
+        checkpoint.url = download_url
+        checkpoint.flush()
+        return download_url
+    
+    def _download_segmented(self, download_url, checkpoint, missing, chunk_size):
+        """Fetch the missing byte ranges in parallel, writing each at its offset in the file"""
+        remaining = sum(end - start for start, end in missing)
+        segment_count = self._segment_count(remaining)
+        piece_size = -(-remaining // segment_count)
+        
+        segments = []
+        for start, end in missing:
+            while start < end:
+                segments.append((start, min(start + piece_size, end)))
+                start = segments[-1][1]
+        
+        if len(segments) > 1:
+            print(f"🧩 Segmented download: {min(len(segments), self.segments)} connections")
+        
+        progress = {
+            'downloaded': checkpoint.total_size - remaining,
+            'lock': threading.Lock()
+        }
+        
+        with ThreadPoolExecutor(max_workers=min(len(segments), self.segments)) as pool:
+            futures = [
+                pool.submit(self._download_segment, download_url, checkpoint, start, end, chunk_size, progress)
+                for start, end in segments
+            ]
+            for future in as_completed(futures):
+                # Re-raise the first segment failure
+                future.result()
+    
+    def _download_segment(self, download_url, checkpoint, start, end, chunk_size, progress):
+        """Download bytes [start, end) into the checkpointed file at offset start"""
+        # Open-ended range for the tail, like a plain resume
+        byte_range = f'bytes={start}-' if end == checkpoint.total_size else f'bytes={start}-{end - 1}'
+        with self.metrics.span('ttfb', 'segment'):
+            response = self.session.get(
+                download_url,
+                stream=True,
+                timeout=60,
+                headers=self._download_headers(byte_range)
+            )
+        
+        if response.status_code in (403, 410):
+            response.close()
+            raise LinkExpiredError(f'HTTP {response.status_code}: {response.reason}')
+        
+        if response.status_code != 206:
+            response.close()
+            raise Exception(f'Segment {start}-{end - 1}: HTTP {response.status_code}: {response.reason}')
+        
+        position = start
+        
+        # Unbuffered: readers following the file trust add_range, so the bytes must be visible first
+        with open(checkpoint.filepath, 'r+b', buffering=0) as file:
+            file.seek(start)
+            for chunk in self._reader(response, chunk_size):
+                self._check_cancelled(response)
+                chunk = chunk[:end - position]
+                self._write(file, chunk)
+                checkpoint.add_range(position, position + len(chunk))
+                self._hasher.update(position, chunk, checkpoint.contiguous_bytes())
+                position += len(chunk)
+                
+                with progress['lock']:
+                    progress['downloaded'] += len(chunk)
+                    done = progress['downloaded']
+                self._report_progress(done, checkpoint.total_size)
+                
+                if position >= end:
+                    break
+        
+        response.close()
+        if position != end:
+            raise Exception(f'Segment {start}-{end - 1}: received {position - start} of {end - start} bytes')
@@ -0,0 +1,888 @@
+import asyncio
+import atexit
+import codecs
+import os
+import threading
+import time
+
+import aiohttp
+
+from terabox_downloader_advanced import (
+    TeraBoxDownloaderAdvanced, LinkExpiredError, DownloadCancelled, MOBILE_HEADERS, API_HEADERS,
+    SHARE_LIST_PAGE_SIZE, MAX_SHARE_FILES, MAX_SHARE_LIST_PAGES, browser_headers, partial_path
+)
+from download_checkpoint import DownloadCheckpoint
+from progress_meter import ProgressMeter
+from content_store import ContentHasher
+from page_scanner import scanner, find_url_in_json, find_md5_in_json, find_entries_in_json, StreamScan
+from metrics import DISABLED
+
+
+class AsyncEngine:
+    """One event loop on a background thread, shared by every AsyncTeraBoxDownloader.
+
+    All downloaders draw on the same keep-alive connector, and on two bounded
+    semaphores that cap the resolutions and body transfers in flight, so
+    thousands of jobs can be outstanding at once without one connection (or
+    thread) each.
+    """
+
+    def __init__(self, max_connections=1000, per_host_connections=0, dns_cache_ttl=300,
+                 max_resolutions=256, max_transfers=1024):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='download-event-loop', daemon=True)
+        self._thread.start()
+        # Loop-bound objects must be created on the loop
+        self.run(self._setup(max_connections, per_host_connections, dns_cache_ttl,
+                             max_resolutions, max_transfers)).result()
+        atexit.register(self.close)
+
+    async def _setup(self, max_connections, per_host_connections, dns_cache_ttl, max_resolutions, max_transfers):
+        # 0 means unlimited, as for aiohttp itself
+        self.connector = aiohttp.TCPConnector(
+            limit=max_connections,
+            limit_per_host=per_host_connections,
+            ttl_dns_cache=dns_cache_ttl,
+            ssl=False
+        )
+        self.resolve_slots = asyncio.BoundedSemaphore(max_resolutions)
+        self.transfer_slots = asyncio.BoundedSemaphore(max_transfers)
+
+    def run(self, coroutine):
+        """Schedule coroutine on the engine's loop from any thread; returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def downloader(self, **kwargs):
+        """An AsyncTeraBoxDownloader on this engine's connector and slots"""
+        return AsyncTeraBoxDownloader(
+            connector=self.connector,
+            resolve_slots=self.resolve_slots,
+            transfer_slots=self.transfer_slots,
+            **kwargs
+        )
+
+    def close(self):
+        """Close pooled connections and stop the loop"""
+        if not self.loop.is_running():
+            return
+        self.run(self.connector.close()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+class AsyncTeraBoxDownloader:
+    """asyncio counterpart of TeraBoxDownloaderAdvanced, with the same public API as coroutines.
+
+    Create it on the loop that will run it (see AsyncEngine.downloader) and
+    close() it when done. Chunk writes and hashing of in-order bytes stay on
+    the loop, as they cost about as much as receiving the chunk; anything that
+    can wait on the disk (reading back segments to hash, checkpoint flushes,
+    moving the finished file) runs on a worker thread, since every job shares
+    the loop.
+    """
+
+    api_hosts = TeraBoxDownloaderAdvanced.api_hosts
+
+    # Engine-independent helpers shared with the threaded downloader
+    _ordered = TeraBoxDownloaderAdvanced._ordered
+    _record_patterns = TeraBoxDownloaderAdvanced._record_patterns
+    _api_endpoints = TeraBoxDownloaderAdvanced._api_endpoints
+    _endpoint_name = TeraBoxDownloaderAdvanced._endpoint_name
+    _stage_of = TeraBoxDownloaderAdvanced._stage_of
+    _transfer_outcome = TeraBoxDownloaderAdvanced._transfer_outcome
+    _share_list_url = TeraBoxDownloaderAdvanced._share_list_url
+    _share_file = TeraBoxDownloaderAdvanced._share_file
+    _cached_listing = TeraBoxDownloaderAdvanced._cached_listing
+    _last_list_page = TeraBoxDownloaderAdvanced._last_list_page
+    _take_entries = TeraBoxDownloaderAdvanced._take_entries
+    _extract_share_code = TeraBoxDownloaderAdvanced._extract_share_code
+    _clean_filename = TeraBoxDownloaderAdvanced._clean_filename
+    _find_url_in_content = TeraBoxDownloaderAdvanced._find_url_in_content
+    _download_headers = TeraBoxDownloaderAdvanced._download_headers
+    _open_checkpoint = TeraBoxDownloaderAdvanced._open_checkpoint
+    _segment_count = TeraBoxDownloaderAdvanced._segment_count
+    _start_transfer = TeraBoxDownloaderAdvanced._start_transfer
+    _report_progress = TeraBoxDownloaderAdvanced._report_progress
+    _write = TeraBoxDownloaderAdvanced._write
+    _store_finished = TeraBoxDownloaderAdvanced._store_finished
+    available_bytes = TeraBoxDownloaderAdvanced.available_bytes
+
+    def __init__(self, segments=4, min_segment_size=8 * 1024 * 1024, retries=3, max_link_refreshes=3,
+                 connector=None, resolve_slots=None, transfer_slots=None, resolution_cache=None,
+                 hedged=False, extraction_deadline=30, request_delay=2.0, method_stats=None,
+                 stream_pages=True, progress_callback=None, progress_interval=0.5, space_check=None,
+                 read_size=256 * 1024, metrics=None, content_store=None):
+        # Same meaning as for TeraBoxDownloaderAdvanced
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.retries = retries
+        self.max_link_refreshes = max_link_refreshes
+        self.resolution_cache = resolution_cache
+        self.hedged = hedged
+        self.extraction_deadline = extraction_deadline
+        self.request_delay = request_delay
+        self._next_request_at = 0.0
+        self._deadline = None
+        self.method_stats = method_stats
+        self._stats_domain = ''
+        self.stream_pages = stream_pages
+        self.cancel_event = None
+        self.share_path = None
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self._meter = None
+        self._next_print = 0.0
+        self.space_check = space_check
+        self.metrics = metrics or DISABLED
+        self.content_store = content_store
+
+        # Optional shared semaphores bounding resolutions and body transfers in flight
+        self.resolve_slots = resolve_slots
+        self.transfer_slots = transfer_slots
+        # Body bytes per read when download_file is not given a chunk_size
+        self.read_size = read_size
+
+        # Live view of the transfer for readers following the partial file
+        self.transfer_filepath = None
+        self.transfer_total = 0
+        self.transfer_state = None
+        self._checkpoint = None
+        self._streamed_bytes = 0
+        self._hasher = None
+        # Worker-thread futures of checkpoint flushes and hash catch-ups, by kind
+        self._background = {}
+
+        # Own cookies and headers on the (possibly shared) connector; aiohttp
+        # picks Accept-Encoding from the decoders it has
+        headers = browser_headers()
+        headers.pop('Accept-Encoding')
+        self.session = aiohttp.ClientSession(
+            connector=connector or aiohttp.TCPConnector(ssl=False),
+            connector_owner=connector is None,
+            headers=headers,
+            trace_configs=[self._trace_config()] if self.metrics.enabled else None
+        )
+
+    def _trace_config(self):
+        """Counts every response by status, and times to response headers of requests tagged with a ttfb name"""
+        async def on_request_start(session, context, params):
+            context.start = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            self.metrics.http_response(params.url.host, params.response.status)
+            if context.trace_request_ctx:
+                self.metrics.observe('ttfb', context.trace_request_ctx, time.perf_counter() - context.start)
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    async def close(self):
+        await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def extract_file_info(self, terabox_url):
+        """Extract file information using multiple methods"""
+        try:
+            print(f"🔍 Processing URL: {terabox_url}")
+
+            share_code = self._extract_share_code(terabox_url)
+            if self.resolution_cache and share_code:
+                # The cache may read its backend from disk
+                cached = await self._off_loop(self.resolution_cache.get, share_code)
+                if cached:
+                    print(f"⚡ Using cached resolution for {share_code}")
+                    cached['success'] = True
+                    return cached
+
+            if self.method_stats:
+                self._stats_domain = self.method_stats.domain_of(terabox_url)
+
+            async with self._slot(self.resolve_slots):
+                if self.hedged:
+                    result = await self._extract_hedged(terabox_url, share_code)
+                else:
+                    result = await self._extract_sequential(terabox_url)
+
+            if result['success']:
+                if self.resolution_cache and share_code:
+                    await self._off_loop(self.resolution_cache.put, share_code, result)
+                return result
+
+            return {
+                'success': False,
+                'error': 'All extraction methods failed. The link might be invalid, password protected, or require premium account.'
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Extraction failed: {str(e)}'
+            }
+
+    def _slot(self, semaphore):
+        """The semaphore itself, or a no-op when the downloader runs unbounded"""
+        return semaphore if semaphore is not None else _NoSlot()
+
+    async def _extract_sequential(self, terabox_url):
+        """Try each method in turn, stopping at the first success"""
+        self._deadline = None
+        methods = self._ordered([
+            ('direct', self._method_direct_analysis),
+            ('api', self._method_api_discovery),
+            ('mobile', self._method_mobile_approach),
+        ])
+        for name, method in methods:
+            result = await self._attempt(name, method, terabox_url)
+            if result['success']:
+                return result
+        return {'success': False}
+
+    async def _extract_hedged(self, terabox_url, share_code):
+        """Race every method and API endpoint under one deadline; the first valid result wins"""
+        self._deadline = time.monotonic() + self.extraction_deadline
+
+        tasks = [('direct', self._method_direct_analysis)]
+        if share_code:
+            tasks += [
+                (self._endpoint_name(api_url), self._api_probe(api_url))
+                for api_url in self._api_endpoints(share_code)
+            ]
+        tasks.append(('mobile', self._method_mobile_approach))
+
+        # Historically fastest paths get the earliest politeness slots
+        pending = {
+            asyncio.ensure_future(self._attempt(name, task, terabox_url))
+            for name, task in self._ordered(tasks)
+        }
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(0, self._deadline - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    print(f"⏱️ Extraction deadline of {self.extraction_deadline}s reached")
+                    break
+                for task in done:
+                    result = task.result()
+                    if result['success']:
+                        return result
+        finally:
+            # Losers are cancelled outright, mid-request or still waiting for their slot
+            for task in pending:
+                task.cancel()
+
+        return {'success': False}
+
+    async def _attempt(self, name, method, url):
+        """Run one extraction method or endpoint probe and record how it did"""
+        start = time.monotonic()
+        with self.metrics.span(self._stage_of(name), name) as span:
+            result = await method(url)
+            span.outcome = 'skipped' if result.get('skipped') else 'success' if result['success'] else 'failure'
+        if self.method_stats and not result.get('skipped'):
+            self.method_stats.record(self._stats_domain, name, result['success'], time.monotonic() - start)
+        return result
+
+    async def _polite_delay(self):
+        """Wait for this request's slot, keeping requests request_delay seconds apart.
+
+        Returns False if the slot falls after the extraction deadline.
+        """
+        # No await between reading and advancing the slot, so this is atomic on the loop
+        now = time.monotonic()
+        start = max(now, self._next_request_at)
+        self._next_request_at = start + self.request_delay
+
+        if start > now:
+            if self._deadline and start >= self._deadline:
+                return False
+            await asyncio.sleep(start - now)
+        return True
+
+    def _request_timeout(self, default=30):
+        """Per-request timeout, clipped to the extraction deadline in hedged mode"""
+        if self._deadline is None:
+            return aiohttp.ClientTimeout(total=default)
+        return aiohttp.ClientTimeout(total=max(1, min(default, self._deadline - time.monotonic())))
+
+    async def _method_direct_analysis(self, url):
+        """Method 1: Direct page analysis"""
+        try:
+            print("🔄 Trying Method 1: Direct page analysis...")
+            if not await self._polite_delay():
+                return {'success': False, 'skipped': True}
+
+            return await self._scan_page(
+                'direct',
+                scanner.DIRECT_PATTERNS,
+                url,
+                wanted=('yunData', 'window.data', 'dlink', 'downloadUrl')
+            )
+
+        except Exception as e:
+            print(f"❌ Method 1 failed: {e}")
+            return {'success': False}
+
+    async def _method_api_discovery(self, url):
+        """Method 2: API endpoint discovery"""
+        try:
+            print("🔄 Trying Method 2: API discovery...")
+
+            share_code = self._extract_share_code(url)
+            if not share_code:
+                return {'success': False}
+
+            endpoints = self._ordered([
+                (self._endpoint_name(api_url), api_url) for api_url in self._api_endpoints(share_code)
+            ])
+            for name, api_url in endpoints:
+                result = await self._attempt(name, self._api_probe(api_url), url)
+                if result['success']:
+                    return result
+
+            return {'success': False}
+
+        except Exception as e:
+            print(f"❌ Method 2 failed: {e}")
+            return {'success': False}
+
+    def _api_probe(self, api_url):
+        """_probe_api_endpoint bound to api_url, in the (url) shape of a method"""
+        return lambda url: self._probe_api_endpoint(api_url, url)
+
+    async def _probe_api_endpoint(self, api_url, url):
+        """Query one share-info API endpoint for a download URL"""
+        try:
+            if not await self._polite_delay():
+                return {'success': False, 'skipped': True}
+
+            async with self.session.get(api_url, headers=API_HEADERS, timeout=self._request_timeout()) as response:
+                if response.status == 200:
+                    data = await response.json(content_type=None)
+                    download_url = find_url_in_json(data)
+                    if download_url:
+                        filename = data.get('server_filename', f'file_{int(time.time())}.mp4')
+                        return {
+                            'success': True,
+                            'filename': filename,
+                            'final_url': url,
+                            'download_url': download_url,
+                            'md5': find_md5_in_json(data)
+                        }
+        except Exception:
+            pass
+        return {'success': False}
+
+    async def _method_mobile_approach(self, url):
+        """Method 3: Mobile user agent approach"""
+        try:
+            print("🔄 Trying Method 3: Mobile approach...")
+            if not await self._polite_delay():
+                return {'success': False, 'skipped': True}
+
+            return await self._scan_page('mobile', scanner.MOBILE_PATTERNS, url, headers=MOBILE_HEADERS)
+
+        except Exception as e:
+            print(f"❌ Method 3 failed: {e}")
+            return {'success': False}
+
+    async def _scan_page(self, prefix, pattern_names, url, headers=None, wanted=None):
+        """Fetch a page and search it with the precompiled patterns, most productive first"""
+        names = [name for name, _ in self._ordered([(name, None) for name in pattern_names])]
+        async with self.session.get(url, headers=headers, timeout=self._request_timeout()) as response:
+            final_url = str(response.url)
+            scan_start = time.monotonic()
+            if self.stream_pages:
+                name, download_url, tried, filename, md5 = await self._stream_scan(response, names, wanted)
+            else:
+                text = await response.text(errors='replace')
+                name, download_url, tried = scanner.find_link(text, names)
+                filename = scanner.find_filename(text) if download_url else None
+                md5 = scanner.find_md5(text) if download_url else None
+        self._record_patterns(prefix, tried, name, time.monotonic() - scan_start)
+
+        if not download_url:
+            return {'success': False}
+
+        return {
+            'success': True,
+            'filename': self._clean_filename(filename),
+            'final_url': final_url,
+            'download_url': download_url,
+            'md5': md5
+        }
+
+    async def _stream_scan(self, response, names, wanted=None):
+        """Feed a streamed response to a StreamScan, stopping the transfer once it has enough"""
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+
+        scan = StreamScan(names, wanted)
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            if scan.feed(decoder.decode(chunk)):
+                # Leaving the body unread; the connection is closed instead of reused
+                response.close()
+                break
+        else:
+            scan.feed(decoder.decode(b'', final=True), final=True)
+
+        name, download_url, tried = scan.result()
+        return name, download_url, tried, scan.filename(), scan.md5
+
+    async def get_download_url(self, page_url, html_content=None):
+        """Get download URL - simplified interface"""
+        if html_content:
+            download_url = self._find_url_in_content(html_content)
+            if download_url:
+                return download_url
+
+        result = await self.extract_file_info(page_url)
+        if result['success']:
+            return result.get('download_url')
+
+        return None
+
+    async def list_files(self, terabox_url, max_files=MAX_SHARE_FILES):
+        """Every file in a share, walking its folders through the share-list API"""
+        share_code = self._extract_share_code(terabox_url)
+        if not share_code:
+            return {'success': False, 'error': 'No share code in the URL'}
+
+        cached = await self._off_loop(self._cached_listing, share_code)
+        if cached:
+            return cached
+
+        print(f"📂 Listing share: {terabox_url}")
+        self._deadline = None
+        try:
+            files = []
+            folders = [(None, '')]
+            listed = set()
+            pages_left = MAX_SHARE_LIST_PAGES
+            async with self._slot(self.resolve_slots):
+                while folders and len(files) < max_files and pages_left > 0:
+                    directory, prefix = folders.pop(0)
+                    entries, pages = await self._list_directory(share_code, directory, max_files - len(files), pages_left)
+                    pages_left -= pages
+                    self._take_entries(entries, prefix, terabox_url, files, folders, listed)
+        except Exception as e:
+            return {'success': False, 'error': f'Listing failed: {str(e) or type(e).__name__}'}
+
+        if not files:
+            return {'success': False, 'error': 'The share lists no files'}
+        if self.resolution_cache:
+            await self._off_loop(self.resolution_cache.put_listing, share_code, files[:max_files])
+        return {'success': True, 'files': files[:max_files]}
+
+    async def _list_directory(self, share_code, directory, max_files=MAX_SHARE_FILES, max_pages=MAX_SHARE_LIST_PAGES):
+        """Entries of one share folder and the pages requested, with the same stops as the sync engine"""
+        entries = []
+        previous = None
+        for page in range(1, max_pages + 1):
+            await self._polite_delay()
+            with self.metrics.span('listing', 'share/list'):
+                async with self.session.get(
+                    self._share_list_url(share_code, directory, page),
+                    headers=API_HEADERS,
+                    timeout=self._request_timeout()
+                ) as response:
+                    response.raise_for_status()
+                    batch = find_entries_in_json(await response.json(content_type=None))
+            if self._last_list_page(entries, batch, previous, max_files):
+                return entries, page
+            previous = batch
+        return entries, max_pages
+
+    async def download_file(self, download_url, filename, download_folder, chunk_size=None, share_url=None,
+                            cancel_event=None, expected_md5=None, share_path=None):
+        """Download the file with proper headers, re-resolving the link from share_url if it expires.
+
+        Same behaviour and result as TeraBoxDownloaderAdvanced.download_file.
+        cancel_event is a threading.Event, so other threads can cancel it.
+        """
+        with self.metrics.span('transfer') as span:
+            result = await self._download_file(download_url, filename, download_folder, chunk_size, share_url,
+                                               cancel_event, expected_md5, share_path)
+            span.outcome = self._transfer_outcome(result)
+        if result['success']:
+            self.metrics.transferred('transfer', result['file_size'], span.duration)
+        return result
+
+    async def _download_file(self, download_url, filename, download_folder, chunk_size, share_url,
+                             cancel_event, expected_md5, share_path):
+        checkpoint = None
+        self.cancel_event = cancel_event
+        self.share_path = share_path
+        if self.progress_callback:
+            self._meter = ProgressMeter(self.progress_callback, interval=self.progress_interval)
+        try:
+            print(f"⬇️ Starting download: {filename}")
+            print(f"🔗 From: {download_url}")
+
+            try:
+                probe = await self._probe_download(download_url)
+            except LinkExpiredError:
+                if not share_url:
+                    raise
+                print("🔑 Download link already expired, resolving a fresh one...")
+                download_url = await self._fresh_download_url(share_url)
+                probe = await self._probe_download(download_url)
+
+            filepath = partial_path(download_folder, share_url, share_path, download_url, probe and probe['total_size'])
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+            if probe and probe['total_size']:
+                await self._check_space(filepath, probe['total_size'])
+
+            algorithms = ('sha256', 'md5') if expected_md5 else ('sha256',)
+            if probe and probe['accepts_ranges'] and probe['total_size']:
+                checkpoint = await self._off_loop(self._open_checkpoint, download_url, filepath, probe)
+                self._checkpoint = checkpoint
+                self._hasher = ContentHasher(filepath, algorithms)
+                self._start_transfer(filepath, probe['total_size'])
+                downloaded = await self._download_ranged(download_url, checkpoint, chunk_size, share_url)
+            else:
+                self._hasher = ContentHasher(filepath, algorithms)
+                result = await self._download_single(download_url, filepath, chunk_size)
+                if not result['success']:
+                    self.transfer_state = 'failed'
+                    self._hasher.close()
+                    return result
+                downloaded = result['downloaded']
+
+            print(f"\n✅ Download completed: {downloaded} bytes")
+            await self._settle()
+            digests = await self._off_loop(self._hasher.finish, downloaded)
+
+            if checkpoint:
+                await self._off_loop(checkpoint.remove)
+
+            if expected_md5 and digests['md5'] != expected_md5.lower():
+                self.transfer_state = 'failed'
+                await self._off_loop(os.remove, filepath)
+                return {
+                    'success': False,
+                    'error': f'MD5 mismatch: expected {expected_md5}, got {digests["md5"]}'
+                }
+
+            self._report_progress(downloaded, downloaded, force=True)
+            self.transfer_total = downloaded
+            self.transfer_state = 'completed'
+
+            if downloaded == 0:
+                self.transfer_state = 'failed'
+                if os.path.exists(filepath):
+                    await self._off_loop(os.remove, filepath)
+                return {
+                    'success': False,
+                    'error': 'Downloaded file is 0 bytes'
+                }
+
+            return {
+                'success': True,
+                'filepath': await self._off_loop(self._store_finished, filepath, filename, download_folder,
+                                                 digests['sha256']),
+                'file_size': downloaded,
+                'sha256': digests['sha256']
+            }
+
+        except Exception as e:
+            print(f"❌ Download error: {e or type(e).__name__}")
+            self.transfer_state = 'failed'
+            await self._settle()
+            if self._hasher:
+                self._hasher.close()
+            if checkpoint:
+                # Keep the partial file so the next attempt resumes instead of restarting
+                await self._off_loop(checkpoint.flush)
+                print(f"💾 Kept partial file: {checkpoint.completed_bytes()} of {checkpoint.total_size} bytes")
+            elif ('filepath' in locals() and os.path.exists(filepath) and
+                  not os.path.exists(filepath + DownloadCheckpoint.SUFFIX)):
+                await self._off_loop(os.remove, filepath)
+            return {
+                'success': False,
+                'error': str(e) or type(e).__name__
+            }
+
+    async def _off_loop(self, function, *args):
+        """Run function on a worker thread, keeping disk waits off the shared loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    def _in_background(self, kind, function, *args):
+        """Start function on a worker thread unless the last one of this kind is still running"""
+        pending = self._background.get(kind)
+        if pending is None or pending.done():
+            self._background[kind] = asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def _settle(self):
+        """Wait for background flushes and catch-ups; a later flush or finish supersedes their errors"""
+        pending = list(self._background.values())
+        self._background.clear()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _check_space(self, filepath, total_size):
+        """Run space_check off the loop; it may walk the download folder"""
+        if self.space_check:
+            await asyncio.get_running_loop().run_in_executor(None, self.space_check, filepath, total_size)
+
+    def _check_cancelled(self):
+        """Abort the transfer if the caller's cancel event is set"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise DownloadCancelled('Download cancelled')
+
+    def _transfer_timeout(self):
+        # No total limit on bodies; a stalled read fails like the threaded engine's 60s timeout
+        return aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=60)
+
+    def _chunks(self, response, chunk_size):
+        """Body chunks of response: whatever has arrived, or exactly chunk_size bytes"""
+        if chunk_size:
+            return response.content.iter_chunked(chunk_size)
+        return response.content.iter_chunked(self.read_size)
+
+    async def _probe_download(self, download_url):
+        """Probe Content-Length, Accept-Ranges and validators of the download URL"""
+        try:
+            async with self.session.get(
+                download_url,
+                timeout=self._transfer_timeout(),
+                headers=self._download_headers('bytes=0-0')
+            ) as response:
+                if response.status == 206:
+                    # Drain the single byte so the keep-alive connection goes back to the pool
+                    await response.read()
+
+                if response.status in (403, 410):
+                    raise LinkExpiredError(f'HTTP {response.status}: {response.reason}')
+
+                probe = {
+                    'etag': response.headers.get('etag'),
+                    'last_modified': response.headers.get('last-modified'),
+                }
+
+                if response.status == 206:
+                    total = response.headers.get('content-range', '').rsplit('/', 1)[-1]
+                    if total.isdigit():
+                        probe.update(total_size=int(total), accepts_ranges=True)
+                        return probe
+                    return None
+
+                if response.status == 200:
+                    probe.update(
+                        total_size=int(response.headers.get('content-length', 0)),
+                        accepts_ranges=response.headers.get('accept-ranges', '').lower() == 'bytes'
+                    )
+                    return probe
+        except LinkExpiredError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Range probe failed: {e}")
+        return None
+
+    async def _download_single(self, download_url, filepath, chunk_size):
+        """Single-stream download over one connection, for hosts without range support"""
+        async with self._slot(self.transfer_slots), self.session.get(
+            download_url,
+            timeout=self._transfer_timeout(),
+            headers=self._download_headers(),
+            trace_request_ctx='single'
+        ) as response:
+            if response.status not in (200, 206):
+                return {
+                    'success': False,
+                    'error': f'HTTP {response.status}: {response.reason}'
+                }
+
+            total_size = int(response.headers.get('content-length', 0))
+            downloaded = 0
+
+            if total_size:
+                await self._check_space(filepath, total_size)
+
+            with open(filepath, 'wb', buffering=0) as file:
+                self._start_transfer(filepath, total_size)
+                async for chunk in self._chunks(response, chunk_size):
+                    self._check_cancelled()
+                    self._write(file, chunk)
+                    self._hasher.update(downloaded, chunk)
+                    downloaded += len(chunk)
+                    self._streamed_bytes = downloaded
+                    self._report_progress(downloaded, total_size)
+
+        return {'success': True, 'downloaded': downloaded}
+
+    async def _download_ranged(self, download_url, checkpoint, chunk_size, share_url=None):
+        """Fetch the ranges still missing from the checkpoint, retrying from where each attempt stopped"""
+        attempt = 0
+        refreshes = 0
+
+        while True:
+            missing = checkpoint.missing_ranges()
+            if not missing:
+                break
+
+            try:
+                await self._download_segmented(download_url, checkpoint, missing, chunk_size)
+            except DownloadCancelled:
+                await self._settle()
+                await self._off_loop(checkpoint.flush)
+                raise
+            except LinkExpiredError as e:
+                await self._settle()
+                await self._off_loop(checkpoint.flush)
+                if not share_url or refreshes >= self.max_link_refreshes:
+                    raise
+                refreshes += 1
+                print(f"\n🔑 Download link expired ({e}), refreshing {refreshes}/{self.max_link_refreshes}...")
+                download_url = await self._refresh_download_url(share_url, checkpoint)
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                await self._settle()
+                await self._off_loop(checkpoint.flush)
+                print(f"\n🔁 Retry {attempt}/{self.retries} from byte checkpoint: {e or type(e).__name__}")
+                await asyncio.sleep(min(2 ** (attempt - 1), 10))
+
+        await self._settle()
+        await self._off_loop(checkpoint.flush)
+        if checkpoint.missing_ranges():
+            raise Exception('Download incomplete after retries')
+        return checkpoint.total_size
+
+    async def _fresh_download_url(self, share_url):
+        """Resolve a new signed download link for the original share URL"""
+        if self.share_path:
+            return await self._listed_download_url(share_url)
+
+        share_code = self._extract_share_code(share_url)
+        if self.resolution_cache and share_code:
+            # The cached link is the one that just expired
+            await self._off_loop(self.resolution_cache.invalidate, share_code)
+
+        result = await self.extract_file_info(share_url)
+        if not result['success'] or not result.get('download_url'):
+            raise Exception('Could not refresh the expired download link')
+        return result['download_url']
+
+    async def _listed_download_url(self, share_url):
+        """Fresh link for the file at share_path, from a new listing of its share"""
+        share_code = self._extract_share_code(share_url)
+        if self.resolution_cache and share_code:
+            # The cached listing holds the link that just expired
+            await self._off_loop(self.resolution_cache.invalidate_listing, share_code)
+
+        listing = await self.list_files(share_url)
+        for file_info in listing.get('files', []):
+            if file_info['path'] == self.share_path and file_info['download_url']:
+                return file_info['download_url']
+        raise Exception('Could not refresh the expired download link')
+
+    async def _refresh_download_url(self, share_url, checkpoint):
+        """Swap an expired link for a fresh one that still points at the same file"""
+        download_url = await self._fresh_download_url(share_url)
+
+        probe = await self._probe_download(download_url)
+        if not probe or probe['total_size'] != checkpoint.total_size:
+            raise Exception('Refreshed download link points to a different file (size changed)')
+
+        checkpoint.url = download_url
+        await self._off_loop(checkpoint.flush)
+        return download_url
+
+    async def _download_segmented(self, download_url, checkpoint, missing, chunk_size):
+        """Fetch the missing byte ranges concurrently, writing each at its offset in the file"""
+        remaining = sum(end - start for start, end in missing)
+        segment_count = self._segment_count(remaining)
+        piece_size = -(-remaining // segment_count)
+
+        segments = []
+        for start, end in missing:
+            while start < end:
+                segments.append((start, min(start + piece_size, end)))
+                start = segments[-1][1]
+
+        if len(segments) > 1:
+            print(f"🧩 Segmented download: {min(len(segments), self.segments)} connections")
+
+        # Single-threaded on the loop: no lock needed around the shared counter
+        progress = {'downloaded': checkpoint.total_size - remaining}
+        # At most self.segments connections per file, as with the threaded engine's pool
+        connections = asyncio.Semaphore(self.segments)
+
+        tasks = [
+            asyncio.ensure_future(
+                self._download_segment(download_url, checkpoint, start, end, chunk_size, progress, connections)
+            )
+            for start, end in segments
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                # Re-raise the first segment failure
+                await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _download_segment(self, download_url, checkpoint, start, end, chunk_size, progress, connections):
+        """Download bytes [start, end) into the checkpointed file at offset start"""
+        # Open-ended range for the tail, like a plain resume
+        byte_range = f'bytes={start}-' if end == checkpoint.total_size else f'bytes={start}-{end - 1}'
+        position = start
+
+        async with connections, self._slot(self.transfer_slots), self.session.get(
+            download_url,
+            timeout=self._transfer_timeout(),
+            headers=self._download_headers(byte_range),
+            trace_request_ctx='segment'
+        ) as response:
+            if response.status in (403, 410):
+                raise LinkExpiredError(f'HTTP {response.status}: {response.reason}')
+
+            if response.status != 206:
+                raise Exception(f'Segment {start}-{end - 1}: HTTP {response.status}: {response.reason}')
+
+            # Unbuffered: readers following the file trust add_range, so the bytes must be visible first
+            with open(checkpoint.filepath, 'r+b', buffering=0) as file:
+                file.seek(start)
+                async for chunk in self._chunks(response, chunk_size):
+                    self._check_cancelled()
+                    chunk = chunk[:end - position]
+                    self._write(file, chunk)
+                    if checkpoint.add_range(position, position + len(chunk), flush=False):
+                        self._in_background('flush', checkpoint.flush)
+                    # Bytes extending the hashed prefix are hashed here; segments
+                    # it has reached are read back on a worker thread
+                    self._hasher.update(position, chunk)
+                    available = checkpoint.contiguous_bytes()
+                    if self._hasher.position < available:
+                        self._in_background('hash', self._hasher.catch_up, available)
+                    position += len(chunk)
+
+                    progress['downloaded'] += len(chunk)
+                    self._report_progress(progress['downloaded'], checkpoint.total_size)
+
+                    if position >= end:
+                        break
+
+        if position != end:
+            raise Exception(f'Segment {start}-{end - 1}: received {position - start} of {end - start} bytes')
+
+
+class _NoSlot:
+    """Async context manager that holds nothing"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from job_store import MemoryJobStore
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'DOWNLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'job_store', MemoryJobStore())
+    return app_module.app.test_client()
+
+
+def test_shared_object_goes_with_its_last_reference(client, tmp_path):
+    obj = tmp_path / 'objects' / 'abc'
+    obj.parent.mkdir()
+    obj.write_text('x')
+    record = {'status': 'completed', 'filepath': str(obj), 'filename': 'a.bin'}
+    app_module.job_store.set('a', dict(record))
+    app_module.job_store.set('b', dict(record))
+    app_module.job_store.set('c', {'attached_to': 'a'})
+
+    assert client.post('/cleanup', json={'download_id': 'a'}).status_code == 200
+    assert obj.exists()
+    assert app_module.job_status('c')['status'] == 'completed'
+    client.post('/cleanup', json={'download_id': 'b'})
+    assert obj.exists()
+    client.post('/cleanup', json={'download_id': 'c'})
+    assert not obj.exists()
+
+
+def test_paths_outside_the_download_folder_are_rejected(client, tmp_path):
+    outside = tmp_path.parent / 'outside.bin'
+    outside.write_text('x')
+    app_module.job_store.set('a', {'status': 'completed', 'filepath': str(outside)})
+
+    assert client.post('/cleanup', json={'download_id': 'a'}).status_code == 400
+    assert outside.exists()
+    assert client.post('/cleanup', json={}).status_code == 400
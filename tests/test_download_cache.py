@@ -0,0 +1,45 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from download_cache import DownloadCache
+
+SIZE = 64 * 1024
+
+
+def test_concurrent_reservations_evict_once_each(tmp_path):
+    for index in range(8):
+        path = tmp_path / f'{index}.bin'
+        path.write_bytes(os.urandom(SIZE))
+        os.utime(path, (1000 + index, 1000))
+    cache = DownloadCache(str(tmp_path), quota_bytes=cache_usage(tmp_path), write_grace=0)
+    entries = cache._entries
+
+    def slow_entries():
+        # Widen the window between reading the folder and evicting from it
+        listed = entries()
+        time.sleep(0.05)
+        return listed
+    cache._entries = slow_entries
+
+    barrier = threading.Barrier(3)
+
+    def reserve(index):
+        barrier.wait()
+        cache.reserve(str(tmp_path / 'partial' / f'new{index}.bin'), SIZE)
+
+    threads = [threading.Thread(target=reserve, args=(index,)) for index in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Oldest first, and no more than the three reservations need
+    assert sorted(os.listdir(tmp_path)) == [f'{index}.bin' for index in range(3, 8)]
+
+
+def cache_usage(folder):
+    return DownloadCache(str(folder)).disk_usage()
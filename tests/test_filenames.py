@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from page_scanner import scanner, StreamScan
+from terabox_downloader_advanced import TeraBoxDownloaderAdvanced
+
+# Real file names that merely mention TeraBox
+NAMES = ['Backup - TeraBox export.zip', 'My-TeraBox-notes.pdf', 'Lecture | TeraBox tips.mkv']
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_share_list_names_are_kept(name):
+    downloader = TeraBoxDownloaderAdvanced()
+    file_info = downloader._share_file({'server_filename': name, 'path': '/' + name}, name, 'https://terabox.com/s/1x')
+    assert file_info['filename'] == name.replace('|', '_')
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_server_filename_hints_are_kept(name):
+    page = f'<html>"server_filename": "{name}"</html>'
+    assert scanner.find_filename(page) == name
+
+
+@pytest.mark.parametrize('name', NAMES + ['Day 11.mp4'])
+def test_title_hint_loses_only_the_site_suffix(name):
+    page = f'<title>{name} - Share Files Online &amp; Send Larges Files with TeraBox</title>'
+    assert scanner.find_filename(page) == name
+
+    scan = StreamScan(['dlink'])
+    scan.feed(page, final=True)
+    assert scan.filename() == name
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from page_scanner import StreamScan
+
+NAMES = ['yunData', 'dlink', 'downloadUrl', 'og:video']
+PAGE = '<title>x.mp4</title>"dlink": "http://a/1" <meta property="og:video" content="http://a/2">'
+
+
+def test_early_exit_reports_no_unconfirmed_misses():
+    scan = StreamScan(NAMES)
+    assert scan.feed(PAGE)
+    # yunData ranks above the winner but could still come later in the page
+    assert scan.result() == ('dlink', 'http://a/1', ['dlink', 'og:video'])
+
+
+def test_complete_page_reports_patterns_above_the_winner():
+    scan = StreamScan(NAMES)
+    scan.feed(PAGE, final=True)
+    assert scan.result() == ('dlink', 'http://a/1', ['yunData', 'dlink', 'og:video'])
+
+
+def test_complete_page_without_links_tries_everything():
+    scan = StreamScan(NAMES)
+    scan.feed('<title>x.mp4</title>', final=True)
+    assert scan.result() == (None, None, NAMES)
@@ -0,0 +1,167 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class TransferRegistry:
+    """Tracks in-flight and finished transfers so duplicate submissions share one"""
+
+    def __init__(self, max_completed=1024):
+        self.max_completed = max_completed
+
+        self._inflight = {}
+        self._keys_by_leader = {}
+        self._completed = OrderedDict()
+        # Folder leaders waiting on their child jobs, and each child's leader
+        self._groups = {}
+        self._group_of = {}
+        # Jobs attached to each leader, each follower's leader, and leaders
+        # whose own submitter cancelled while followers still want the file
+        self._followers = {}
+        self._following = {}
+        self._abandoned = set()
+        self._lock = threading.Lock()
+
+    def claim(self, key, download_id):
+        """Register download_id for key.
+
+        Returns ('completed', record) if the file is already on disk,
+        ('attached', leader_id) if another job is transferring it, or
+        ('leader', None) if download_id should do the transfer itself.
+        """
+        with self._lock:
+            record = self._completed_record(key)
+            if record:
+                return 'completed', record
+
+            leader_id = self._inflight.get(key)
+            if leader_id:
+                self._follow(download_id, leader_id)
+                return 'attached', leader_id
+
+            self._inflight[key] = download_id
+            self._keys_by_leader.setdefault(download_id, set()).add(key)
+            return 'leader', None
+
+    def merge(self, key, download_id):
+        """Add a key learned after resolution (e.g. dlink path and size) to a running leader.
+
+        Returns ('completed', record) if that file is already on disk, and
+        ('attached', leader_id) if another leader owns key, in which case
+        download_id's keys move to it; otherwise ('leader', None).
+        """
+        with self._lock:
+            record = self._completed_record(key)
+            if record:
+                return 'completed', record
+
+            leader_id = self._inflight.get(key)
+            if leader_id and leader_id != download_id:
+                for own_key in self._keys_by_leader.pop(download_id, set()):
+                    self._inflight[own_key] = leader_id
+                    self._keys_by_leader.setdefault(leader_id, set()).add(own_key)
+                for follower_id in self._followers.pop(download_id, set()):
+                    self._follow(follower_id, leader_id)
+                # A cancelled submitter stops counting once its followers have moved on
+                if download_id in self._abandoned:
+                    self._abandoned.discard(download_id)
+                else:
+                    self._follow(download_id, leader_id)
+                return 'attached', leader_id
+
+            self._inflight[key] = download_id
+            self._keys_by_leader.setdefault(download_id, set()).add(key)
+            return 'leader', None
+
+    def unsubscribe(self, download_id):
+        """Drop download_id's interest in the transfer it leads or follows.
+
+        Returns the leader's id when no one is left who wants the transfer,
+        so the caller can cancel it; None while others still do. A leader
+        with followers is only marked abandoned (see is_abandoned).
+        """
+        with self._lock:
+            leader_id = self._following.pop(download_id, None)
+            if leader_id is None:
+                if self._followers.get(download_id):
+                    self._abandoned.add(download_id)
+                    return None
+                return download_id
+
+            followers = self._followers.get(leader_id, set())
+            followers.discard(download_id)
+            if leader_id in self._abandoned and not followers:
+                self._abandoned.discard(leader_id)
+                return leader_id
+            return None
+
+    def is_abandoned(self, download_id):
+        """Whether a leader's own submitter cancelled while its followers keep the transfer going"""
+        with self._lock:
+            return download_id in self._abandoned
+
+    def _follow(self, follower_id, leader_id):
+        self._following[follower_id] = leader_id
+        self._followers.setdefault(leader_id, set()).add(follower_id)
+
+    def expand(self, download_id, child_ids):
+        """Keep a folder leader's keys in flight until all its child jobs have finished.
+
+        Call before the children are queued. If every child completes, the
+        leader's keys get a group record {'files': [child records]}.
+        """
+        with self._lock:
+            self._groups[download_id] = {'children': list(child_ids), 'pending': set(child_ids), 'records': {}}
+            for child_id in child_ids:
+                self._group_of[child_id] = download_id
+
+    def finish(self, download_id, record=None):
+        """Release a leader's keys; a successful record serves later submissions"""
+        with self._lock:
+            if download_id in self._groups:
+                # Released by its last child instead
+                return
+            self._release(download_id, record)
+
+            parent_id = self._group_of.pop(download_id, None)
+            group = self._groups.get(parent_id)
+            if group:
+                group['pending'].discard(download_id)
+                group['records'][download_id] = record
+                if not group['pending']:
+                    del self._groups[parent_id]
+                    records = [group['records'][child_id] for child_id in group['children']]
+                    self._release(parent_id, {'files': records} if all(records) else None)
+
+            while len(self._completed) > self.max_completed:
+                self._completed.popitem(last=False)
+
+    def _release(self, download_id, record):
+        for follower_id in self._followers.pop(download_id, set()):
+            self._following.pop(follower_id, None)
+        self._abandoned.discard(download_id)
+        for key in self._keys_by_leader.pop(download_id, set()):
+            if self._inflight.get(key) == download_id:
+                del self._inflight[key]
+            if record:
+                self._completed[key] = record
+                self._completed.move_to_end(key)
+
+    def _completed_record(self, key):
+        """Completed record for key if all its files are still on disk"""
+        record = self._completed.get(key)
+        if not record:
+            return None
+        if all(os.path.exists(entry['filepath']) for entry in record.get('files', [record])):
+            self._completed.move_to_end(key)
+            return record
+        del self._completed[key]
+        return None
+
+    def forget_file(self, filepath):
+        """Drop completed records pointing at a file that has been removed"""
+        filepath = os.path.abspath(filepath)
+        with self._lock:
+            for key, record in list(self._completed.items()):
+                if any(os.path.abspath(entry['filepath']) == filepath for entry in record.get('files', [record])):
+                    del self._completed[key]